@@ -4,6 +4,7 @@ const state = {
     currentView: 'clinical',
     selectedNodeId: null,
     trialCache: {},
+    nodeMatches: null, // Promise for the precomputed node → trial match table
     navigationHistory: [],
     historyIndex: -1,
     trialsData: [], // All trials from CSV
@@ -468,6 +469,43 @@ function showTrialDetailModal(trial) {
     viewAllLink.textContent = `View on ClinicalTrials.gov →`;
     
     modal.classList.remove('hidden');
+    
+    appendStudyDetails(trial.nct_id, details);
+}
+
+/**
+ * Append registry details (status, phase, enrollment, sponsor) from the full
+ * trial record served by /api/trial. Skipped silently when the server or
+ * blob store isn't available (e.g. static hosting).
+ */
+async function appendStudyDetails(nctId, details) {
+    let record;
+    try {
+        const response = await fetch(`/api/trial/${encodeURIComponent(nctId)}`);
+        if (!response.ok) return;
+        record = await response.json();
+    } catch (error) {
+        return;
+    }
+    
+    const proto = record.protocolSection || {};
+    const status = proto.statusModule?.overallStatus;
+    const phases = (proto.designModule?.phases || []).join(', ');
+    const enrollment = proto.designModule?.enrollmentInfo?.count;
+    const sponsor = proto.sponsorCollaboratorsModule?.leadSponsor?.name;
+    
+    const studySection = document.createElement('div');
+    studySection.className = 'bg-gray-50 border border-gray-200 p-3 rounded';
+    studySection.innerHTML = `
+        <h3 class="text-sm font-semibold text-gray-900 mb-2">Study Details</h3>
+        <div class="space-y-1 text-xs text-gray-900">
+            ${status ? `<div><span class="font-medium">Status:</span> ${status}</div>` : ''}
+            ${phases ? `<div><span class="font-medium">Phase:</span> ${phases}</div>` : ''}
+            ${enrollment ? `<div><span class="font-medium">Enrollment:</span> ${enrollment}</div>` : ''}
+            ${sponsor ? `<div><span class="font-medium">Sponsor:</span> ${sponsor}</div>` : ''}
+        </div>
+    `;
+    details.appendChild(studySection);
 }
 
 /**
@@ -804,13 +842,51 @@ function selectNode(node) {
     }
 }
 
+/**
+ * Load the precomputed node → trial match table (built by node_trial_matches.py)
+ * Fetched once and shared by every tree; resolves to null if the file is missing
+ */
+function loadNodeMatches() {
+    if (!state.nodeMatches) {
+        state.nodeMatches = fetch('./data/decision_trees/new/nsclc/node_trial_matches.json')
+            .then(response => response.ok ? response.json() : null)
+            .catch(error => {
+                console.warn('Node match table not available, falling back to live API:', error);
+                return null;
+            });
+    }
+    return state.nodeMatches;
+}
+
+/**
+ * Phase breakdown for a node from the precomputed match table
+ * Counted like fetchTrialPhaseBreakdown: total is p1 + p2 + p3
+ */
+function matchTableBreakdown(match) {
+    const phases = match.phases || {};
+    const p1 = phases.PHASE1 || 0;
+    const p2 = phases.PHASE2 || 0;
+    const p3 = phases.PHASE3 || 0;
+    return { p1, p2, p3, total: p1 + p2 + p3 };
+}
+
 /**
  * Fetch trial counts for all nodes (Research View)
- * Only queries nodes marked as queryable to reduce API calls
+ * Paints from the precomputed match table when available; otherwise only
+ * queries nodes marked as queryable to reduce API calls
  * Uses phase breakdown to show P1|P2|P3 badges
  */
 async function fetchAllTrialCounts(node, results = []) {
-    const treeData = state.currentDisease ? TREES[state.currentDisease] : null;
+    const treeId = state.currentDisease;
+    const matchTable = await loadNodeMatches();
+    const treeMatches = matchTable?.trees?.[treeId]?.nodes;
+    
+    if (treeMatches) {
+        paintTrialCountsFromTable(node, treeMatches, results);
+        return results;
+    }
+    
+    const treeData = treeId ? TREES[treeId] : null;
     const diseaseContext = treeData?.disease || null;
     
     if (node.queryable && node.search_term) {
@@ -828,6 +904,24 @@ async function fetchAllTrialCounts(node, results = []) {
     return results;
 }
 
+/**
+ * Paint every queryable node synchronously from the match table
+ */
+function paintTrialCountsFromTable(node, treeMatches, results) {
+    const match = treeMatches[node.id];
+    if (node.queryable && match) {
+        const breakdown = matchTableBreakdown(match);
+        results.push({ nodeId: node.id, breakdown });
+        updateNodeHeatmap(node.id, breakdown);
+    }
+    
+    if (node.children) {
+        for (const child of node.children) {
+            paintTrialCountsFromTable(child, treeMatches, results);
+        }
+    }
+}
+
 /**
  * Sanitize search term for ClinicalTrials.gov API
  * The API has limits on query complexity - simplify long/complex terms
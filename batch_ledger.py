@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Batch Job Ledger
+
+On-disk record of an LLM batch extraction run (create_ct_table.py): the
+JSONL batch files, the uploaded file and batch job names, each job's last
+known state, and the request key → trial metadata map needed to read the
+results. Every change is written through atomically, so an interrupted run
+(Ctrl+C, laptop sleep, crash) can reattach to its in-flight jobs and only
+collect results instead of rebuilding and resubmitting every request.
+
+Ledger format (JSON):
+{
+  "version": 1,
+  "run_id": "20250101T120000",
+  "created": "...",
+  "last_updated": "...",
+  "output_csv": "trial_extractions.csv",
+  "requests": {"request-NCT00000000": {"nct_id": "...", "official_title": "..."}},
+  "batches": [
+    {"batch": 1, "jsonl_path": "batch_requests_1.jsonl",
+     "uploaded_file": "files/...", "job_name": "batches/...", "state": "JOB_STATE_RUNNING",
+     "submitted_at": 1700000000.0, "processed": false, "success_count": null}
+  ]
+}
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+LEDGER_VERSION = 1
+
+
+def ledger_path_for(output_csv: str) -> Path:
+    """Default ledger location: <output_csv stem>.ledger.json beside the CSV."""
+    return Path(output_csv).with_suffix(".ledger.json")
+
+
+class BatchLedger:
+    """A batch run's state, saved to disk on every update."""
+
+    def __init__(self, path: Path, data: Dict[str, Any]):
+        self.path = Path(path)
+        self.data = data
+
+    @classmethod
+    def create(cls, path: Path, batch_files: List[str], metadata_map: Dict[str, Dict[str, Any]],
+               output_csv: str) -> "BatchLedger":
+        """Start a new ledger for freshly built batch files (overwrites any old one)."""
+        now = datetime.now()
+        ledger = cls(path, {
+            "version": LEDGER_VERSION,
+            "run_id": now.strftime("%Y%m%dT%H%M%S"),
+            "created": now.isoformat(),
+            "output_csv": output_csv,
+            "requests": metadata_map,
+            "batches": [
+                {"batch": i, "jsonl_path": jsonl_path, "uploaded_file": None, "job_name": None,
+                 "state": None, "submitted_at": None, "processed": False, "success_count": None}
+                for i, jsonl_path in enumerate(batch_files, start=1)
+            ],
+        })
+        ledger.save()
+        return ledger
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["BatchLedger"]:
+        """Load a ledger, or None if it is missing, unreadable or another version."""
+        path = Path(path)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except json.JSONDecodeError:
+            return None
+        if data.get("version") != LEDGER_VERSION:
+            return None
+        return cls(path, data)
+
+    def save(self):
+        """Atomically write the ledger."""
+        self.data["last_updated"] = datetime.now().isoformat()
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def run_id(self) -> str:
+        """Identifies the run in the extraction store; stable across resumes."""
+        return self.data.get("run_id") or self.data["created"]
+
+    @property
+    def metadata_map(self) -> Dict[str, Dict[str, Any]]:
+        return self.data["requests"]
+
+    @property
+    def batches(self) -> List[Dict[str, Any]]:
+        return self.data["batches"]
+
+    def batch(self, batch_num: int) -> Dict[str, Any]:
+        return self.batches[batch_num - 1]
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """Batches whose results have not been collected yet."""
+        return [b for b in self.batches if not b["processed"]]
+
+    def record_upload(self, batch_num: int, uploaded_file_name: str):
+        self.batch(batch_num)["uploaded_file"] = uploaded_file_name
+        self.save()
+
+    def record_job(self, batch_num: int, job_name: str, submitted_at: float):
+        batch = self.batch(batch_num)
+        batch["job_name"] = job_name
+        batch["submitted_at"] = submitted_at
+        self.save()
+
+    def record_state(self, batch_num: int, state: str):
+        """Note a job's latest state (call save() once per polling pass)."""
+        self.batch(batch_num)["state"] = state
+
+    def record_processed(self, batch_num: int, success_count: int):
+        batch = self.batch(batch_num)
+        batch["processed"] = True
+        batch["success_count"] = success_count
+        self.save()
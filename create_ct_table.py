@@ -1,10 +1,18 @@
-import glob
 import json
 import os
-import csv
+import sys
 import time
+import urllib.request
 from google import genai
 
+from batch_ledger import BatchLedger, ledger_path_for
+from extraction_cache import ExtractionCache, cache_path_for, extraction_key, prompt_hash
+from extraction_store import ExtractionStore, store_path_for
+from trial_download import clear_changed_ids, last_changed_ids
+from trial_prune import PRUNE_MODES, PRUNE_PATHS, estimate_tokens, pruned_payload
+from trial_blobs import TrialBlobStore, open_blob_store
+from trial_store import TrialStore, list_trial_files, load_trial_file, open_store, trial_file_id
+
 # --- CONFIGURATION ---
 API_KEY = os.environ.get("GEMINI_API_KEY", "YOUR_API_KEY_HERE")
 MODEL_NAME = "gemini-2.5-flash"
@@ -13,63 +21,13 @@ MODEL_NAME = "gemini-2.5-flash"
 client = genai.Client(api_key=API_KEY)
 
 # --- STEP 1: PRUNING UTILITY (Cost Saver) ---
-def prune_trial_json(trial_data: dict) -> dict:
-    """
-    Strips ~70% of the JSON (admin data, safety tables, detailed flows) 
-    to reduce AI token costs and noise.
-    """
-    pruned = {}
-    
-    # 1. Identification (Context)
-    proto = trial_data.get('protocolSection', {})
-    ident = proto.get('identificationModule', {})
-    pruned['id_info'] = {
-        'nctId': ident.get('nctId'),
-        'briefTitle': ident.get('briefTitle'),
-        'officialTitle': ident.get('officialTitle')
-    }
-    
-    # 2. Arms (Drug Names)
-    arms = proto.get('armsInterventionsModule', {})
-    pruned['arms'] = arms.get('armGroups')
-    pruned['interventions'] = arms.get('interventions')
-    
-    # 3. Eligibility (Biomarkers lie here)
-    elig = proto.get('eligibilityModule', {})
-    pruned['eligibility'] = {
-        'criteria': elig.get('eligibilityCriteria'),
-        'gender': elig.get('sex'),
-        'minAge': elig.get('minimumAge')
-    }
-    
-    # 4. Results (Outcomes)
-    results = trial_data.get('resultsSection', {})
-    outcomes_mod = results.get('outcomeMeasuresModule', {})
-    all_outcomes = outcomes_mod.get('outcomeMeasures', [])
-    
-    relevant_outcomes = []
-    for out in all_outcomes:
-        t_upper = out.get('title', '').upper()
-        if (out.get('type') == 'PRIMARY' or 
-            'SURVIVAL' in t_upper or 
-            'PROGRESSION' in t_upper or 
-            'RESPONSE' in t_upper):
-            relevant_outcomes.append(out)
-            
-    pruned['outcomes'] = relevant_outcomes
-    
-    return pruned
+# prune_trial_json lives in trial_prune.py so the shared extraction engine can use it
+# without pulling in the Gemini client. --prune v2 selects the token-minimizing mode
+# (see `python trial_prune.py report` for the corpus-wide savings).
+DEFAULT_PRUNE_MODE = "v1"
 
 # --- STEP 2: BUILD JSONL FILE FOR BATCH ---
-# --- BATCH SIZE CONFIG ---
-BATCH_SIZE = 200  # Stay well under 3M token limit per batch
-
-def build_batch_jsonl_files(trial_files: list, output_prefix: str = "batch_requests") -> tuple:
-    """
-    Build multiple JSONL files for batch API, split into chunks.
-    Returns (list of jsonl file paths, dict mapping request keys to trial metadata).
-    """
-    prompt_template = """You are an expert oncologist and data curator. Extract key data from this NSCLC clinical trial.
+EXTRACTION_PROMPT = """You are an expert oncologist and data curator. Extract key data from this NSCLC clinical trial.
 
 TASKS:
 1. Experimental Drugs: Identify the specific drug being tested. Ignore standard chemo backbones. Return as a list.
@@ -90,57 +48,119 @@ Return ONLY valid JSON with these exact keys:
 }
 
 Input Data:"""
+
+# --- BATCH SIZE CONFIG ---
+# Estimated input tokens per batch (trial_prune.estimate_tokens); leaves headroom under
+# the 3M token limit per batch for estimate error
+BATCH_TOKEN_BUDGET = 2_500_000
+
+def pack_requests(token_counts: list, token_budget: int) -> list:
+    """
+    First-fit-decreasing bin packing of request indices under token_budget.
+    A request larger than the budget gets a batch of its own.
+    Returns a list of batches, each a sorted list of indices.
+    """
+    batches = []
+    batch_tokens = []
+    for idx in sorted(range(len(token_counts)), key=lambda i: -token_counts[i]):
+        tokens = token_counts[idx]
+        for b, used in enumerate(batch_tokens):
+            if used + tokens <= token_budget:
+                batches[b].append(idx)
+                batch_tokens[b] += tokens
+                break
+        else:
+            batches.append([idx])
+            batch_tokens.append(tokens)
+    return [sorted(batch) for batch in batches]
+
+def build_batch_jsonl_files(trial_files: list, output_prefix: str = "batch_requests", store: TrialStore = None,
+                            blobs: TrialBlobStore = None, token_budget: int = BATCH_TOKEN_BUDGET,
+                            cache: ExtractionCache = None, prune_mode: str = DEFAULT_PRUNE_MODE) -> tuple:
+    """
+    Build multiple JSONL files for batch API, bin-packed so each batch's estimated
+    input tokens stay under token_budget.
+    If a TrialStore is given, trial data is read from it instead of the raw JSON;
+    otherwise full records come from the TrialBlobStore if given.
+    Payloads are pruned with prune_mode (trial_prune.PRUNE_MODES).
+    Trials whose (prompt, payload, model) key is in the ExtractionCache are not sent.
+    Returns (list of jsonl file paths, dict mapping request keys to trial metadata,
+    list of cache entries for the trials that were skipped).
+    """
+    prompt_template = EXTRACTION_PROMPT
+    prompt_sha256 = prompt_hash(prompt_template)
     
     metadata_map = {}
+    cache_hits = []
     batch_files = []
+    request_lines = []
+    token_counts = []
     
-    # Split trial_files into chunks
-    chunks = [trial_files[i:i + BATCH_SIZE] for i in range(0, len(trial_files), BATCH_SIZE)]
+    for filename in trial_files:
+        nct_id = trial_file_id(filename)
+        
+        try:
+            trial_data = store.get(nct_id) if store is not None else None
+            if trial_data is None and blobs is not None:
+                trial_data = blobs.get(nct_id)
+            if trial_data is None:
+                # Stream only the paths the prune mode reads, skipping e.g. the adverse event tables
+                trial_data = load_trial_file(filename, PRUNE_PATHS[prune_mode])
+            
+            pruned_data, payload_text = pruned_payload(trial_data, prune_mode)
+            official_title = pruned_data['id_info'].get('officialTitle', 'UNKNOWN')
+            cache_key = extraction_key(prompt_template, payload_text, MODEL_NAME)
+            cached = cache.get(cache_key) if cache is not None else None
+            if cached is not None:
+                cache_hits.append(cached)
+                continue
+            prompt_text = prompt_template + "\n" + payload_text
+            
+            # Create JSONL request line
+            request_key = f"request-{nct_id}"
+            request_line = {
+                "key": request_key,
+                "request": {
+                    "contents": [{
+                        "parts": [{
+                            "text": prompt_text
+                        }],
+                        "role": "user"
+                    }]
+                }
+            }
+            request_lines.append(json.dumps(request_line))
+            token_counts.append(estimate_tokens(prompt_text))
+            
+            # Store metadata for later lookup
+            metadata_map[request_key] = {
+                'nct_id': nct_id,
+                'official_title': official_title,
+                'cache_key': cache_key,
+                'prompt_sha256': prompt_sha256
+            }
+            
+        except Exception as e:
+            print(f"Error loading {nct_id}: {e}")
     
-    for batch_idx, chunk in enumerate(chunks):
+    for batch_idx, batch in enumerate(pack_requests(token_counts, token_budget)):
         jsonl_path = f"{output_prefix}_{batch_idx + 1}.jsonl"
         batch_files.append(jsonl_path)
         
         with open(jsonl_path, 'w') as f:
-            for filename in chunk:
-                nct_id = filename.split('/')[-1].replace('.json', '')
-                
-                try:
-                    with open(filename, 'r') as trial_file:
-                        trial_data = json.load(trial_file)
-                    
-                    pruned_data = prune_trial_json(trial_data)
-                    official_title = pruned_data['id_info'].get('officialTitle', 'UNKNOWN')
-                    
-                    # Create JSONL request line
-                    request_key = f"request-{nct_id}"
-                    request_line = {
-                        "key": request_key,
-                        "request": {
-                            "contents": [{
-                                "parts": [{
-                                    "text": prompt_template + "\n" + json.dumps(pruned_data, indent=2)
-                                }],
-                                "role": "user"
-                            }]
-                        }
-                    }
-                    
-                    # Write to JSONL (one JSON object per line)
-                    f.write(json.dumps(request_line) + '\n')
-                    
-                    # Store metadata for later lookup
-                    metadata_map[request_key] = {
-                        'nct_id': nct_id,
-                        'official_title': official_title
-                    }
-                    
-                except Exception as e:
-                    print(f"Error loading {nct_id}: {e}")
+            for idx in batch:
+                # Write to JSONL (one JSON object per line)
+                f.write(request_lines[idx] + '\n')
         
-        print(f"  ✓ Batch {batch_idx + 1}: {len(chunk)} trials -> {jsonl_path}")
+        batch_tokens = sum(token_counts[idx] for idx in batch)
+        over = " (single request over budget)" if batch_tokens > token_budget else ""
+        print(f"  ✓ Batch {batch_idx + 1}: {len(batch)} trials, ~{batch_tokens:,} tokens "
+              f"({batch_tokens / token_budget:.0%} of budget){over} -> {jsonl_path}")
     
-    return batch_files, metadata_map
+    if cache is not None:
+        print(f"  ✓ {len(cache_hits)} trials answered from the extraction cache, {len(metadata_map)} to send")
+    
+    return batch_files, metadata_map, cache_hits
 
 # --- STEP 3: UPLOAD JSONL FILE ---
 def upload_batch_file(jsonl_path: str):
@@ -169,6 +189,26 @@ def create_batch_job(uploaded_file, display_name: str):
     return batch_job
 
 # --- STEP 5: POLL JOB STATUS ---
+TERMINAL_STATES = ('JOB_STATE_SUCCEEDED', 'JOB_STATE_FAILED', 'JOB_STATE_CANCELLED', 'JOB_STATE_EXPIRED')
+POLL_INTERVAL_SECONDS = 30
+
+def job_state_name(batch_job) -> str:
+    return batch_job.state.name if hasattr(batch_job.state, 'name') else str(batch_job.state)
+
+def job_progress(batch_job) -> str:
+    """' | Progress: done/total (...)' from batch_stats, or '' if not reported yet."""
+    if hasattr(batch_job, 'batch_stats') and batch_job.batch_stats:
+        stats = batch_job.batch_stats
+        total = getattr(stats, 'total_request_count', 0)
+        succeeded = getattr(stats, 'succeeded_request_count', 0)
+        failed = getattr(stats, 'failed_request_count', 0)
+        if total > 0:
+            return f" | Progress: {succeeded + failed}/{total} ({succeeded} ✓, {failed} ✗)"
+    return ""
+
+def format_elapsed(seconds: float) -> str:
+    return f"{int(seconds // 60)}m {int(seconds % 60)}s"
+
 def poll_batch_status(batch_job, max_wait_minutes: int = 1440):
     """Poll batch job status until completion."""
     start_time = time.time()
@@ -181,23 +221,12 @@ def poll_batch_status(batch_job, max_wait_minutes: int = 1440):
     
     while True:
         batch_job = client.batches.get(name=batch_job.name)
-        state_name = batch_job.state.name if hasattr(batch_job.state, 'name') else str(batch_job.state)
-        elapsed = time.time() - start_time
-        elapsed_str = f"{int(elapsed // 60)}m {int(elapsed % 60)}s"
-        
-        # Try to get batch stats if available
-        stats_str = ""
-        if hasattr(batch_job, 'batch_stats') and batch_job.batch_stats:
-            stats = batch_job.batch_stats
-            total = getattr(stats, 'total_request_count', 0)
-            succeeded = getattr(stats, 'succeeded_request_count', 0)
-            failed = getattr(stats, 'failed_request_count', 0)
-            if total > 0:
-                stats_str = f" | Progress: {succeeded + failed}/{total} ({succeeded} ✓, {failed} ✗)"
+        state_name = job_state_name(batch_job)
+        elapsed_str = format_elapsed(time.time() - start_time)
         
-        print(f"[{elapsed_str}] State: {state_name}{stats_str}")
+        print(f"[{elapsed_str}] State: {state_name}{job_progress(batch_job)}")
         
-        if state_name in ['JOB_STATE_SUCCEEDED', 'JOB_STATE_FAILED', 'JOB_STATE_CANCELLED', 'JOB_STATE_EXPIRED']:
+        if state_name in TERMINAL_STATES:
             print("-" * 60)
             return batch_job
         
@@ -205,125 +234,256 @@ def poll_batch_status(batch_job, max_wait_minutes: int = 1440):
             print(f"Batch processing timed out after {max_wait_minutes} minutes")
             return batch_job
         
-        time.sleep(30)  # Poll every 30 seconds
+        time.sleep(POLL_INTERVAL_SECONDS)
         poll_count += 1
 
+def run_batch_jobs(ledger: BatchLedger, extractions: ExtractionStore, max_active: int = 0,
+                   max_wait_minutes: int = 1440, cache: ExtractionCache = None) -> int:
+    """
+    Submit every unfinished batch in the ledger and track all jobs with a single poller.
+    Batches that already have a job (from an interrupted run) are reattached, not
+    resubmitted. At most max_active jobs run at once (0 = submit everything up front);
+    as a job reaches a terminal state its results go to process_batch_results and the
+    next queued file is submitted, so total time is about one batch's latency rather
+    than the sum. A job still running after max_wait_minutes (counted from its
+    submission, or from this run's start for reattached jobs) is left unprocessed in
+    the ledger for 'resume'. Parsed results are upserted into extractions under the
+    ledger's run ID and added to cache, if given. Returns the number of trials written.
+    """
+    batch_count = len(ledger.batches)
+    queue = [b["batch"] for b in ledger.unfinished() if not b["job_name"]]
+    active = [b["batch"] for b in ledger.unfinished() if b["job_name"]]
+    total_success = 0
+    start_time = time.time()
+    max_wait_seconds = max_wait_minutes * 60
+
+    for batch_num in active:
+        print(f"Reattaching to batch {batch_num}/{batch_count}: {ledger.batch(batch_num)['job_name']}")
+
+    def submit_next():
+        batch_num = queue.pop(0)
+        jsonl_path = ledger.batch(batch_num)["jsonl_path"]
+        print(f"\nSubmitting batch {batch_num}/{batch_count}: {jsonl_path}")
+        uploaded_file = upload_batch_file(jsonl_path)
+        ledger.record_upload(batch_num, uploaded_file.name)
+        batch_job = create_batch_job(uploaded_file, f"trial-extraction-batch-{batch_num}")
+        ledger.record_job(batch_num, batch_job.name, time.time())
+        active.append(batch_num)
+
+    def fill_slots():
+        while queue and (max_active <= 0 or len(active) < max_active):
+            submit_next()
+
+    fill_slots()
+    print(f"\nPolling {len(active)} batch job(s) every {POLL_INTERVAL_SECONDS} seconds "
+          f"(this may take up to 24 hours; Ctrl+C and run 'resume' to reattach later)...")
+    print("-" * 60)
+
+    while active:
+        elapsed_str = format_elapsed(time.time() - start_time)
+        for batch_num in list(active):
+            entry = ledger.batch(batch_num)
+            batch_job = client.batches.get(name=entry["job_name"])
+            state_name = job_state_name(batch_job)
+            ledger.record_state(batch_num, state_name)
+            print(f"[{elapsed_str}] Batch {batch_num}: {state_name}{job_progress(batch_job)}")
+
+            if state_name not in TERMINAL_STATES:
+                if time.time() - max(entry["submitted_at"], start_time) > max_wait_seconds:
+                    # Stop polling but keep the job in the ledger so 'resume' can collect it
+                    active.remove(batch_num)
+                    print(f"Batch {batch_num} still {state_name} after {max_wait_minutes} minutes; "
+                          f"run 'python create_ct_table.py resume' to collect its results later")
+                continue
+
+            active.remove(batch_num)
+            print(f"\nProcessing results for batch {batch_num}...")
+            success_count = process_batch_results(batch_job, ledger.metadata_map, extractions, ledger.run_id,
+                                                  cache, jsonl_path=entry["jsonl_path"])
+            ledger.record_processed(batch_num, success_count)
+            total_success += success_count
+            print(f"✓ Batch {batch_num} complete: {success_count} trials processed")
+            print("-" * 60)
+
+        ledger.save()
+        fill_slots()
+        if active:
+            time.sleep(POLL_INTERVAL_SECONDS)
+
+    return total_success
+
 # --- STEP 6: RETRIEVE AND PARSE RESULTS ---
-def process_batch_results(batch_job, metadata_map: dict, output_csv: str):
-    """Retrieve results from completed batch and write to CSV."""
-    state_name = batch_job.state.name if hasattr(batch_job.state, 'name') else str(batch_job.state)
+def extraction_row(nct_id: str, official_title: str, trial_data: dict) -> dict:
+    """Flatten one parsed extraction into an extraction store row."""
+    drugs = "; ".join(trial_data.get('experimental_drugs', [])) if trial_data.get('experimental_drugs') else ""
+    biomarkers = "; ".join(trial_data.get('biomarkers', [])) if trial_data.get('biomarkers') else ""
+    outcomes = trial_data.get('primary_outcomes_summary', '')
+    
+    return {
+        "nct_id": nct_id,
+        "official_title": official_title,
+        "experimental_drugs": drugs,
+        "biomarkers": biomarkers,
+        "primary_outcomes": outcomes,
+        "efficacy_status": trial_data.get('efficacy_status', 'UNKNOWN'),
+        "reasoning": trial_data.get('reasoning', '')
+    }
+
+def upsert_cached_rows(cache_hits: list, extractions: ExtractionStore, run_id: str) -> int:
+    """
+    Upsert rows for cache hits under run_id. Rows already in the store are
+    rewritten too, so every trial this run covered carries its run_id (see
+    clear_extracted_changes). Returns rows added.
+    """
+    added = 0
+    for entry in cache_hits:
+        if entry["nct_id"] not in extractions:
+            added += 1
+        extractions.upsert(extraction_row(entry["nct_id"], entry["official_title"], entry["extraction"]),
+                           run_id, entry["model"])
+    extractions.commit()
+    return added
+
+def clear_extracted_changes(data_dir: str, extractions: ExtractionStore, run_id: str) -> list:
+    """
+    Clear the pending create_ct_table changed IDs whose row run_id wrote
+    (batch results or reused cache hits); failures and later syncs stay pending.
+    Returns the IDs cleared.
+    """
+    rebuilt = [nct_id for nct_id in last_changed_ids(data_dir, "create_ct_table")
+               if (extractions.get(nct_id) or {}).get("run_id") == run_id]
+    clear_changed_ids(data_dir, "create_ct_table", rebuilt)
+    return rebuilt
+
+# Files API media download; streamed with urllib because the SDK's files.download
+# returns the whole result file as one bytes object
+DOWNLOAD_BASE_URL = "https://generativelanguage.googleapis.com/download/v1beta"
+DOWNLOAD_TIMEOUT_SECONDS = 300
+
+def iter_result_file(file_name: str):
+    """Stream a batch result file, yielding (request key, error, response dict) per JSONL line."""
+    request = urllib.request.Request(f"{DOWNLOAD_BASE_URL}/{file_name}:download?alt=media",
+                                     headers={"x-goog-api-key": API_KEY})
+    with urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT_SECONDS) as response:
+        for line in response:
+            if not line.strip():
+                continue
+            try:
+                result_obj = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"✗ JSON parse error: {e}")
+                continue
+            yield result_obj.get('key', ''), result_obj.get('error'), result_obj.get('response', {})
+
+def batch_request_keys(jsonl_path: str) -> list:
+    """Request keys of a batch JSONL file, in submission order."""
+    with open(jsonl_path, 'r') as f:
+        return [json.loads(line)['key'] for line in f if line.strip()]
+
+def iter_inline_results(inlined_responses, request_keys: list):
+    """
+    Yield (request key, error, response dict) for inlined batch responses.
+    Responses come back in request order, so keys are matched by position
+    unless a response carries its own key in its metadata.
+    """
+    for idx, inline_response in enumerate(inlined_responses):
+        metadata = getattr(inline_response, 'metadata', None) or {}
+        request_key = metadata.get('key') or (request_keys[idx] if idx < len(request_keys) else '')
+        response = inline_response.response
+        if hasattr(response, 'model_dump'):
+            response = response.model_dump(mode='json', exclude_none=True)
+        yield request_key, inline_response.error, response or {}
+
+def response_text(response: dict):
+    """Model text of a generateContent response dict, or (None, reason) if there is none."""
+    candidates = response.get('candidates', [])
+    if not candidates:
+        return None, "no candidates in response"
+    
+    candidate = candidates[0]
+    content = candidate.get('content', {})
+    parts = content.get('parts', [])
+    
+    if not parts:
+        return None, "no parts in response"
+    return parts[0].get('text', ''), None
+
+def process_batch_results(batch_job, metadata_map: dict, extractions: ExtractionStore, run_id: str,
+                          cache: ExtractionCache = None, jsonl_path: str = None):
+    """
+    Retrieve results from completed batch and upsert them into the extraction store
+    (one row per NCT ID, last write wins, tagged with run_id and MODEL_NAME).
+    Result files are streamed line by line from download to the store, so memory
+    stays bounded by the longest single response. Inlined responses are matched to
+    requests by position in jsonl_path (the batch's request file).
+    Parsed extractions are also stored in the ExtractionCache, if given.
+    """
+    state_name = job_state_name(batch_job)
     
     if state_name != 'JOB_STATE_SUCCEEDED':
         print(f"Batch job did not succeed. Final state: {state_name}")
         return 0
     
-    # Open CSV file in append mode (in case of earlier writes)
-    csvfile = open(output_csv, 'a', newline='', encoding='utf-8')
-    
-    fieldnames = [
-        "NCT_ID",
-        "Official Title",
-        "Experimental Drugs",
-        "Biomarkers",
-        "Primary Outcomes",
-        "Efficacy Status",
-        "Reasoning"
-    ]
-    
-    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    dest = batch_job.dest
+    if dest and dest.file_name:
+        # Results are in a file
+        print(f"Streaming results from: {dest.file_name}")
+        results = iter_result_file(dest.file_name)
+    elif dest and getattr(dest, 'inlined_responses', None):
+        # Results are inline (for smaller batches)
+        print("Retrieving inline results...")
+        results = iter_inline_results(dest.inlined_responses, batch_request_keys(jsonl_path) if jsonl_path else [])
+    else:
+        print("Batch job has no results")
+        return 0
     
     success_count = 0
     
     try:
-        # Results are in a file
-        if batch_job.dest and batch_job.dest.file_name:
-            print(f"Downloading results from: {batch_job.dest.file_name}")
+        for request_key, error, response in results:
+            # Get metadata for this request
+            request_meta = metadata_map.get(request_key, {})
+            nct_id = request_meta.get('nct_id', 'UNKNOWN')
+            official_title = request_meta.get('official_title', 'UNKNOWN')
             
-            # Download file content
-            file_content_bytes = client.files.download(file=batch_job.dest.file_name)
-            file_content = file_content_bytes.decode('utf-8')
+            # Check if this is an error response
+            if error:
+                print(f"✗ {nct_id} (API error: {error})")
+                continue
             
-            # Parse JSONL results (one JSON per line)
-            for line in file_content.splitlines():
-                if not line.strip():
+            try:
+                text, problem = response_text(response)
+                if problem:
+                    print(f"✗ {nct_id} ({problem})")
                     continue
                 
-                try:
-                    result_obj = json.loads(line)
-                    request_key = result_obj.get('key', '')
-                    
-                    # Get metadata for this request
-                    request_meta = metadata_map.get(request_key, {})
-                    nct_id = request_meta.get('nct_id', 'UNKNOWN')
-                    official_title = request_meta.get('official_title', 'UNKNOWN')
-                    
-                    # Check if this is an error response
-                    if 'error' in result_obj:
-                        print(f"✗ {nct_id} (API error: {result_obj['error']})")
-                        continue
-                    
-                    # Parse response - batch API returns response directly
-                    response = result_obj.get('response', {})
-                    
-                    # Extract text from response candidates
-                    candidates = response.get('candidates', [])
-                    if not candidates:
-                        print(f"✗ {nct_id} (no candidates in response)")
-                        continue
-                    
-                    candidate = candidates[0]
-                    content = candidate.get('content', {})
-                    parts = content.get('parts', [])
-                    
-                    if not parts:
-                        print(f"✗ {nct_id} (no parts in response)")
-                        continue
-                    
-                    response_text = parts[0].get('text', '')
-                    
-                    # Extract JSON if wrapped in markdown
-                    if "```json" in response_text:
-                        response_text = response_text.split("```json")[1].split("```")[0]
-                    elif "```" in response_text:
-                        response_text = response_text.split("```")[1].split("```")[0]
-                    
-                    trial_data = json.loads(response_text.strip())
-                    
-                    # Flatten and write to CSV
-                    drugs = "; ".join(trial_data.get('experimental_drugs', [])) if trial_data.get('experimental_drugs') else ""
-                    biomarkers = "; ".join(trial_data.get('biomarkers', [])) if trial_data.get('biomarkers') else ""
-                    outcomes = trial_data.get('primary_outcomes_summary', '')
-                    
-                    row = {
-                        "NCT_ID": nct_id,
-                        "Official Title": official_title,
-                        "Experimental Drugs": drugs,
-                        "Biomarkers": biomarkers,
-                        "Primary Outcomes": outcomes,
-                        "Efficacy Status": trial_data.get('efficacy_status', 'UNKNOWN'),
-                        "Reasoning": trial_data.get('reasoning', '')
-                    }
-                    
-                    writer.writerow(row)
-                    csvfile.flush()
-                    success_count += 1
-                    print(f"✓ {nct_id}")
-                    
-                except json.JSONDecodeError as e:
-                    print(f"✗ JSON parse error: {e}")
-                except Exception as e:
-                    print(f"✗ Error processing result: {e}")
-        
-        else:
-            # Results are inline (for smaller batches)
-            print("Retrieving inline results...")
-            if hasattr(batch_job, 'inlined_responses') and batch_job.inlined_responses:
-                for inline_response in batch_job.inlined_responses:
-                    # Similar parsing as above
-                    pass
+                # Extract JSON if wrapped in markdown
+                if "```json" in text:
+                    text = text.split("```json")[1].split("```")[0]
+                elif "```" in text:
+                    text = text.split("```")[1].split("```")[0]
+                
+                trial_data = json.loads(text.strip())
+                
+                # Flatten and upsert
+                row = extraction_row(nct_id, official_title, trial_data)
+                if cache is not None and 'cache_key' in request_meta:
+                    cache.put(request_meta['cache_key'], nct_id, official_title, MODEL_NAME,
+                              request_meta['prompt_sha256'], trial_data)
+                
+                extractions.upsert(row, run_id, MODEL_NAME)
+                success_count += 1
+                print(f"✓ {nct_id}")
+                
+            except json.JSONDecodeError as e:
+                print(f"✗ {nct_id} JSON parse error: {e}")
+            except Exception as e:
+                print(f"✗ {nct_id} Error processing result: {e}")
     
     finally:
-        csvfile.close()
+        extractions.commit()
+        if cache is not None:
+            cache.save()
     
     return success_count
 
@@ -335,69 +495,88 @@ if __name__ == "__main__":
 
     output_csv = "trial_extractions.csv"
     
-    # Check if CSV already exists, if not create header
-    csv_exists = os.path.exists(output_csv)
-    if not csv_exists:
-        with open(output_csv, 'w', newline='', encoding='utf-8') as f:
-            fieldnames = [
-                "NCT_ID",
-                "Official Title",
-                "Experimental Drugs",
-                "Biomarkers",
-                "Primary Outcomes",
-                "Efficacy Status",
-                "Reasoning"
-            ]
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
+    # Extractions live in SQLite (one row per trial); the CSV and trials_data.js are
+    # exported from it. A CSV from before the store existed is imported once.
+    extractions = ExtractionStore(store_path_for(output_csv))
+    if len(extractions) == 0 and os.path.exists(output_csv):
+        imported = extractions.import_csv(output_csv)
+        print(f"Imported {imported} rows from {output_csv} -> {len(extractions)} trials in {extractions.path}")
+
+    # 'resume' (or a plain run that finds an unfinished ledger) reattaches to the
+    # recorded jobs and only collects results; --fresh discards the old ledger
+    ledger_path = ledger_path_for(output_csv)
+    ledger = BatchLedger.load(ledger_path) if "--fresh" not in sys.argv else None
+    if ledger is not None and not ledger.unfinished():
+        ledger = None
+    if len(sys.argv) > 1 and sys.argv[1] == "resume" and ledger is None:
+        print(f"Nothing to resume: no unfinished batches in {ledger_path}")
+        exit(1)
+
+    # Parsed extractions keyed by (prompt, payload, model); --no-cache re-sends every trial
+    cache = ExtractionCache(cache_path_for(output_csv))
 
     try:
-        # Get all trial files
-        trial_files = sorted(glob.glob("data/ctg-studies/*.json"))
-        print(f"Found {len(trial_files)} trial files")
-        
-        # Build JSONL files (split into batches)
-        print("\nBuilding JSONL batch files...")
-        batch_files, metadata_map = build_batch_jsonl_files(trial_files, "batch_requests")
-        print(f"✓ Built {len(batch_files)} batch files with {len(metadata_map)} total requests")
-        
-        total_success = 0
-        
-        # Process each batch sequentially
-        for batch_idx, jsonl_path in enumerate(batch_files):
-            print(f"\n{'='*60}")
-            print(f"BATCH {batch_idx + 1}/{len(batch_files)}: {jsonl_path}")
-            print(f"{'='*60}")
-            
-            # Upload file
-            print("\nUploading batch file to API...")
-            uploaded_file = upload_batch_file(jsonl_path)
-            
-            # Create batch job
-            print("\nCreating batch job...")
-            batch_job = create_batch_job(uploaded_file, f"trial-extraction-batch-{batch_idx + 1}")
+        if ledger is not None:
+            print(f"Resuming from {ledger_path}: {len(ledger.unfinished())}/{len(ledger.batches)} "
+                  f"batches still to collect")
+        else:
+            # Get all trial files
+            trial_files = [str(path) for path in list_trial_files("data/ctg-studies")]
+            print(f"Found {len(trial_files)} trial files")
             
-            # Poll for completion
-            print("\nPolling batch job status (this may take up to 24 hours)...")
-            completed_job = poll_batch_status(batch_job)
+            # --changed only sends the trials rewritten by trial_download --sync since the last run
+            if "--changed" in sys.argv:
+                changed_ids = set(last_changed_ids("data/ctg-studies", "create_ct_table"))
+                trial_files = [f for f in trial_files if trial_file_id(f) in changed_ids]
+                print(f"Limiting to {len(trial_files)} trials changed since the last run")
             
-            # Process results
-            print("\nProcessing results...")
-            success_count = process_batch_results(completed_job, metadata_map, output_csv)
-            total_success += success_count
-            print(f"✓ Batch {batch_idx + 1} complete: {success_count} trials processed")
+            # Build JSONL files (split into batches)
+            print("\nBuilding JSONL batch files...")
+            store = open_store("data/ctg-studies")
+            if store is not None:
+                print(f"Using trial store: {store.path}")
+            blobs = open_blob_store("data/ctg-studies") if store is None else None
+            if blobs is not None:
+                print(f"Using trial blob store: {blobs.path}")
+            # --batch-tokens N sets the estimated input token ceiling per batch
+            token_budget = BATCH_TOKEN_BUDGET
+            if "--batch-tokens" in sys.argv:
+                token_budget = int(sys.argv[sys.argv.index("--batch-tokens") + 1])
+            prune_mode = sys.argv[sys.argv.index("--prune") + 1] if "--prune" in sys.argv else DEFAULT_PRUNE_MODE
+            if prune_mode not in PRUNE_MODES:
+                print(f"Unknown --prune mode {prune_mode!r} (choose from {', '.join(PRUNE_MODES)})")
+                exit(1)
+            lookup_cache = cache if "--no-cache" not in sys.argv else None
+            batch_files, metadata_map, cache_hits = build_batch_jsonl_files(
+                trial_files, "batch_requests", store=store, blobs=blobs, token_budget=token_budget, cache=lookup_cache,
+                prune_mode=prune_mode)
+            print(f"✓ Built {len(batch_files)} batch files with {len(metadata_map)} total requests")
+            ledger = BatchLedger.create(ledger_path, batch_files, metadata_map, output_csv)
+            if cache_hits:
+                added = upsert_cached_rows(cache_hits, extractions, ledger.run_id)
+                print(f"✓ {len(cache_hits)} cached extractions reused ({added} rows added to {extractions.path})")
+            print(f"✓ Job ledger: {ledger_path}")
+        
+        # Submit all batches and poll them together
+        # --max-active N caps how many batch jobs run at once (default: all)
+        max_active = int(sys.argv[sys.argv.index("--max-active") + 1]) if "--max-active" in sys.argv else 0
+        if ledger.unfinished():
+            run_batch_jobs(ledger, extractions, max_active=max_active, cache=cache)
+        # Count across runs, including batches collected before an interruption
+        total_success = sum(b["success_count"] or 0 for b in ledger.batches)
         
         print(f"\n{'='*60}")
-        print(f"✓ Successfully processed {total_success}/{len(metadata_map)} trials")
-        print(f"✓ CSV output written to {output_csv}")
+        print(f"✓ Successfully processed {total_success}/{len(ledger.metadata_map)} trials")
         
-        # Generate static JS file for browser
+        # Export the CSV and the static JS file for the browser from the store
+        print(f"✓ CSV output written to {output_csv} ({extractions.export_csv(output_csv)} trials)")
         print("\nGenerating trials_data.js for static serving...")
-        with open(output_csv, 'r', encoding='utf-8') as f:
-            trials = list(csv.DictReader(f))
-        with open('trials_data.js', 'w', encoding='utf-8') as f:
-            f.write(f'// Auto-generated from {output_csv}\nconst TRIALS_DATA = {json.dumps(trials, indent=2)};')
-        print(f"✓ Generated trials_data.js with {len(trials)} trials")
+        trial_count = extractions.export_js('trials_data.js', extractions.path.name)
+        print(f"✓ Generated trials_data.js with {trial_count} trials")
+        
+        # Changed trials this run extracted are done; failures and later syncs stay pending
+        if not ledger.unfinished():
+            clear_extracted_changes("data/ctg-studies", extractions, ledger.run_id)
     
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+DAG Fragment Stitching for Tiled Extraction
+
+Merges the DAG fragments extracted from the overlapping tiles of one
+guideline page (gemini_dag_extractor.py --tiles) back into a single DAG in
+the DAGOutput shape.
+
+Nodes in the overlap between two neighbouring tiles are extracted twice.
+They are matched by normalized text (exact, or a substring when a box was
+cut off at the tile edge, or a close fuzzy match for OCR differences), and
+by edges: a pair also scores for every parent or child whose text matches
+on both sides. Guideline pages repeat short labels ("Stable", "< 6 mm",
+"or") in every branch, so:
+
+- when the tile's nodes carry a box_2d (the tile prompt asks for one), two
+  nodes only match if their boxes, mapped back to page pixels, overlap;
+- otherwise short or repeated texts only merge when at least one edge
+  agrees, and position comes from the prompt's top-to-bottom, left-to-right
+  node numbering: between a tile and the one below it, only the upper tile's
+  last and the lower tile's first nodes (NEAR_EDGE_RANK) are candidates, and
+  the kept pairs must be in the same order in both tiles. Numbering says
+  nothing about x, so between side-by-side tiles every merge needs an
+  agreeing edge.
+
+A merged node never holds two nodes from the same tile.
+
+Merged nodes get the longest text seen and the union of edges, tree
+references and footnote labels. They are renumbered node_001... in tile
+order (row-major), which keeps the prompt's top-to-bottom, left-to-right
+numbering roughly intact.
+"""
+
+import re
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple
+
+
+BOX_OVERLAP = 0.5          # Intersection / smaller box area for two boxes to be the same node
+MIN_PARTIAL_CHARS = 12     # Shortest text that may match as a cut-off part of a longer one
+MIN_UNIQUE_CHARS = 16      # Shorter texts need an agreeing edge to merge
+FUZZY_MATCH_RATIO = 0.88   # SequenceMatcher ratio for near-identical texts
+NEAR_EDGE_RANK = 0.5       # Without boxes: share of a tile's nodes, in numbering order, near the tile below/above
+
+_NON_WORD = re.compile(r"[^a-z0-9±≥≤]+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase words and numbers only, single-spaced."""
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def text_match(a: str, b: str) -> float:
+    """Match score of two normalized texts: 1.0 equal, 0.9 cut-off part, else fuzzy ratio or 0."""
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    shorter, longer = (a, b) if len(a) <= len(b) else (b, a)
+    if len(shorter) >= MIN_PARTIAL_CHARS and shorter in longer:
+        return 0.9
+    ratio = SequenceMatcher(None, a, b).ratio()
+    return ratio if ratio >= FUZZY_MATCH_RATIO else 0.0
+
+
+def _adjacent(tile_a: Tuple[int, int], tile_b: Tuple[int, int]) -> bool:
+    """Tiles that share an overlap strip (including diagonal neighbours)."""
+    return abs(tile_a[0] - tile_b[0]) <= 1 and abs(tile_a[1] - tile_b[1]) <= 1
+
+
+def _page_box(box_2d: Any, tile_box: Tuple[int, int, int, int]) -> Optional[Tuple[float, float, float, float]]:
+    """A node's box_2d ([ymin, xmin, ymax, xmax], 0-1000 in the tile) as page (left, top, right, bottom)."""
+    if not isinstance(box_2d, (list, tuple)) or len(box_2d) != 4:
+        return None
+    left, top, right, bottom = tile_box
+    ymin, xmin, ymax, xmax = (float(v) / 1000 for v in box_2d)
+    width, height = right - left, bottom - top
+    return (left + xmin * width, top + ymin * height, left + xmax * width, top + ymax * height)
+
+
+def box_overlap(a: Tuple[float, float, float, float], b: Tuple[float, float, float, float]) -> float:
+    """Intersection area over the smaller box's area (1.0 when one box lies inside the other)."""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+    return width * height / smaller if smaller > 0 else 0.0
+
+
+class _Fragment:
+    """One tile's DAG, indexed for matching."""
+
+    def __init__(self, tile: Tuple[int, int], dag: Dict[str, Any],
+                 tile_box: Optional[Tuple[int, int, int, int]] = None):
+        self.tile = tile
+        self.dag = dag
+        self.nodes = dag.get("nodes", [])
+        self.text = {node["id"]: normalize_text(node.get("content", "")) for node in self.nodes}
+        self.boxes = {node["id"]: _page_box(node.get("box_2d"), tile_box) for node in self.nodes} if tile_box else {}
+        counts: Dict[str, int] = {}
+        for text in self.text.values():
+            counts[text] = counts.get(text, 0) + 1
+        self.repeated = {text for text, count in counts.items() if count > 1}
+        # Reading order: 0.0 for the first node in the prompt's numbering, 1.0 for the last
+        last = max(len(self.nodes) - 1, 1)
+        self.order = {node["id"]: i for i, node in enumerate(self.nodes)}
+        self.rank = {node_id: i / last for node_id, i in self.order.items()}
+        self.neighbours = {
+            node["id"]: [self.text[n] for n in node.get("parent_ids", []) + node.get("children_ids", [])
+                         if n in self.text]
+            for node in self.nodes
+        }
+
+    def ambiguous(self, node_id: str) -> bool:
+        text = self.text[node_id]
+        return len(text) < MIN_UNIQUE_CHARS or text in self.repeated
+
+
+def _edge_agreement(a: _Fragment, a_id: str, b: _Fragment, b_id: str) -> int:
+    """Neighbours of a's node whose text matches a neighbour of b's node."""
+    b_neighbours = b.neighbours[b_id]
+    return sum(1 for text in a.neighbours[a_id] if any(text_match(text, other) for other in b_neighbours))
+
+
+def _in_order(pairs: list, a: _Fragment, b: _Fragment) -> list:
+    """
+    The highest-scoring subset of one tile pair's (score, (i, a_id), (j, b_id))
+    matches whose nodes appear in the same order in both tiles.
+    """
+    pairs = sorted(pairs, key=lambda pair: (a.order[pair[1][1]], b.order[pair[2][1]]))
+    chains: List[Tuple[float, list]] = []  # Best (total score, pairs) ending with pairs[k]
+    for k, pair in enumerate(pairs):
+        a_pos, b_pos = a.order[pair[1][1]], b.order[pair[2][1]]
+        total, chain = max((chains[m] for m in range(k)
+                            if a.order[pairs[m][1][1]] < a_pos and b.order[pairs[m][2][1]] < b_pos),
+                           key=lambda c: c[0], default=(0.0, []))
+        chains.append((total + pair[0], chain + [pair]))
+    return max(chains, key=lambda c: c[0], default=(0.0, []))[1]
+
+
+def _candidate_pairs(fragments: List[_Fragment]) -> List[Tuple[float, Tuple[int, str], Tuple[int, str]]]:
+    """Scored (score, (fragment, node), (fragment, node)) matches between neighbouring tiles, best first."""
+    pairs = []
+    for i, a in enumerate(fragments):
+        for j in range(i + 1, len(fragments)):
+            b = fragments[j]
+            if not _adjacent(a.tile, b.tile):
+                continue
+            # Fragments are in tile order, so b is either right of a or in the row below
+            below = b.tile[0] > a.tile[0]
+            unboxed = []  # Matched without boxes: placed by reading order instead
+            for a_id, a_text in a.text.items():
+                for b_id, b_text in b.text.items():
+                    score = text_match(a_text, b_text)
+                    if not score:
+                        continue
+                    edges = _edge_agreement(a, a_id, b, b_id)
+                    a_box, b_box = a.boxes.get(a_id), b.boxes.get(b_id)
+                    if a_box and b_box:
+                        overlap = box_overlap(a_box, b_box)
+                        if overlap < BOX_OVERLAP:
+                            continue
+                        pairs.append((score + overlap + edges, (i, a_id), (j, b_id)))
+                    elif edges == 0 and (not below or a.ambiguous(a_id) or b.ambiguous(b_id)):
+                        continue
+                    elif below and (a.rank[a_id] < 1 - NEAR_EDGE_RANK or b.rank[b_id] > NEAR_EDGE_RANK):
+                        continue
+                    else:
+                        unboxed.append((score + edges, (i, a_id), (j, b_id)))
+            pairs += _in_order(unboxed, a, b) if below else unboxed
+    pairs.sort(key=lambda pair: -pair[0])
+    return pairs
+
+
+def stitch_fragments(fragments: List[Tuple[Tuple[int, int], Dict[str, Any], Optional[Tuple[int, int, int, int]]]]
+                     ) -> Dict[str, Any]:
+    """
+    Merge [((row, col), dag_dict, tile_box), ...] from one page's tiles into
+    one DAG dict (DAGOutput fields). tile_box is the tile's (left, top,
+    right, bottom) on the page, used with the nodes' box_2d; pass None when
+    the fragments have no boxes. extraction_confidence is the lowest tile's.
+    """
+    fragments = [_Fragment(tile, dag, tile_box) for tile, dag, tile_box in sorted(fragments, key=lambda f: f[0])]
+
+    # Union-find over (fragment index, node id); a group holds at most one node per tile
+    parent: Dict[Tuple[int, str], Tuple[int, str]] = {}
+    tiles_in: Dict[Tuple[int, str], set] = {}
+    for i, fragment in enumerate(fragments):
+        for node in fragment.nodes:
+            parent[(i, node["id"])] = (i, node["id"])
+            tiles_in[(i, node["id"])] = {i}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for _, a, b in _candidate_pairs(fragments):
+        root_a, root_b = find(a), find(b)
+        if root_a == root_b or tiles_in[root_a] & tiles_in[root_b]:
+            continue
+        parent[root_b] = root_a
+        tiles_in[root_a] |= tiles_in.pop(root_b)
+
+    # Number groups in tile order, then build merged nodes
+    group_ids: Dict[Tuple[int, str], str] = {}
+    groups: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+    for i, fragment in enumerate(fragments):
+        for node in fragment.nodes:
+            root = find((i, node["id"]))
+            if root not in group_ids:
+                group_ids[root] = f"node_{len(group_ids) + 1:03d}"
+            groups.setdefault(group_ids[root], []).append((i, node))
+
+    def merged_id(i: int, node_id: str) -> Optional[str]:
+        key = (i, node_id)
+        return group_ids[find(key)] if key in parent else None
+
+    nodes = []
+    for new_id, members in groups.items():
+        content = max((node.get("content", "") for _, node in members), key=len)
+        links = {"parent_ids": [], "children_ids": []}
+        tree_ids: List[str] = []
+        footnote_labels: List[str] = []
+        for i, node in members:
+            for field, ids in links.items():
+                for old in node.get(field, []):
+                    linked = merged_id(i, old)
+                    if linked and linked != new_id and linked not in ids:
+                        ids.append(linked)
+            tree_ids += [t for t in node.get("tree_ids", []) if t not in tree_ids]
+            footnote_labels += [f for f in node.get("footnote_labels", []) if f not in footnote_labels]
+        nodes.append({"id": new_id, "content": content, **links,
+                      "tree_ids": tree_ids, "footnote_labels": footnote_labels})
+
+    # Keep both ends of every edge consistent after merging
+    by_id = {node["id"]: node for node in nodes}
+    for node in nodes:
+        for child in node["children_ids"]:
+            if node["id"] not in by_id[child]["parent_ids"]:
+                by_id[child]["parent_ids"].append(node["id"])
+        for parent_id in node["parent_ids"]:
+            if node["id"] not in by_id[parent_id]["children_ids"]:
+                by_id[parent_id]["children_ids"].append(node["id"])
+
+    tree_references, seen_references = [], set()
+    footnotes: Dict[str, str] = {}
+    for fragment in fragments:
+        for ref in fragment.dag.get("tree_references", []):
+            key = (ref.get("from_tree"), ref.get("to_tree"))
+            if key not in seen_references:
+                seen_references.add(key)
+                tree_references.append(ref)
+        for footnote in fragment.dag.get("footnotes", []):
+            label, content = footnote.get("label"), footnote.get("content", "")
+            if len(content) > len(footnotes.get(label, "")):
+                footnotes[label] = content
+
+    # The tree ID sits in the lower right corner: prefer the last tile that reports one
+    tree_id = next((f.dag.get("tree_id") for f in reversed(fragments) if f.dag.get("tree_id")), None)
+    image_title = next((f.dag.get("image_title") for f in fragments if f.dag.get("image_title")), None)
+    confidences = [f.dag.get("extraction_confidence", 0.0) for f in fragments]
+
+    return {
+        "nodes": nodes,
+        "tree_references": tree_references,
+        "footnotes": [{"label": label, "content": content} for label, content in footnotes.items()],
+        "extraction_confidence": min(confidences) if confidences else 0.0,
+        "image_title": image_title,
+        "tree_id": tree_id,
+    }
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed LLM Extraction Cache
+
+Parsed batch extractions (create_ct_table.py) keyed by
+sha256(prompt template, pruned trial payload, model name), so reruns only
+send trials whose prompt, payload or model actually changed. Each entry
+also records the model and the prompt hash it was made with, so entries
+can be invalidated selectively (one model, one prompt version, or a list
+of trials) without throwing away the rest.
+
+Cache format (JSON):
+{
+  "version": 1,
+  "last_updated": "...",
+  "entries": {
+    "<sha256>": {"nct_id": "NCT...", "official_title": "...", "model": "gemini-2.5-flash",
+                 "prompt_sha256": "...", "extraction": {...}, "cached_at": "..."}
+  }
+}
+
+Usage:
+    python extraction_cache.py info [cache_path]
+    python extraction_cache.py invalidate [cache_path] [--model M] [--prompt SHA_PREFIX] [--nct ID,ID,...]
+"""
+
+import hashlib
+import json
+import os
+import sys
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_PATH = Path(__file__).parent / "trial_extractions.cache.json"
+
+
+def cache_path_for(output_csv: str) -> Path:
+    """Default cache location: <output_csv stem>.cache.json beside the CSV."""
+    return Path(output_csv).with_suffix(".cache.json")
+
+
+def prompt_hash(prompt_template: str) -> str:
+    return hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+
+
+def extraction_key(prompt_template: str, payload_text: str, model: str) -> str:
+    """Content address of one request: the exact prompt, payload text and model."""
+    sha256_hash = hashlib.sha256()
+    for part in (prompt_template, payload_text, model):
+        encoded = part.encode("utf-8")
+        sha256_hash.update(len(encoded).to_bytes(8, "little"))
+        sha256_hash.update(encoded)
+    return sha256_hash.hexdigest()
+
+
+class ExtractionCache:
+    """Parsed extractions by content key, loaded from and saved to one JSON file."""
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH):
+        self.path = Path(path)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+                if data.get("version") == CACHE_VERSION:
+                    self.entries = data.get("entries", {})
+            except json.JSONDecodeError:
+                pass
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(key)
+
+    def put(self, key: str, nct_id: str, official_title: str, model: str, prompt_sha256: str,
+            extraction: Dict[str, Any]):
+        self.entries[key] = {
+            "nct_id": nct_id,
+            "official_title": official_title,
+            "model": model,
+            "prompt_sha256": prompt_sha256,
+            "extraction": extraction,
+            "cached_at": datetime.now().isoformat(),
+        }
+
+    def invalidate(self, model: Optional[str] = None, prompt_prefix: Optional[str] = None,
+                   nct_ids: Optional[Iterable[str]] = None) -> int:
+        """
+        Drop entries matching every given filter (model name, prompt hash prefix,
+        trial IDs). Returns the number of entries removed.
+        """
+        nct_ids = set(nct_ids) if nct_ids is not None else None
+        doomed = [
+            key for key, entry in self.entries.items()
+            if (model is None or entry["model"] == model)
+            and (prompt_prefix is None or entry["prompt_sha256"].startswith(prompt_prefix))
+            and (nct_ids is None or entry["nct_id"] in nct_ids)
+        ]
+        for key in doomed:
+            del self.entries[key]
+        return len(doomed)
+
+    def save(self):
+        """Atomically write the cache."""
+        data = {"version": CACHE_VERSION, "last_updated": datetime.now().isoformat(), "entries": self.entries}
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python extraction_cache.py <command> [cache_path] [options]")
+        print("\nCommands:")
+        print("  info                                  Entry counts by model and prompt hash")
+        print("  invalidate [--model M] [--prompt SHA_PREFIX] [--nct ID,ID,...]")
+        print("                                        Drop entries matching all given filters")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    option_values = {sys.argv[i + 1] for i, a in enumerate(sys.argv[:-1]) if a.startswith("--")}
+    args = [a for a in sys.argv[2:] if not a.startswith("--") and a not in option_values]
+    cache = ExtractionCache(Path(args[0]) if args else DEFAULT_CACHE_PATH)
+
+    def option(name: str) -> Optional[str]:
+        return sys.argv[sys.argv.index(name) + 1] if name in sys.argv else None
+
+    if command == "info":
+        print(f"{cache.path}: {len(cache)} entries")
+        groups = Counter((e["model"], e["prompt_sha256"][:12]) for e in cache.entries.values())
+        for (model, prompt), count in groups.most_common():
+            print(f"  {model}  prompt {prompt}  {count} entries")
+
+    elif command == "invalidate":
+        model, prompt_prefix, nct = option("--model"), option("--prompt"), option("--nct")
+        if model is None and prompt_prefix is None and nct is None:
+            print("Refusing to invalidate everything: pass --model, --prompt and/or --nct")
+            sys.exit(1)
+        removed = cache.invalidate(model, prompt_prefix, nct.split(",") if nct else None)
+        cache.save()
+        print(f"✓ Removed {removed} entries ({len(cache)} left)")
+
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Trial Extraction Store
+
+SQLite table of LLM trial extractions (create_ct_table.py), one row per
+NCT ID. Each write is a last-write-wins upsert that records the run ID
+and model that produced the row, so reruns replace rows instead of piling
+up duplicates. trial_extractions.csv and trials_data.js are exported from
+this table rather than appended to.
+
+Schema:
+    extractions(nct_id PRIMARY KEY, official_title, experimental_drugs, biomarkers,
+                primary_outcomes, efficacy_status, reasoning, run_id, model, updated_at)
+
+Usage:
+    python extraction_store.py info [db_path]
+    python extraction_store.py import <csv_path> [db_path]
+    python extraction_store.py export [db_path] [csv_path] [js_path]
+"""
+
+import csv
+import json
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+
+DEFAULT_DB_PATH = Path(__file__).parent / "trial_extractions.db"
+DEFAULT_CSV_PATH = Path(__file__).parent / "trial_extractions.csv"
+DEFAULT_JS_PATH = Path(__file__).parent / "trials_data.js"
+
+# Extraction columns, in export order; the exported CSV and trials_data.js use
+# these names (what app.js and /api/trials read)
+COLUMNS = [
+    "nct_id",
+    "official_title",
+    "experimental_drugs",
+    "biomarkers",
+    "primary_outcomes",
+    "efficacy_status",
+    "reasoning",
+]
+# Headers written by older create_ct_table.py runs, accepted on import
+LEGACY_CSV_HEADERS = {
+    "NCT_ID": "nct_id",
+    "Official Title": "official_title",
+    "Experimental Drugs": "experimental_drugs",
+    "Biomarkers": "biomarkers",
+    "Primary Outcomes": "primary_outcomes",
+    "Efficacy Status": "efficacy_status",
+    "Reasoning": "reasoning",
+}
+RUN_COLUMNS = ["run_id", "model", "updated_at"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS extractions (
+    nct_id TEXT PRIMARY KEY,
+    official_title TEXT,
+    experimental_drugs TEXT,
+    biomarkers TEXT,
+    primary_outcomes TEXT,
+    efficacy_status TEXT,
+    reasoning TEXT,
+    run_id TEXT,
+    model TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_extractions_run ON extractions(run_id);
+"""
+
+
+def store_path_for(output_csv: str) -> Path:
+    """Default database location: <output_csv stem>.db beside the CSV."""
+    return Path(output_csv).with_suffix(".db")
+
+
+class ExtractionStore:
+    """Upsert-only extraction table; rows are keyed by NCT ID."""
+
+    def __init__(self, db_path: Path = DEFAULT_DB_PATH):
+        self.path = Path(db_path)
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.executescript(SCHEMA)
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+
+    def __contains__(self, nct_id: str) -> bool:
+        return self._conn.execute("SELECT 1 FROM extractions WHERE nct_id = ?", (nct_id,)).fetchone() is not None
+
+    def upsert(self, row: Dict[str, Any], run_id: str, model: str):
+        """Insert or replace one row (keys from COLUMNS); the newest write wins."""
+        values = [row.get(name, "") for name in COLUMNS]
+        columns = COLUMNS + RUN_COLUMNS
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns[1:])
+        self._conn.execute(
+            f"INSERT INTO extractions ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(nct_id) DO UPDATE SET {updates}",
+            values + [run_id, model, datetime.now().isoformat()],
+        )
+
+    def commit(self):
+        self._conn.commit()
+
+    def get(self, nct_id: str) -> Optional[Dict[str, Any]]:
+        """One trial's row plus run_id/model/updated_at, or None."""
+        columns = COLUMNS + RUN_COLUMNS
+        values = self._conn.execute(
+            f"SELECT {', '.join(columns)} FROM extractions WHERE nct_id = ?", (nct_id,)).fetchone()
+        return dict(zip(columns, values)) if values else None
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """All rows (COLUMNS only) in NCT order."""
+        for values in self._conn.execute(f"SELECT {', '.join(COLUMNS)} FROM extractions ORDER BY nct_id"):
+            yield dict(zip(COLUMNS, values))
+
+    def run_counts(self) -> List[tuple]:
+        """[(run_id, model, trial count), ...] for the rows currently in the table."""
+        return self._conn.execute(
+            "SELECT run_id, model, COUNT(*) FROM extractions GROUP BY run_id, model ORDER BY run_id").fetchall()
+
+    def import_csv(self, csv_path: Path, run_id: str = "csv-import", model: str = "") -> int:
+        """
+        Load an existing (possibly duplicated) extraction CSV with either current or
+        legacy headers; later rows win. Returns rows read.
+        """
+        count = 0
+        with open(csv_path, "r", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                row = {LEGACY_CSV_HEADERS.get(k, k): v for k, v in row.items()}
+                if row.get("nct_id"):
+                    self.upsert(row, run_id, model)
+                    count += 1
+        self.commit()
+        return count
+
+    def export_csv(self, csv_path: Path) -> int:
+        """Write one row per trial to csv_path. Returns the row count."""
+        count = 0
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            for row in self.rows():
+                writer.writerow(row)
+                count += 1
+        return count
+
+    def export_js(self, js_path: Path, source_name: str = "trial_extractions.db") -> int:
+        """Write trials_data.js (const TRIALS_DATA = [...]) for static serving. Returns the row count."""
+        trials: List[Dict[str, Any]] = list(self.rows())
+        with open(js_path, "w", encoding="utf-8") as f:
+            f.write(f"// Auto-generated from {source_name}\nconst TRIALS_DATA = {json.dumps(trials, indent=2)};")
+        return len(trials)
+
+    def close(self):
+        self._conn.close()
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python extraction_store.py <command> [options]")
+        print("\nCommands:")
+        print("  info [db_path]                         Row counts by run and model")
+        print("  import <csv_path> [db_path]            Upsert rows from an extraction CSV")
+        print("  export [db_path] [csv_path] [js_path]  Write the CSV and trials_data.js")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    args = sys.argv[2:]
+
+    if command == "info":
+        store = ExtractionStore(Path(args[0]) if args else DEFAULT_DB_PATH)
+        print(f"{store.path}: {len(store)} trials")
+        for run_id, model, count in store.run_counts():
+            print(f"  run {run_id}  {model or '-'}  {count} trials")
+
+    elif command == "import":
+        if not args:
+            print("Usage: python extraction_store.py import <csv_path> [db_path]")
+            sys.exit(1)
+        store = ExtractionStore(Path(args[1]) if len(args) > 1 else DEFAULT_DB_PATH)
+        count = store.import_csv(Path(args[0]))
+        print(f"✓ Read {count} CSV rows -> {len(store)} trials in {store.path}")
+
+    elif command == "export":
+        store = ExtractionStore(Path(args[0]) if args else DEFAULT_DB_PATH)
+        csv_path = Path(args[1]) if len(args) > 1 else DEFAULT_CSV_PATH
+        js_path = Path(args[2]) if len(args) > 2 else DEFAULT_JS_PATH
+        print(f"✓ Exported {store.export_csv(csv_path)} trials to {csv_path}")
+        print(f"✓ Exported {store.export_js(js_path, store.path.name)} trials to {js_path}")
+
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
@@ -6,18 +6,28 @@ Converts NSCLC clinical decision tree images to structured JSON DAG format
 using Gemini 2.5 Pro (or 3 Pro) with thinking capabilities.
 """
 
+import io
 import json
 import os
 import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
-import hashlib
 
+from google.api_core import exceptions as google_exceptions
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 from pydantic import BaseModel, Field
 
+import image_preprocess
+from dag_stitch import stitch_fragments
+from upload_cache import UploadCache
+
 
 # ============================================================================
 # Configuration: Easy model switching
@@ -26,6 +36,13 @@ from pydantic import BaseModel, Field
 # Set to "gemini-2-pro" for production, "gemini-2.5-pro" for development
 GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-pro")
 
+# extract-all concurrency: pages in flight at once, and the shared request rate cap
+EXTRACT_WORKERS = int(os.environ.get("GEMINI_WORKERS", "1"))
+REQUESTS_PER_MINUTE = float(os.environ.get("GEMINI_RPM", "30"))
+
+# Send grayscale, cropped, tile-sized pages (image_preprocess.py) instead of the raw renders
+PREPROCESS_IMAGES = os.environ.get("GEMINI_PREPROCESS", "1") != "0"
+
 # ============================================================================
 # Pydantic Schema for Structured Output
 # ============================================================================
@@ -73,62 +90,120 @@ class DAGOutput(BaseModel):
 # File API Caching
 # ============================================================================
 
-CACHE_FILE = Path(__file__).parent / "dag_extraction_cache.json"
+# Uploads are keyed by image content hash in a SQLite cache (upload_cache.py)
+# that expires entries with the Files API's 48-hour lifetime and is shared
+# by extract-all workers
+_UPLOAD_CACHE: Optional[UploadCache] = None
+_UPLOAD_CACHE_LOCK = threading.Lock()
 
 
-def get_file_hash(file_path: Path) -> str:
-    """Generate SHA256 hash of file for cache validation."""
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
+def upload_cache() -> UploadCache:
+    """The process-wide upload cache, opened (and expired entries evicted) on first use."""
+    global _UPLOAD_CACHE
+    with _UPLOAD_CACHE_LOCK:
+        if _UPLOAD_CACHE is None:
+            _UPLOAD_CACHE = UploadCache()
+        return _UPLOAD_CACHE
 
 
 def load_cache() -> Dict[str, Any]:
-    """Load file upload cache."""
-    if CACHE_FILE.exists():
-        with open(CACHE_FILE, "r") as f:
-            return json.load(f)
-    return {"files": {}, "last_updated": None}
-
-
-def save_cache(cache: Dict[str, Any]):
-    """Save file upload cache."""
-    cache["last_updated"] = datetime.now().isoformat()
-    with open(CACHE_FILE, "w") as f:
-        json.dump(cache, f, indent=2)
+    """Live uploads by content hash."""
+    return {"files": upload_cache().uploads()}
 
 
 def get_cached_file_uri(file_path: Path) -> Optional[str]:
-    """Retrieve cached file URI if exists and hash matches."""
-    cache = load_cache()
-    file_key = str(file_path)
-    
-    if file_key not in cache["files"]:
-        return None
-    
-    cached_entry = cache["files"][file_key]
-    current_hash = get_file_hash(file_path)
-    
-    if cached_entry.get("file_hash") == current_hash:
-        return cached_entry.get("file_uri")
-    
-    return None  # Hash mismatch, need re-upload
+    """Retrieve cached file URI if the file's contents were uploaded and it has not (nearly) expired."""
+    return upload_cache().get(file_path)
 
 
-def cache_file_uri(file_path: Path, file_uri: str):
+def cache_file_uri(file_path: Path, file_uri: str, expires_at: Optional[datetime] = None):
     """Cache the file URI after successful upload."""
-    cache = load_cache()
-    file_key = str(file_path)
-    
-    cache["files"][file_key] = {
-        "file_uri": file_uri,
-        "file_hash": get_file_hash(file_path),
-        "uploaded_at": datetime.now().isoformat(),
-    }
-    
-    save_cache(cache)
+    upload_cache().put(file_path, file_uri, image_mime_type(file_path), expires_at)
+
+
+def forget_file_uri(file_path: Path):
+    """Drop a cached URI the API rejected (deleted or expired early)."""
+    upload_cache().forget(file_path)
+
+
+# ============================================================================
+# Concurrency: Shared Rate Limit, Ordered Console Output
+# ============================================================================
+
+class RateLimiter:
+    """Thread-safe token bucket: `per_minute` requests per minute, up to `burst` banked."""
+
+    def __init__(self, per_minute: float, burst: int = 1):
+        self.rate = per_minute / 60.0
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                time.sleep((1 - self._tokens) / self.rate)
+
+
+# Every generate_content call goes through this, from any worker thread
+REQUEST_LIMITER = RateLimiter(REQUESTS_PER_MINUTE)
+
+
+class _ThreadBufferedStdout:
+    """
+    sys.stdout stand-in for worker threads: while a thread is inside
+    capture(), its prints go to its own buffer instead of the console, so
+    extract-all can print each image's log in image order once it is done.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def write(self, text: str) -> int:
+        buffer = getattr(self._local, "buffer", None)
+        return (buffer if buffer is not None else self.stream).write(text)
+
+    def flush(self):
+        if getattr(self._local, "buffer", None) is None:
+            self.stream.flush()
+
+    def capture(self, func, *args):
+        """Run func(*args) with this thread's output buffered. Returns (result, error, text)."""
+        self._local.buffer = io.StringIO()
+        try:
+            return func(*args), None, self._local.buffer.getvalue()
+        except Exception as e:
+            return None, e, self._local.buffer.getvalue()
+        finally:
+            self._local.buffer = None
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+@contextmanager
+def _buffered_stdout():
+    """
+    The installed _ThreadBufferedStdout (extract-all), or one installed for
+    the duration (single-image runs, main thread only).
+    """
+    if isinstance(sys.stdout, _ThreadBufferedStdout):
+        yield sys.stdout
+        return
+    console = _ThreadBufferedStdout(sys.stdout)
+    sys.stdout = console
+    try:
+        yield console
+    finally:
+        sys.stdout = console.stream
 
 
 # ============================================================================
@@ -144,56 +219,68 @@ def initialize_client():
     genai.configure(api_key=api_key)
 
 
-def upload_image_to_files_api(image_path: Path) -> str:
+def image_mime_type(image_path: Path) -> str:
+    """MIME type from the file extension (JPEG if unknown)."""
+    mime_types = {
+        ".jpg": "image/jpeg",
+        ".jpeg": "image/jpeg",
+        ".png": "image/png",
+        ".gif": "image/gif",
+        ".webp": "image/webp",
+    }
+    return mime_types.get(image_path.suffix.lower(), "image/jpeg")
+
+
+def upload_image_to_files_api(image_path: Path, refresh: bool = False) -> str:
     """
     Upload image to Gemini Files API with caching.
     
-    Returns the file URI for use in generation requests.
+    Returns the file URI for use in generation requests. A cached URI is
+    reused until shortly before its 48-hour expiry; refresh=True uploads
+    again regardless.
     """
     # Check cache first
-    cached_uri = get_cached_file_uri(image_path)
+    cached_uri = None if refresh else get_cached_file_uri(image_path)
     if cached_uri:
         print(f"  [CACHE HIT] Using cached URI for {image_path.name}")
         return cached_uri
     
     print(f"  [UPLOADING] {image_path.name} to Gemini Files API...")
     
-    # Determine MIME type
-    suffix = image_path.suffix.lower()
-    mime_types = {
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".png": "image/png",
-        ".gif": "image/gif",
-        ".webp": "image/webp",
-    }
-    mime_type = mime_types.get(suffix, "image/jpeg")
-    
     # Upload file
     response = genai.upload_file(
         path=str(image_path),
-        mime_type=mime_type,
+        mime_type=image_mime_type(image_path),
     )
     
     file_uri = response.uri
     print(f"  [UPLOADED] File URI: {file_uri}")
     
-    # Cache the URI
-    cache_file_uri(image_path, file_uri)
+    # Cache the URI, with the expiry the API reports when it has one
+    expiration_time = getattr(response, "expiration_time", None)
+    if not isinstance(expiration_time, datetime):
+        expiration_time = None
+    cache_file_uri(image_path, file_uri, expiration_time)
     
     return file_uri
 
 
-def extract_dag_from_image(image_path: Path) -> DAGOutput:
+def prepare_image(image_path: Path) -> Path:
     """
-    Extract structured DAG from clinical decision tree image.
-    
-    Uses Gemini with structured output.
+    The preprocessed copy of a page (cached by source hash), or the page
+    itself when Pillow is not installed.
     """
-    print(f"\nExtracting DAG from: {image_path.name}")
-    
-    # Prepare the extraction prompt
-    extraction_prompt = """You are an expert at analyzing clinical decision tree images from NCCN guidelines.
+    if image_preprocess.Image is None:
+        print(f"  [PREPROCESS SKIPPED] Pillow not installed, sending {image_path.name} as is")
+        return image_path
+    prepared = image_preprocess.preprocess_image(image_path, upload_cache().content_hash(image_path))
+    before, after = image_preprocess.image_stats(image_path), image_preprocess.image_stats(prepared)
+    print(f"  [PREPROCESSED] {before[0] / 1024:.0f} KB, ~{before[3]} tokens -> "
+          f"{after[0] / 1024:.0f} KB, ~{after[3]} tokens ({after[1]}x{after[2]})")
+    return prepared
+
+
+EXTRACTION_PROMPT = """You are an expert at analyzing clinical decision tree images from NCCN guidelines.
 
 Your task is to extract the complete decision tree from this image as a structured DAG (Directed Acyclic Graph).
 
@@ -238,9 +325,21 @@ Return ONLY valid JSON matching this exact schema:
   "image_title": "Title if visible at top of image",
   "tree_id": "NSCLC-10"
 }"""
-    
-    # Create request with structured JSON output
-    model = genai.GenerativeModel(
+
+# Appended to EXTRACTION_PROMPT for each tile in tiled mode
+TILE_PROMPT_SUFFIX = """
+
+NOTE: This image is one tile (row {row} of {rows}, column {col} of {cols}) cut from a larger
+guideline page; neighbouring tiles overlap it by about {overlap:.0%}. Extract every node, edge and
+footnote visible in this tile, including nodes cut off at the tile edge (use the visible text).
+Only report tree_id if it is visible in this tile.
+For every node also return "box_2d": [ymin, xmin, ymax, xmax], the node's bounding box in this
+tile, normalized to 0-1000."""
+
+
+def _extraction_model():
+    """Gemini model configured for JSON output."""
+    return genai.GenerativeModel(
         model_name=GEMINI_MODEL,
         generation_config=genai.GenerationConfig(
             response_mime_type="application/json",
@@ -252,19 +351,38 @@ Return ONLY valid JSON matching this exact schema:
             HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
         },
     )
-    
-    # Read image and send request
-    with open(str(image_path), "rb") as f:
-        image_data = f.read()
-    
-    response = model.generate_content([
-        extraction_prompt,
-        {
-            "mime_type": "image/jpeg",
-            "data": image_data,
-        }
-    ])
-    
+
+
+def _generate_for_file(model, prompt: str, upload_path: Path):
+    """
+    One rate-limited generate_content call referencing upload_path's Files API
+    URI (uploading it on a cache miss).
+    """
+    mime_type = image_mime_type(upload_path)
+    file_uri = upload_image_to_files_api(upload_path)
+    try:
+        REQUEST_LIMITER.acquire()
+        return model.generate_content([
+            prompt,
+            {"file_data": {"mime_type": mime_type, "file_uri": file_uri}},
+        ])
+    except (google_exceptions.PermissionDenied, google_exceptions.NotFound) as e:
+        # The file is gone server-side (deleted or expired early): upload once more and retry
+        print(f"  [EXPIRED] Cached file rejected ({e.__class__.__name__}), re-uploading")
+        forget_file_uri(upload_path)
+        file_uri = upload_image_to_files_api(upload_path, refresh=True)
+        REQUEST_LIMITER.acquire()
+        return model.generate_content([
+            prompt,
+            {"file_data": {"mime_type": mime_type, "file_uri": file_uri}},
+        ])
+
+
+def _parse_dag_response(response) -> Dict[str, Any]:
+    """
+    The DAG dict from a JSON response, with fields the model left out filled
+    in and checked against DAGOutput. Extra node keys (a tile's box_2d) are kept.
+    """
     # Parse response (should be pure JSON with response_mime_type="application/json")
     try:
         output_dict = json.loads(response.text)
@@ -290,9 +408,8 @@ Return ONLY valid JSON matching this exact schema:
             if "footnote_labels" not in node:
                 node["footnote_labels"] = []
         
-        dag_output = DAGOutput(**output_dict)
-        print(f"  [SUCCESS] Extracted {len(dag_output.nodes)} nodes with confidence {dag_output.extraction_confidence}")
-        return dag_output
+        DAGOutput(**output_dict)
+        return output_dict
     except json.JSONDecodeError as e:
         print(f"  [ERROR] Failed to parse JSON response: {e}")
         print(f"  Response text: {response.text[:200]}")
@@ -302,6 +419,71 @@ Return ONLY valid JSON matching this exact schema:
         raise
 
 
+def extract_dag_from_image(image_path: Path, preprocess: bool = PREPROCESS_IMAGES) -> DAGOutput:
+    """
+    Extract structured DAG from clinical decision tree image.
+    
+    Uses Gemini with structured output. With preprocess set, the page is
+    shrunk by image_preprocess.py before upload.
+    """
+    print(f"\nExtracting DAG from: {image_path.name}")
+    
+    # Reference the uploaded file instead of sending the image bytes with every request
+    upload_path = prepare_image(image_path) if preprocess else image_path
+    response = _generate_for_file(_extraction_model(), EXTRACTION_PROMPT, upload_path)
+    
+    dag_output = DAGOutput(**_parse_dag_response(response))
+    print(f"  [SUCCESS] Extracted {len(dag_output.nodes)} nodes with confidence {dag_output.extraction_confidence}")
+    return dag_output
+
+
+def parse_tiles(spec: str) -> Tuple[int, int]:
+    """'2x2' -> (rows, cols)."""
+    rows, _, cols = spec.lower().partition("x")
+    return int(rows), int(cols)
+
+
+def extract_tiled_dag(image_path: Path, tiles: Tuple[int, int], preprocess: bool = PREPROCESS_IMAGES) -> DAGOutput:
+    """
+    Extract a dense page as overlapping tiles (image_preprocess.split_tiles),
+    one concurrent request per tile, and stitch the fragments into one DAG
+    (dag_stitch.py). With preprocess set the tiles are cut from the cleaned
+    page, otherwise from the original. Requires Pillow.
+    """
+    rows, cols = tiles
+    print(f"\nExtracting DAG from: {image_path.name} ({rows}x{cols} tiles)")
+    
+    tile_files = image_preprocess.split_tiles(image_path, rows, cols, upload_cache().content_hash(image_path),
+                                              preprocess=preprocess)
+    
+    def extract_tile(i: int, tile_path: Path) -> Dict[str, Any]:
+        row, col = divmod(i, cols)
+        prompt = EXTRACTION_PROMPT + TILE_PROMPT_SUFFIX.format(
+            row=row + 1, rows=rows, col=col + 1, cols=cols, overlap=image_preprocess.TILE_OVERLAP)
+        return _parse_dag_response(_generate_for_file(_extraction_model(), prompt, tile_path))
+    
+    with _buffered_stdout() as console, ThreadPoolExecutor(max_workers=len(tile_files)) as pool:
+        futures = [pool.submit(console.capture, extract_tile, i, tile_path)
+                   for i, (tile_path, _) in enumerate(tile_files)]
+        results = [future.result() for future in futures]
+    
+    fragments = []
+    for i, ((_, box), (fragment, error, log)) in enumerate(zip(tile_files, results)):
+        print(log, end="")
+        if error is not None:
+            print(f"  [ERROR] Tile {i + 1}/{len(tile_files)} failed: {error}")
+            raise error
+        print(f"  [TILE {i + 1}/{len(tile_files)}] {len(fragment['nodes'])} nodes, "
+              f"confidence {fragment['extraction_confidence']}")
+        fragments.append((divmod(i, cols), fragment, box))
+    
+    dag_output = DAGOutput(**stitch_fragments(fragments))
+    tile_nodes = sum(len(fragment["nodes"]) for _, fragment, _ in fragments)
+    print(f"  [SUCCESS] Stitched {tile_nodes} tile nodes into {len(dag_output.nodes)} nodes "
+          f"with confidence {dag_output.extraction_confidence}")
+    return dag_output
+
+
 def save_dag_output(image_path: Path, dag_output: DAGOutput, output_dir: Optional[Path] = None):
     """Save DAG output to JSON file."""
     if output_dir is None:
@@ -320,14 +502,16 @@ def save_dag_output(image_path: Path, dag_output: DAGOutput, output_dir: Optiona
 # CLI Commands
 # ============================================================================
 
-def extract_single_image(image_path: Path):
-    """Extract DAG from a single image."""
+def extract_single_image(image_path: Path, preprocess: bool = PREPROCESS_IMAGES,
+                         tiles: Optional[Tuple[int, int]] = None):
+    """Extract DAG from a single image (as rows x cols tiles if tiles is given)."""
     initialize_client()
     
     if not image_path.exists():
         raise FileNotFoundError(f"Image not found: {image_path}")
     
-    dag_output = extract_dag_from_image(image_path)
+    dag_output = (extract_tiled_dag(image_path, tiles, preprocess) if tiles
+                  else extract_dag_from_image(image_path, preprocess))
     save_dag_output(image_path, dag_output)
     
     return dag_output
@@ -350,19 +534,39 @@ def get_extraction_index() -> Dict[str, Any]:
 
 
 def save_extraction_index(index: Dict[str, Any]):
-    """Save extraction index."""
+    """Save extraction index (atomically, so an interrupted run never leaves it half-written)."""
     index_file = Path(__file__).parent / "data" / "decision_trees" / "new" / "nsclc" / "extraction_index.json"
-    with open(index_file, "w") as f:
+    tmp_file = index_file.with_suffix(".json.tmp")
+    with open(tmp_file, "w") as f:
         json.dump(index, f, indent=2)
+    os.replace(tmp_file, index_file)
+
+
+def _extract_and_save(image_file: Path, output_dir: Path, preprocess: bool,
+                      tiles: Optional[Tuple[int, int]]) -> DAGOutput:
+    dag_output = (extract_tiled_dag(image_file, tiles, preprocess) if tiles
+                  else extract_dag_from_image(image_file, preprocess))
+    save_dag_output(image_file, dag_output, output_dir)
+    if dag_output.extraction_confidence < 0.80:
+        print(f"  ⚠ Low confidence: {dag_output.extraction_confidence:.2%} (consider manual review)")
+    return dag_output
 
 
-def extract_all_images(force_reprocess: bool = False, output_dir: Optional[Path] = None):
+def extract_all_images(force_reprocess: bool = False, output_dir: Optional[Path] = None,
+                       workers: int = EXTRACT_WORKERS, requests_per_minute: Optional[float] = None,
+                       preprocess: bool = PREPROCESS_IMAGES, tiles: Optional[Tuple[int, int]] = None):
     """
     Extract DAG from all images in the NSCLC directory with idempotent processing.
     
     - Skips images already processed (unless force_reprocess=True)
     - Resumes from failures
-    - Maintains index of all extractions
+    - Maintains index of all extractions, saved after every image
+    - Runs up to `workers` pages at once; all requests share REQUEST_LIMITER
+      (requests_per_minute overrides its rate). Each page's log is printed
+      as one block, in image order.
+    - Preprocesses pages before upload unless preprocess=False
+    - With tiles=(rows, cols), extracts each page as overlapping tiles and
+      stitches the fragments (extract_tiled_dag)
     """
     initialize_client()
     
@@ -377,6 +581,10 @@ def extract_all_images(force_reprocess: bool = False, output_dir: Optional[Path]
     if not image_dir.exists():
         raise FileNotFoundError(f"Image directory not found: {image_dir}")
     
+    if requests_per_minute is not None:
+        REQUEST_LIMITER.rate = requests_per_minute / 60.0
+    workers = max(1, workers)
+    
     image_files = sorted(image_dir.glob("*.jpg"))
     index = get_extraction_index()
     index["statistics"]["total"] = len(image_files)
@@ -389,59 +597,74 @@ def extract_all_images(force_reprocess: bool = False, output_dir: Optional[Path]
     print(f"Already processed: {index['statistics'].get('processed', 0)}", flush=True)
     print(f"Previously failed: {index['statistics'].get('failed', 0)}", flush=True)
     print(f"Output directory: {output_dir}", flush=True)
+    print(f"Workers: {workers} (max {REQUEST_LIMITER.rate * 60:g} requests/min)", flush=True)
     print(flush=True)
     
-    processed_count = 0
-    failed_count = 0
-    skipped_count = 0
-    
+    counts = {"processed": 0, "failed": 0, "skipped": 0}
+    index_lock = threading.Lock()
+    
+    def record(image_file: Path, dag_output: Optional[DAGOutput], error: Optional[Exception]):
+        """Update and save the index; workers finish in any order, so one at a time."""
+        with index_lock:
+            if error is None:
+                index["images"][image_file.name] = {
+                    "status": "success",
+                    "nodes": len(dag_output.nodes),
+                    "confidence": dag_output.extraction_confidence,
+                    "processed_at": datetime.now().isoformat(),
+                    "output_file": str(image_file.with_suffix(".dag.json"))
+                }
+                if tiles:
+                    index["images"][image_file.name]["tiles"] = f"{tiles[0]}x{tiles[1]}"
+                counts["processed"] += 1
+            else:
+                index["images"][image_file.name] = {
+                    "status": "failed",
+                    "error": str(error),
+                    "failed_at": datetime.now().isoformat()
+                }
+                counts["failed"] += 1
+            index["statistics"]["processed"] = counts["processed"] + counts["skipped"]
+            index["statistics"]["failed"] = counts["failed"]
+            save_extraction_index(index)
+    
+    todo = []
     for idx, image_file in enumerate(image_files, 1):
-        output_path = image_file.with_suffix(".dag.json")
-        
         # Check if already processed
         if image_file.name in index["images"] and not force_reprocess:
             entry = index["images"][image_file.name]
             if entry.get("status") == "success":
-                skipped_count += 1
+                counts["skipped"] += 1
                 print(f"[{idx}/{len(image_files)}] ⊘ SKIP {image_file.name} (already processed)", flush=True)
                 continue
-        
-        print(f"[{idx}/{len(image_files)}] ⇢ {image_file.name}", flush=True)
-        
-        try:
-            dag_output = extract_dag_from_image(image_file)
-            save_dag_output(image_file, dag_output, output_dir)
-            
-            # Update index
-            index["images"][image_file.name] = {
-                "status": "success",
-                "nodes": len(dag_output.nodes),
-                "confidence": dag_output.extraction_confidence,
-                "processed_at": datetime.now().isoformat(),
-                "output_file": str(output_path)
-            }
-            
-            processed_count += 1
-            index["statistics"]["processed"] = processed_count + skipped_count
-            
-            if dag_output.extraction_confidence < 0.80:
-                print(f"  ⚠ Low confidence: {dag_output.extraction_confidence:.2%} (consider manual review)")
-            
-        except Exception as e:
-            failed_count += 1
-            index["statistics"]["failed"] = failed_count
-            
-            index["images"][image_file.name] = {
-                "status": "failed",
-                "error": str(e),
-                "failed_at": datetime.now().isoformat()
-            }
-            
-            print(f"  ✗ Error: {e}")
+        todo.append((idx, image_file))
+    
+    console = _ThreadBufferedStdout(sys.stdout)
+    
+    def run(image_file: Path):
+        dag_output, error, log = console.capture(_extract_and_save, image_file, output_dir, preprocess, tiles)
+        record(image_file, dag_output, error)
+        return error, log
+    
+    sys.stdout = console
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(idx, image_file, pool.submit(run, image_file)) for idx, image_file in todo]
+            # Print in submission order; later pages that finish first wait their turn
+            for idx, image_file, future in futures:
+                print(f"[{idx}/{len(image_files)}] ⇢ {image_file.name}", flush=True)
+                error, log = future.result()
+                print(log, end="")
+                if error is not None:
+                    print(f"  ✗ Error: {error}")
+                sys.stdout.flush()
+    finally:
+        sys.stdout = console.stream
     
     # Save updated index
     save_extraction_index(index)
     
+    processed_count, failed_count, skipped_count = counts["processed"], counts["failed"], counts["skipped"]
     print(f"\n{'='*70}")
     print(f"Results Summary")
     print(f"{'='*70}")
@@ -458,16 +681,19 @@ def extract_all_images(force_reprocess: bool = False, output_dir: Optional[Path]
 
 
 if __name__ == "__main__":
-    import sys
-    
     if len(sys.argv) < 2:
         print("Usage: python gemini_dag_extractor.py <command> [options]")
         print("\nCommands:")
         print("  extract-single <image_path>  Extract DAG from a single image")
         print("  extract-all [options]        Extract DAG from all NSCLC images")
+        print("\nOptions for both:")
+        print("  --no-preprocess              Send the original page images (env GEMINI_PREPROCESS=0)")
+        print("  --tiles RxC                  Extract dense pages as RxC overlapping tiles and stitch them (e.g. 2x2)")
         print("\nOptions for extract-all:")
         print("  --force                      Reprocess all images (ignore cache)")
         print("  --retry-failed               Retry only previously failed images")
+        print(f"  --workers N                  Pages extracted concurrently (default {EXTRACT_WORKERS}, env GEMINI_WORKERS)")
+        print(f"  --rpm N                      Max requests per minute across workers (default {REQUESTS_PER_MINUTE:g}, env GEMINI_RPM)")
         sys.exit(1)
     
     command = sys.argv[1]
@@ -477,7 +703,9 @@ if __name__ == "__main__":
             print("Usage: python gemini_dag_extractor.py extract-single <image_path>")
             sys.exit(1)
         image_path = Path(sys.argv[2])
-        extract_single_image(image_path)
+        tiles = parse_tiles(sys.argv[sys.argv.index("--tiles") + 1]) if "--tiles" in sys.argv else None
+        extract_single_image(image_path, preprocess=PREPROCESS_IMAGES and "--no-preprocess" not in sys.argv,
+                             tiles=tiles)
     
     elif command == "extract-all":
         force_reprocess = "--force" in sys.argv
@@ -496,7 +724,11 @@ if __name__ == "__main__":
             else:
                 print(f"Retrying {len(failed_images)} failed images...")
         
-        extract_all_images(force_reprocess=force_reprocess)
+        workers = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else EXTRACT_WORKERS
+        rpm = float(sys.argv[sys.argv.index("--rpm") + 1]) if "--rpm" in sys.argv else None
+        tiles = parse_tiles(sys.argv[sys.argv.index("--tiles") + 1]) if "--tiles" in sys.argv else None
+        extract_all_images(force_reprocess=force_reprocess, workers=workers, requests_per_minute=rpm,
+                           preprocess=PREPROCESS_IMAGES and "--no-preprocess" not in sys.argv, tiles=tiles)
     
     else:
         print(f"Unknown command: {command}")
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Guideline Page Preprocessing for DAG Extraction
+
+Shrinks NCCN guideline page images before they are sent to Gemini
+(gemini_dag_extractor.py):
+
+1. Grayscale: the pages are black text and lines on white; color adds bytes only
+2. Chrome: crop the print stamp, blank the NCCN logo and index links in the
+   header band (keeping the guideline title, the DAG's image_title) and blank
+   the copyright footer line, keeping the tree ID in the lower right corner
+   (the DAG's tree_id)
+3. Margins: crop to the content bounding box plus a little padding
+4. Resolution: scale down to the smallest 768px tile grid Gemini bills for,
+   but never below MIN_SCALE so small text and footnote superscripts stay legible
+
+Chrome positions are fractions of the page size, measured on the NCCN PDF
+renders in data/decision_trees/new/<disease>/images (1650x1275).
+
+split_tiles cuts the same cleaned page (or, without preprocessing, the
+original page) into an overlapping grid of tiles for tiled extraction of
+dense pages. Tiles keep the full render resolution: they exist to make
+small text on dense pages easier to read. Each grid's tile boxes are saved
+next to its tiles, so a cached grid is returned without opening the page.
+
+Results are cached in PREPROCESS_DIR by source content hash and
+PREPROCESS_VERSION, so a page is only reprocessed when it or the settings
+change. Requires Pillow (optional: without it pages are sent unprocessed).
+
+Usage:
+    python image_preprocess.py report [image_dir]    Bytes/estimated tokens before and after
+    python image_preprocess.py preprocess <image>    Write one preprocessed page and print its size
+"""
+
+import io
+import json
+import math
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from trial_manifest import get_file_hash
+
+
+PREPROCESS_DIR = Path(__file__).parent / "data" / "decision_trees" / "preprocessed"
+
+# Chrome, as fractions of page height/width
+HEADER_FRACTION = 0.03           # "Printed by ..." stamp in the top ~2%
+TITLE_BAND_FRACTION = 0.125      # Logo/title/index band, down to just above the blue rule at ~13%
+TITLE_LEFT_FRACTION = 0.23       # ... the guideline title starts right of the logo
+TITLE_RIGHT_FRACTION = 0.80      # ... and ends left of the index links
+FOOTER_FRACTION = 0.045          # Copyright line sits in the bottom ~4%
+FOOTER_KEEP_RIGHT_FRACTION = 0.12  # ... left of the tree ID (e.g. NSCL-4) in the corner
+
+INK_THRESHOLD = 200              # Gray levels darker than this count as content
+MARGIN_PADDING = 8               # Pixels kept around the content bounding box
+
+# Gemini bills images by 768x768 tile, 258 tokens each (258 total if both sides <= 384)
+TILE_SIZE = 768
+TOKENS_PER_TILE = 258
+MIN_SCALE = 0.8                  # Smallest downscale that keeps ~10px footnote text legible
+JPEG_QUALITY = 85
+TILE_OVERLAP = 0.15              # Fraction of a tile shared with each neighbour (tiled extraction)
+
+# Bump when any setting above changes, so cached pages are rebuilt
+PREPROCESS_VERSION = 2
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Gemini's image token count for a width x height input."""
+    if width <= 384 and height <= 384:
+        return TOKENS_PER_TILE
+    return math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE) * TOKENS_PER_TILE
+
+
+def target_scale(width: int, height: int) -> float:
+    """
+    Largest scale <= 1 that reaches the fewest 768px tiles without going
+    below MIN_SCALE.
+    """
+    best_tiles, best_scale = math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE), 1.0
+    for cols in range(1, math.ceil(width / TILE_SIZE) + 1):
+        for rows in range(1, math.ceil(height / TILE_SIZE) + 1):
+            scale = min(cols * TILE_SIZE / width, rows * TILE_SIZE / height, 1.0)
+            if scale >= MIN_SCALE and (cols * rows, -scale) < (best_tiles, -best_scale):
+                best_tiles, best_scale = cols * rows, scale
+    return best_scale
+
+
+def _rescale(page: "Image.Image") -> "Image.Image":
+    scale = target_scale(*page.size)
+    if scale < 1.0:
+        page = page.resize((int(page.width * scale), int(page.height * scale)), Image.LANCZOS)
+    return page
+
+
+def preprocess_page(image: "Image.Image", rescale: bool = True) -> "Image.Image":
+    """Grayscale, chrome-cropped, margin-cropped and (with rescale) rescaled copy of a page."""
+    page = image.convert("L")
+    width, height = page.size
+
+    # Blank the copyright footer (left of the tree ID) and the logo and index
+    # links either side of the title, then drop the print stamp
+    footer_top = int(height * (1 - FOOTER_FRACTION))
+    page.paste(255, (0, footer_top, int(width * (1 - FOOTER_KEEP_RIGHT_FRACTION)), height))
+    band_bottom = int(height * TITLE_BAND_FRACTION)
+    page.paste(255, (0, 0, int(width * TITLE_LEFT_FRACTION), band_bottom))
+    page.paste(255, (int(width * TITLE_RIGHT_FRACTION), 0, width, band_bottom))
+    page = page.crop((0, int(height * HEADER_FRACTION), width, height))
+
+    # Crop to content
+    bbox = page.point(lambda p: 255 if p < INK_THRESHOLD else 0).getbbox()
+    if bbox:
+        left, top, right, bottom = bbox
+        page = page.crop((max(left - MARGIN_PADDING, 0), max(top - MARGIN_PADDING, 0),
+                          min(right + MARGIN_PADDING, page.width), min(bottom + MARGIN_PADDING, page.height)))
+
+    return _rescale(page) if rescale else page
+
+
+def _encode(page: "Image.Image") -> bytes:
+    buffer = io.BytesIO()
+    page.save(buffer, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def preprocessed_path(source_hash: str, cache_dir: Path = PREPROCESS_DIR) -> Path:
+    return cache_dir / f"{source_hash}.v{PREPROCESS_VERSION}.jpg"
+
+
+def _write(out_path: Path, data: bytes):
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    # Unique temp name: extract-all workers may build the same page at once
+    tmp_path = out_path.with_suffix(f".{os.getpid()}.{id(data)}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, out_path)
+
+
+def _source_hash(image_path: Path, source_hash: Optional[str]) -> str:
+    if Image is None:
+        raise RuntimeError("Preprocessing guideline images requires the Pillow package")
+    return source_hash or get_file_hash(image_path)
+
+
+def preprocess_image(image_path: Path, source_hash: Optional[str] = None,
+                     cache_dir: Path = PREPROCESS_DIR) -> Path:
+    """
+    Path of the preprocessed copy of image_path, building it on a cache miss.
+    source_hash is the SHA-256 of image_path's contents (computed if not given).
+    """
+    out_path = preprocessed_path(_source_hash(image_path, source_hash), cache_dir)
+    if not out_path.exists():
+        with Image.open(image_path) as image:
+            _write(out_path, _encode(preprocess_page(image)))
+    return out_path
+
+
+def tile_boxes(width: int, height: int, rows: int, cols: int,
+               overlap: float = TILE_OVERLAP) -> List[Tuple[int, int, int, int]]:
+    """Row-major (left, top, right, bottom) boxes of an overlapping rows x cols grid."""
+    def spans(length: int, count: int) -> List[Tuple[int, int]]:
+        # count tiles of size t, each sharing overlap * t with the next, cover length
+        size = length / (count - (count - 1) * overlap)
+        step = size * (1 - overlap)
+        return [(int(i * step), min(length, int(i * step + size + 0.5))) for i in range(count)]
+    return [(left, top, right, bottom) for top, bottom in spans(height, rows) for left, right in spans(width, cols)]
+
+
+def split_tiles(image_path: Path, rows: int, cols: int, source_hash: Optional[str] = None,
+                overlap: float = TILE_OVERLAP, cache_dir: Path = PREPROCESS_DIR, preprocess: bool = True
+                ) -> List[Tuple[Path, Tuple[int, int, int, int]]]:
+    """
+    Row-major [(tile path, box on the page), ...] for the overlapping
+    full-resolution tiles of image_path, building them on a cache miss.
+    With preprocess the tiles (and boxes) are of the cleaned page
+    (preprocess_page without rescaling), otherwise of the original page.
+    """
+    source_hash = _source_hash(image_path, source_hash)
+    stem = preprocessed_path(source_hash, cache_dir).stem if preprocess else f"{source_hash}.original"
+    grid = f"{stem}.{rows}x{cols}-{overlap:g}"
+    paths = [cache_dir / f"{grid}.tile{i + 1}.jpg" for i in range(rows * cols)]
+    boxes_path = cache_dir / f"{grid}.boxes.json"
+
+    # The boxes file is written last, so it marks a complete grid
+    if boxes_path.exists() and all(path.exists() for path in paths):
+        with open(boxes_path, "r") as f:
+            return [(path, tuple(box)) for path, box in zip(paths, json.load(f))]
+
+    with Image.open(image_path) as image:
+        page = preprocess_page(image, rescale=False) if preprocess else image.convert("RGB")
+    boxes = tile_boxes(page.width, page.height, rows, cols, overlap)
+    for path, box in zip(paths, boxes):
+        if not path.exists():
+            _write(path, _encode(page.crop(box)))
+    _write(boxes_path, json.dumps(boxes).encode("utf-8"))
+    return list(zip(paths, boxes))
+
+
+def image_stats(image_path: Path) -> Tuple[int, int, int, int]:
+    """(bytes, width, height, estimated tokens) of an image file."""
+    with Image.open(image_path) as image:
+        width, height = image.size
+    return os.path.getsize(image_path), width, height, estimate_image_tokens(width, height)
+
+
+def savings_report(image_paths: Iterable[Path], cache_dir: Path = PREPROCESS_DIR) -> Dict[str, Dict[str, int]]:
+    """Total bytes and estimated tokens of the original and preprocessed pages."""
+    report = {name: {"images": 0, "bytes": 0, "tokens": 0} for name in ("original", "preprocessed")}
+    for image_path in image_paths:
+        for name, path in (("original", image_path), ("preprocessed", preprocess_image(image_path, cache_dir=cache_dir))):
+            size, _, _, tokens = image_stats(path)
+            totals = report[name]
+            totals["images"] += 1
+            totals["bytes"] += size
+            totals["tokens"] += tokens
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("report", "preprocess"):
+        print("Usage: python image_preprocess.py report [image_dir]")
+        print("       python image_preprocess.py preprocess <image>")
+        sys.exit(1)
+
+    if sys.argv[1] == "preprocess":
+        if len(sys.argv) < 3:
+            print("Usage: python image_preprocess.py preprocess <image>")
+            sys.exit(1)
+        source = Path(sys.argv[2])
+        out_path = preprocess_image(source)
+        for label, path in (("original", source), ("preprocessed", out_path)):
+            size, width, height, tokens = image_stats(path)
+            print(f"{label:<13}{width:>5}x{height:<5}{size:>11,} bytes{tokens:>7,} tokens  {path}")
+        sys.exit(0)
+
+    image_dir = (Path(sys.argv[2]) if len(sys.argv) > 2
+                 else Path(__file__).parent / "data" / "decision_trees" / "new" / "nsclc" / "images")
+    image_paths = sorted(image_dir.glob("*.jpg"))
+    print(f"Preprocessing {len(image_paths)} pages in {image_dir}...")
+    report = savings_report(image_paths)
+    base = report["original"]
+    print(f"\n{'':<14}{'images':>8}{'bytes':>14}{'vs orig':>9}{'est. tokens':>13}{'vs orig':>9}{'per page':>10}")
+    for name, totals in report.items():
+        per_page = totals["tokens"] // max(totals["images"], 1)
+        bytes_change = totals["bytes"] / base["bytes"] - 1 if base["bytes"] else 0
+        tokens_change = totals["tokens"] / base["tokens"] - 1 if base["tokens"] else 0
+        print(f"{name:<14}{totals['images']:>8}{totals['bytes']:>14,}{bytes_change:>9.0%}"
+              f"{totals['tokens']:>13,}{tokens_change:>9.0%}{per_page:>10,}")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Compiled Multi-Keyword Matcher
+
+Compiles a {canonical_label: [keywords, ...]} dictionary into one regex so a
+single scan of the text returns every matched label.
+
+- Keywords are folded into a trie before compiling, so each text position
+  costs O(keyword length) rather than O(dictionary size)
+- Matches respect word boundaries (no alphanumeric character on either
+  side), replacing the old ' os ' / 'os(' whitespace hacks
+- Overlapping keywords are all reported: "objective response rate" yields
+  both ORR and RR
+- Keywords of PLURAL_MIN_CHARS or more also match with a trailing "s"
+  ("response rates"); shorter abbreviations don't, since their plurals
+  collide with other abbreviations (CR -> CRS), so list those explicitly
+- A keyword starting with "*" also matches as the end of a longer word
+  ("*toxicity" matches "neurotoxicity")
+- Excluded keywords match but report no label, masking the shorter keywords
+  they start with ("ttf-1", thyroid transcription factor 1, is not TTF)
+"""
+
+import re
+from typing import Dict, Iterable, List, Set
+
+
+# Characters that count as part of a word when checking boundaries
+_WORD_CHARS = "a-z0-9"
+
+# Shortest keyword that also matches its plural
+PLURAL_MIN_CHARS = 4
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Build a regex alternation shaped like a trie of the given words."""
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: Dict) -> str:
+        is_end = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch != ""]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not is_end:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        # Greedy '?' prefers the longer keyword; shorter ones are recovered via _implied
+        return group + "?" if is_end else group
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """Match every canonical label whose keywords occur in a text, in one pass."""
+
+    def __init__(self, keyword_dict: Dict[str, Iterable[str]], exclude: Iterable[str] = ()):
+        self._labels: Dict[str, Set[str]] = {}
+        self._suffix_labels: Dict[str, Set[str]] = {}
+        for label, keywords in keyword_dict.items():
+            for keyword in keywords:
+                keyword = keyword.strip().lower()
+                target = self._labels
+                if keyword.startswith("*"):
+                    keyword, target = keyword[1:], self._suffix_labels
+                if not keyword:
+                    continue
+                target.setdefault(keyword, set()).add(label)
+                if len(keyword) >= PLURAL_MIN_CHARS and keyword[-1].isalpha() and keyword[-1] != "s":
+                    target.setdefault(keyword + "s", set()).add(label)
+        excluded = {keyword.strip().lower() for keyword in exclude} - {""}
+        for keyword in excluded:
+            self._labels.setdefault(keyword, set())
+
+        # A match only reports the longest keyword at each start position, so
+        # precompute the labels of every shorter keyword that is a
+        # word-bounded prefix of it (e.g. "adverse events" -> "adverse event")
+        self._implied: Dict[str, Set[str]] = {}
+        for keyword in self._labels:
+            labels = set()
+            for i in range(1, len(keyword) + 1):
+                prefix = keyword[:i]
+                if prefix in self._labels and (
+                    i == len(keyword) or not keyword[i].isalnum() or not keyword[i - 1].isalnum()
+                ):
+                    labels |= self._labels[prefix]
+            self._implied[keyword] = set() if keyword in excluded else labels
+
+        alternatives = []
+        if self._labels:
+            alternatives.append(rf"(?P<keyword>{_trie_pattern(self._labels)})(?![{_WORD_CHARS}])")
+        if self._suffix_labels:
+            # Suffix keywords may follow any word characters; tried when no whole keyword matches here
+            alternatives.append(rf"[{_WORD_CHARS}]*?(?P<suffix>{_trie_pattern(self._suffix_labels)})(?![{_WORD_CHARS}])")
+        if alternatives:
+            # Zero-width lookahead so overlapping matches at later positions are still found
+            self._pattern = re.compile(rf"(?<![{_WORD_CHARS}])(?=" + "|".join(alternatives) + ")")
+        else:
+            self._pattern = None
+
+    def labels(self, text: str) -> Set[str]:
+        """Return every canonical label with a keyword present in text."""
+        found: Set[str] = set()
+        if not text or self._pattern is None:
+            return found
+        for match in self._pattern.finditer(text.lower()):
+            found |= self._match_labels(match)
+        return found
+
+    def _match_labels(self, match: "re.Match") -> Set[str]:
+        if match.lastgroup == "suffix":
+            return self._suffix_labels[match.group("suffix")]
+        return self._implied[match.group("keyword")]
+
+    def matches(self, text: str) -> bool:
+        """True if any (non-excluded) keyword occurs in text."""
+        if not text or self._pattern is None:
+            return False
+        return any(self._match_labels(match) for match in self._pattern.finditer(text.lower()))
+
+    def keywords(self) -> List[str]:
+        """All compiled keywords (lowercased; suffix keywords keep their "*")."""
+        return sorted(list(self._labels) + ["*" + suffix for suffix in self._suffix_labels])
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Precomputed Node → Trial Match Table
+
+Matches every node of every NSCLC DAG page against the local trial corpus
+(via the trial_search BM25 index) and writes one static artifact the
+frontend can paint the Research View heatmap from, instead of firing
+ClinicalTrials.gov requests per node.
+
+Counts follow the live ClinicalTrials.gov fallback in app.js
+(fetchTrialPhaseBreakdown): the query carries the tree's disease context,
+only RECRUITING trials are counted, and total is p1 + p2 + p3 (a PHASE1/
+PHASE2 trial counts in both). statuses is the breakdown of every matching
+trial before the status filter; nct_ids are the counted trials.
+
+Output (node_trial_matches.json, generated - not checked in):
+{
+  "version": 2,
+  "generated": "...",
+  "corpus_size": 558,
+  "counted_statuses": ["RECRUITING"],
+  "trees": {
+    "<tree_id>": {
+      "file": "nscl_page-0030.dag.json",
+      "nodes": {
+        "node_003": {"query": "... NSCLC", "total": 12,
+                     "phases": {"PHASE1": 2, "PHASE2": 5, "PHASE3": 5},
+                     "statuses": {"RECRUITING": 10, "COMPLETED": 9, ...},
+                     "nct_ids": ["NCT...", ...]}
+      }
+    }
+  }
+}
+
+Usage:
+    python node_trial_matches.py [--rebuild-index] [--all-statuses]
+
+--all-statuses counts trials of every status, for corpora (like the
+bundled snapshot) with few or no recruiting trials.
+"""
+
+import json
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from trial_search import DEFAULT_INDEX_PATH, TrialSearchIndex, build_index, save_index
+from trial_store import iter_trials
+
+
+DAG_DIR = Path(__file__).parent / "data" / "decision_trees" / "new" / "nsclc" / "json"
+OUTPUT_PATH = Path(__file__).parent / "data" / "decision_trees" / "new" / "nsclc" / "node_trial_matches.json"
+
+# Same priority terms as sanitizeSearchTerm in app.js
+PRIORITY_TERMS = [
+    'therapy', 'chemotherapy', 'radiation', 'surgery', 'resection',
+    'pembrolizumab', 'carboplatin', 'cisplatin', 'docetaxel', 'nivolumab', 'atezolizumab',
+    'osimertinib', 'erlotinib', 'pemetrexed', 'stage', 'egfr', 'alk', 'mutation',
+]
+
+MAX_QUERY_WORDS = 4
+
+# Same as TREES[treeId].disease (dag_loader.js) and filter.overallStatus in app.js
+DISEASE_CONTEXT = "NSCLC"
+COUNTED_STATUSES = ["RECRUITING"]
+COUNTED_PHASES = ["PHASE1", "PHASE2", "PHASE3"]
+
+
+def tree_id_for(filename: str, dag_data: Dict[str, Any]) -> str:
+    """Tree ID the frontend uses (mirrors dag_loader.js loadDAGFile)."""
+    if dag_data.get("tree_id"):
+        return dag_data["tree_id"]
+    match = re.search(r"nscl_page-(\d+)", filename)
+    if match:
+        return f"NSCLC_{match.group(1)}"
+    return filename.replace(".dag.json", "")
+
+
+def node_search_term(content: str) -> Optional[str]:
+    """First line of the node, bullets collapsed (mirrors extractSearchTerm)."""
+    if not content:
+        return None
+    cleaned = re.sub(r"[•\s]+", " ", content.split("\n")[0]).strip()
+    if cleaned in ("Treatment", "Evaluation", "Options", "Initial Presentation") or len(cleaned) < 3:
+        return None
+    return cleaned
+
+
+def sanitize_search_term(term: str) -> str:
+    """Keep the 3-4 most useful words (mirrors sanitizeSearchTerm in app.js)."""
+    sanitized = re.sub(r"\([^)]*\)", "", term)
+    sanitized = re.sub(r"\s+(or|and|if|after|before|with|without)\s+", " ", sanitized, flags=re.IGNORECASE)
+    sanitized = re.sub(r"[,;:+]", " ", sanitized)
+    sanitized = re.sub(r"\s+", " ", sanitized).strip()
+
+    words = [w for w in sanitized.split(" ") if len(w) > 2]
+    prioritized = [w for w in words if any(t in w.lower() for t in PRIORITY_TERMS)]
+    others = [w for w in words if not any(t in w.lower() for t in PRIORITY_TERMS)]
+    return " ".join((prioritized + others)[:MAX_QUERY_WORDS])
+
+
+def node_query(content: str, page_keywords: List[str]) -> Optional[str]:
+    """
+    Build the corpus query for a node: its sanitized search term plus any
+    page-level keywords (drugs, biomarkers) that the node itself mentions,
+    then the disease context (as app.js appends it).
+    """
+    term = node_search_term(content)
+    if not term:
+        return None
+    query = sanitize_search_term(term)
+    lower_content = content.lower()
+    query_lower = query.lower()
+    extra = [kw for kw in page_keywords if kw.lower() in lower_content and kw.lower() not in query_lower]
+    query = " ".join([query] + extra).strip()
+    return f"{query} {DISEASE_CONTEXT}" if query else None
+
+
+def node_matches(search_index: TrialSearchIndex, query: str,
+                 statuses: Optional[List[str]] = COUNTED_STATUSES) -> Dict[str, Any]:
+    """Phase counts of the trials matching query (statuses=None counts every status)."""
+    response = search_index.search(query, limit=len(search_index), statuses=statuses)
+    phases = {phase: sum(1 for r in response["results"] if phase in r["phases"]) for phase in COUNTED_PHASES}
+    return {
+        "query": query,
+        "total": sum(phases.values()),
+        "phases": phases,
+        "statuses": response["facets"]["status"],
+        "nct_ids": [r["nct_id"] for r in response["results"]],
+    }
+
+
+def build_match_table(search_index: TrialSearchIndex, dag_dir: Path = DAG_DIR,
+                      statuses: Optional[List[str]] = COUNTED_STATUSES) -> Dict[str, Any]:
+    """Match all nodes in all DAG pages against the index."""
+    trees: Dict[str, Any] = {}
+
+    for dag_file in sorted(dag_dir.glob("*.dag.json")):
+        with open(dag_file, "r") as f:
+            dag_data = json.load(f)
+
+        page_keywords = dag_data.get("keywords", []) or []
+        nodes = {}
+        for node in dag_data.get("nodes", []):
+            query = node_query(node.get("content", ""), page_keywords)
+            if not query:
+                continue
+            nodes[node["id"]] = node_matches(search_index, query, statuses)
+
+        # Later files win on duplicate tree IDs, same as dag_loader.js
+        trees[tree_id_for(dag_file.name, dag_data)] = {"file": dag_file.name, "nodes": nodes}
+
+    return {
+        "version": 2,
+        "generated": datetime.now().isoformat(),
+        "corpus_size": len(search_index),
+        "counted_statuses": statuses,
+        "trees": trees,
+    }
+
+
+if __name__ == "__main__":
+    if "--rebuild-index" in sys.argv or not DEFAULT_INDEX_PATH.exists():
+        print("Building trial search index...")
+        save_index(build_index(iter_trials()), DEFAULT_INDEX_PATH)
+
+    search_index = TrialSearchIndex.load(DEFAULT_INDEX_PATH)
+    statuses = None if "--all-statuses" in sys.argv else COUNTED_STATUSES
+    print(f"Matching DAG nodes against {len(search_index)} trials "
+          f"({', '.join(statuses) if statuses else 'all statuses'})...")
+    table = build_match_table(search_index, statuses=statuses)
+
+    with open(OUTPUT_PATH, "w") as f:
+        json.dump(table, f, separators=(",", ":"))
+
+    node_count = sum(len(t["nodes"]) for t in table["trees"].values())
+    matched = sum(1 for t in table["trees"].values() for n in t["nodes"].values() if n["total"] > 0)
+    print(f"✓ {len(table['trees'])} trees, {node_count} nodes ({matched} with matching trials)")
+    print(f"✓ Match table written to {OUTPUT_PATH} ({OUTPUT_PATH.stat().st_size / 1e3:.0f} KB)")
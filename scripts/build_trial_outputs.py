@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Build every trial output in a single pass over ctg-studies.
+Each trial is parsed once and fed to all registered sinks:
+- Summary CSV (generate_trials_csv.summary_row)
+- Outcomes CSV (analyze_outcomes.outcome_row)
+- Pruned LLM payloads (trial_prune.prune_trial_json)
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from trial_engine import JsonlSink, RowSink, run_engine
+from trial_prune import prune_trial_json
+from trial_store import iter_trials
+
+from analyze_outcomes import outcome_row, write_outcomes_csv
+from generate_trials_csv import summary_row, write_summary_csv
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DATA_DIR = REPO_ROOT / "data" / "ctg-studies"
+SCRIPTS_DIR = REPO_ROOT / "scripts"
+
+
+def build_sinks(output_dir: Path = SCRIPTS_DIR) -> list:
+    """Register the default outputs. New outputs plug in here as extra sinks."""
+    return [
+        RowSink("summary", output_dir / "clinical_trials_summary.csv", summary_row, write_summary_csv),
+        RowSink("outcomes", output_dir / "trial_outcomes_summary.csv", outcome_row, write_outcomes_csv),
+        JsonlSink("pruned", output_dir / "pruned_trials.jsonl", prune_trial_json),
+    ]
+
+
+def main():
+    print(f"Processing trials from {DATA_DIR}...")
+    sinks = build_sinks()
+    errors = run_engine(iter_trials(DATA_DIR), sinks)
+
+    for sink_name, trial_id, error in errors:
+        print(f"Error in {sink_name} for {trial_id}: {error}")
+
+    print(f"\n✓ Built {len(sinks)} outputs in one pass ({len(errors)} errors)")
+
+
+if __name__ == '__main__':
+    main()
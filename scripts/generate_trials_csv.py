@@ -4,19 +4,25 @@ Generate a comprehensive CSV table of clinical trials data from ctg-studies.
 Includes trial metadata, outcomes, design info, and other useful information.
 """
 
-import json
 import os
 import csv
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 from collections import defaultdict
 
-# Keywords that indicate safety/adverse event measures
-SAFETY_KEYWORDS = {
-    'trae', 'sae', 'adverse event', 'adverse events', 'ae ', ' ae(',
-    'discontinuation', 'toxicity', 'adverse reaction', 'immune-mediated'
-}
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from trial_store import STORE_COLUMNS, iter_trials, list_trial_ids, load_trial, load_trial_file, open_store
+from trial_manifest import print_update_stats, update_rows
+from trial_download import clear_changed_ids, last_changed_ids
+from trial_engine import STANDARD_OUTCOMES, TrialRecord
+from keyword_matcher import KeywordMatcher
+from trial_projection import Field, compile_projection
+
+# Bump when extract_trial_data changes so cached manifest rows are rebuilt
+EXTRACTOR_VERSION = "2"
 
 # Common biomarkers and their keywords
 BIOMARKER_KEYWORDS = {
@@ -27,7 +33,7 @@ BIOMARKER_KEYWORDS = {
     'BRAF': ['braf'],
     'PD-L1': ['pd-l1', 'pd-1'],
     'MSI': ['msi', 'microsatellite instability'],
-    'TMB': ['tmb', 'tumor mutational burden'],
+    'TMB': ['tmb', 'btmb', 'ttmb', 'tumor mutational burden'],  # bTMB/tTMB: blood/tissue TMB
     'ROS1': ['ros1'],
     'MET': ['met exon'],
     'NTRK': ['ntrk'],
@@ -73,373 +79,244 @@ DRUG_KEYWORDS = {
     'Rucaparib': ['rucaparib', 'rubraca'],
 }
 
-# Standard oncology outcome metrics
-STANDARD_OUTCOMES = {
-    'OS': ['overall survival', ' os ', ' os(', ' os)', 'os '],
-    'PFS': ['progression-free survival', ' pfs ', ' pfs)', 'pfs ', 'progression free survival'],
-    'DFS': ['disease-free survival', ' dfs ', ' dfs)', 'dfs ', 'disease free survival'],
-    'RR': ['response rate', ' rr ', ' rr('],
-    'ORR': ['objective response rate', ' orr ', ' orr)', 'orr ', ' orr('],
-    'TTP': ['time to progression', ' ttp ', ' ttp)', 'ttp '],
-    'TTF': ['time to treatment failure', ' ttf ', ' ttf)', 'ttf '],
-    'EFS': ['event-free survival', ' efs ', ' efs)', 'efs '],
-    'LRFS': ['locoregional recurrence-free survival', ' lrfs ', ' lrfs)', 'lrfs '],
-    'DMFS': ['distant metastasis-free survival', ' dmfs ', ' dmfs)', 'dmfs '],
-    'CR': ['complete response', ' cr ', ' cr)', ' cr('],
-    'PR': ['partial response', ' pr ', ' pr)', ' pr('],
-    'DoR': ['duration of response', ' dor ', ' dor)', 'dor '],
-    'CBR': ['clinical benefit rate', ' cbr ', ' cbr)', 'cbr '],
-    'TOX': ['toxicity', 'safety', 'adverse events', ' ae'],
-    'QOL': ['quality of life', ' qol ', 'qol '],
-}
+# Compiled once at import; each returns all matched standard names from a single scan
+BIOMARKER_MATCHER = KeywordMatcher(BIOMARKER_KEYWORDS)
+DRUG_MATCHER = KeywordMatcher(DRUG_KEYWORDS)
 
 
-def normalize_text(text: str) -> str:
-    """Normalize text for comparison."""
-    if not text:
-        return ""
-    return text.lower().strip()
+def extract_keywords_from_text(text: str, matcher: KeywordMatcher) -> Set[str]:
+    """Extract standard names whose keywords appear (word-bounded) in text."""
+    return matcher.labels(text)
 
 
-def extract_keywords_from_text(text: str, keyword_dict: Dict[str, List[str]]) -> Set[str]:
-    """Extract keywords from text based on a keyword dictionary."""
-    if not text:
-        return set()
-    
-    normalized_text = normalize_text(text)
-    found_keywords = set()
-    
-    for standard_name, keywords in keyword_dict.items():
-        for keyword in keywords:
-            if keyword in normalized_text:
-                found_keywords.add(standard_name)
-                break  # Found this keyword, move to next standard name
-    
-    return found_keywords
+# ============================================================================
+# Field Projections
+# ============================================================================
 
+def _join(values: List[str]) -> str:
+    return ' '.join(values)
 
-def extract_biomarkers(trial_data: Dict) -> str:
-    """Extract biomarkers mentioned in trial."""
-    text_sources = []
-    
-    # Collect text from various sources
-    if 'protocolSection' in trial_data:
-        protocol = trial_data['protocolSection']
-        
-        # From title and description
-        if 'identificationModule' in protocol:
-            id_module = protocol['identificationModule']
-            text_sources.append(id_module.get('briefTitle', ''))
-            text_sources.append(id_module.get('officialTitle', ''))
-        
-        # From conditions
-        if 'conditionsModule' in protocol:
-            conditions = protocol['conditionsModule'].get('conditions', [])
-            text_sources.extend(conditions)
-        
-        # From eligibility criteria
-        if 'eligibilityModule' in protocol:
-            text_sources.append(protocol['eligibilityModule'].get('eligibilityCriteria', ''))
-        
-        # From outcomes
-        if 'outcomesModule' in protocol:
-            outcomes_module = protocol['outcomesModule']
-            for outcome in outcomes_module.get('primaryOutcomes', []):
-                text_sources.append(outcome.get('measure', ''))
-            for outcome in outcomes_module.get('secondaryOutcomes', []):
-                text_sources.append(outcome.get('measure', ''))
-    
-    combined_text = ' '.join(text_sources)
-    biomarkers = extract_keywords_from_text(combined_text, BIOMARKER_KEYWORDS)
-    
-    return '; '.join(sorted(biomarkers)) if biomarkers else ""
 
-
-def extract_drugs(trial_data: Dict) -> str:
-    """Extract drugs mentioned in trial."""
-    text_sources = []
-    
-    # Collect text from various sources
-    if 'protocolSection' in trial_data:
-        protocol = trial_data['protocolSection']
-        
-        # From title and description
-        if 'identificationModule' in protocol:
-            id_module = protocol['identificationModule']
-            text_sources.append(id_module.get('briefTitle', ''))
-            text_sources.append(id_module.get('officialTitle', ''))
-        
-        # From interventions
-        if 'armsInterventionsModule' in protocol:
-            arms_module = protocol['armsInterventionsModule']
-            for intervention in arms_module.get('interventions', []):
-                text_sources.append(intervention.get('name', ''))
-                text_sources.append(intervention.get('description', ''))
-        
-        # From conditions (sometimes mentions drugs)
-        if 'conditionsModule' in protocol:
-            conditions = protocol['conditionsModule'].get('conditions', [])
-            text_sources.extend(conditions)
-    
-    combined_text = ' '.join(text_sources)
-    drugs = extract_keywords_from_text(combined_text, DRUG_KEYWORDS)
-    
-    return '; '.join(sorted(drugs)) if drugs else ""
+def _intervention_types(interventions: List[Dict]) -> str:
+    return '; '.join(sorted({i['type'] for i in interventions if i.get('type')}))
 
 
-def is_safety_measure(text: str) -> bool:
-    """Check if a measure is a safety/adverse event measure."""
-    if not text:
-        return False
-    normalized = normalize_text(text)
-    for keyword in SAFETY_KEYWORDS:
-        if keyword in normalized:
-            return True
-    return False
+def _list_count(key: str):
+    return lambda module: len(module.get(key, []))
 
 
-def format_outcome_measure(outcome: Dict) -> str:
-    """Format a single outcome measure with available data."""
-    title = outcome.get('title', '')
-    param_type = outcome.get('paramType', '')
-    unit = outcome.get('unitOfMeasure', '')
-    
-    # Try to get the first measurement value if available
-    value_str = ""
-    
-    if 'classes' in outcome and outcome['classes']:
-        if 'categories' in outcome['classes'][0] and outcome['classes'][0]['categories']:
-            cat = outcome['classes'][0]['categories'][0]
-            if 'measurements' in cat and cat['measurements']:
-                m = cat['measurements'][0]
-                value = m.get('value', '')
-                lower = m.get('lowerLimit', '')
-                upper = m.get('upperLimit', '')
-                
-                if value and value.strip().upper() != 'NA':
-                    if lower and upper and lower.strip().upper() != 'NA' and upper.strip().upper() != 'NA':
-                        value_str = f"{value} [{lower}-{upper}]"
-                    else:
-                        value_str = f"{value}"
-    
-    if not value_str:
-        return ""
-    
-    parts = [title]
-    if param_type:
-        parts.append(f"({param_type})")
-    if unit:
-        parts.append(unit)
-    parts.append(f"= {value_str}")
-    
-    return " ".join(parts)
+# Text searched for biomarker keywords
+BIOMARKER_TEXT = compile_projection({
+    'brief_title': 'protocolSection.identificationModule.briefTitle',
+    'official_title': 'protocolSection.identificationModule.officialTitle',
+    'conditions': Field('protocolSection.conditionsModule.conditions', _join),
+    'eligibility': 'protocolSection.eligibilityModule.eligibilityCriteria',
+    'primary_measures': Field('protocolSection.outcomesModule.primaryOutcomes.*.measure', _join),
+    'secondary_measures': Field('protocolSection.outcomesModule.secondaryOutcomes.*.measure', _join),
+}, 'biomarker_text')
 
+# Text searched for drug keywords (conditions sometimes mention drugs)
+DRUG_TEXT = compile_projection({
+    'brief_title': 'protocolSection.identificationModule.briefTitle',
+    'official_title': 'protocolSection.identificationModule.officialTitle',
+    'intervention_names': Field('protocolSection.armsInterventionsModule.interventions.*.name', _join),
+    'intervention_descriptions': Field('protocolSection.armsInterventionsModule.interventions.*.description', _join),
+    'conditions': Field('protocolSection.conditionsModule.conditions', _join),
+}, 'drug_text')
 
-def extract_outcomes_from_trial(trial_data: Dict) -> Tuple[List[str], List[str]]:
-    """Extract primary and secondary outcome measures from trial data."""
-    primary = []
-    secondary = []
-    
-    # Try resultsSection first
-    if 'resultsSection' in trial_data:
-        if 'outcomeMeasuresModule' in trial_data['resultsSection']:
-            om = trial_data['resultsSection']['outcomeMeasuresModule']
-            if 'outcomeMeasures' in om:
-                for outcome in om['outcomeMeasures']:
-                    measure_text = format_outcome_measure(outcome)
-                    outcome_type = outcome.get('type', '').upper()
-                    if outcome_type == 'PRIMARY':
-                        primary.append(measure_text)
-                    elif outcome_type == 'SECONDARY':
-                        secondary.append(measure_text)
-    
-    # Fall back to protocolSection
-    if not primary and not secondary:
-        if 'protocolSection' in trial_data:
-            if 'outcomesModule' in trial_data['protocolSection']:
-                outcomes = trial_data['protocolSection']['outcomesModule']
-                if 'primaryOutcomes' in outcomes:
-                    primary = [o.get('measure', '') for o in outcomes['primaryOutcomes']]
-                if 'secondaryOutcomes' in outcomes:
-                    secondary = [o.get('measure', '') for o in outcomes['secondaryOutcomes']]
-    
-    return primary, secondary
+# Summary CSV columns read straight from the study JSON
+SUMMARY_PROJECTION = compile_projection({
+    'Title': Field('protocolSection.identificationModule.briefTitle', lambda v: v[:150]),
+    'Official_Title': Field('protocolSection.identificationModule.officialTitle', lambda v: v[:200]),
+    'Organization': Field('protocolSection.identificationModule.organization.fullName', lambda v: v or ''),
+    'Overall_Status': 'protocolSection.statusModule.overallStatus',
+    'Start_Date': Field('protocolSection.statusModule.startDateStruct.date', lambda v: v or ''),
+    'Primary_Completion_Date': Field('protocolSection.statusModule.primaryCompletionDateStruct.date', lambda v: v or ''),
+    'Completion_Date': Field('protocolSection.statusModule.completionDateStruct.date', lambda v: v or ''),
+    'Study_Type': 'protocolSection.designModule.studyType',
+    'Study_Phase': Field('protocolSection.designModule.phases', '; '.join),
+    'Enrollment': 'protocolSection.designModule.enrollment',
+    'Masking': 'protocolSection.designModule.masking',
+    'Allocation': 'protocolSection.designModule.allocation',
+    'Primary_Condition': Field('protocolSection.conditionsModule.conditions', lambda c: c[0][:100] if c else ''),
+    'All_Conditions': Field('protocolSection.conditionsModule.conditions', lambda c: '; '.join(c[:3])),
+    'Condition_Count': Field('protocolSection.conditionsModule', _list_count('conditions')),
+    'Lead_Sponsor': 'protocolSection.sponsorCollaboratorsModule.leadSponsor.name',
+    'Lead_Sponsor_Type': 'protocolSection.sponsorCollaboratorsModule.leadSponsor.class',
+    'Num_Arms': Field('protocolSection.armsInterventionsModule', _list_count('armGroups')),
+    'Num_Interventions': Field('protocolSection.armsInterventionsModule', _list_count('interventions')),
+    'Intervention_Types': Field('protocolSection.armsInterventionsModule.interventions', _intervention_types),
+    'Gender': 'protocolSection.eligibilityModule.gender',
+    'Accepts_Healthy_Volunteers': 'protocolSection.eligibilityModule.acceptsHealthyVolunteers',
+    'Primary_Outcome_Count': Field('protocolSection.outcomesModule', _list_count('primaryOutcomes')),
+    'Secondary_Outcome_Count': Field('protocolSection.outcomesModule', _list_count('secondaryOutcomes')),
+    'Has_Results': Field('hasResults', lambda v: 'Yes' if v else 'No', 'No'),
+}, 'summary_projection')
 
 
-def extract_measures_for_outcome_type(outcome_key: str, primary_outcomes: List[str], secondary_outcomes: List[str]) -> str:
-    """Extract actual measure text that matches a specific outcome type."""
-    keywords = STANDARD_OUTCOMES[outcome_key]
-    matching_measures = []
-    
-    all_outcomes = primary_outcomes + secondary_outcomes
-    for measure in all_outcomes:
-        if not measure:
-            continue
-        
-        if outcome_key != 'TOX' and is_safety_measure(measure):
-            continue
-        
-        if outcome_key == 'TOX' and is_safety_measure(measure) == False:
-            continue
-        
-        normalized = normalize_text(measure)
-        for keyword in keywords:
-            if keyword in normalized:
-                matching_measures.append(measure)
-                break
+def extract_biomarkers(trial_data: Dict) -> str:
+    """Extract biomarkers mentioned in trial."""
+    combined_text = ' '.join(BIOMARKER_TEXT(trial_data).values())
+    biomarkers = extract_keywords_from_text(combined_text, BIOMARKER_MATCHER)
     
-    return '; '.join(matching_measures) if matching_measures else ""
+    return '; '.join(sorted(biomarkers)) if biomarkers else ""
 
 
-def safe_get(d: Dict, *keys):
-    """Safely navigate nested dictionaries."""
-    if not d:
-        return None
-    for key in keys:
-        if isinstance(d, dict) and key in d:
-            d = d[key]
-        else:
-            return None
-    return d
+def extract_drugs(trial_data: Dict) -> str:
+    """Extract drugs mentioned in trial."""
+    combined_text = ' '.join(DRUG_TEXT(trial_data).values())
+    drugs = extract_keywords_from_text(combined_text, DRUG_MATCHER)
+    
+    return '; '.join(sorted(drugs)) if drugs else ""
 
 
 def extract_trial_data(trial_data: Dict, trial_id: str) -> Dict:
     """Extract comprehensive trial data into a dictionary."""
+    return summary_row(TrialRecord(trial_id, trial_data))
+
+
+def summary_row(record: TrialRecord) -> Dict:
+    """Build the summary CSV row for one parsed trial."""
+    trial_data = record.data
     result = {
-        'Trial_ID': trial_id,
+        'Trial_ID': record.trial_id,
     }
     
-    protocol = safe_get(trial_data, 'protocolSection')
-    if not protocol:
+    if not trial_data.get('protocolSection'):
         return result
     
-    # Identification Module
-    id_module = safe_get(protocol, 'identificationModule')
-    if id_module:
-        result['Title'] = id_module.get('briefTitle', '')[:150]
-        result['Official_Title'] = id_module.get('officialTitle', '')[:200]
-        result['Organization'] = safe_get(id_module, 'organization', 'fullName') or ''
-    
-    # Status Module
-    status_module = safe_get(protocol, 'statusModule')
-    if status_module:
-        result['Overall_Status'] = status_module.get('overallStatus', '')
-        result['Start_Date'] = safe_get(status_module, 'startDateStruct', 'date') or ''
-        result['Primary_Completion_Date'] = safe_get(status_module, 'primaryCompletionDateStruct', 'date') or ''
-        result['Completion_Date'] = safe_get(status_module, 'completionDateStruct', 'date') or ''
-    
-    # Design Module
-    design_module = safe_get(protocol, 'designModule')
-    if design_module:
-        result['Study_Type'] = design_module.get('studyType', '')
-        phases = design_module.get('phases', [])
-        result['Study_Phase'] = '; '.join(phases) if phases else ''
-        result['Enrollment'] = design_module.get('enrollment', '')
-        result['Masking'] = design_module.get('masking', '')
-        result['Allocation'] = design_module.get('allocation', '')
-    
-    # Conditions Module
-    conditions_module = safe_get(protocol, 'conditionsModule')
-    if conditions_module:
-        conditions = conditions_module.get('conditions', [])
-        result['Primary_Condition'] = conditions[0][:100] if conditions else ''
-        result['All_Conditions'] = '; '.join(conditions[:3]) if conditions else ''
-        result['Condition_Count'] = len(conditions)
-    
-    # Sponsor/Collaborators Module
-    sponsor_module = safe_get(protocol, 'sponsorCollaboratorsModule')
-    if sponsor_module:
-        lead_sponsor = safe_get(sponsor_module, 'leadSponsor')
-        if lead_sponsor:
-            result['Lead_Sponsor'] = lead_sponsor.get('name', '')
-            result['Lead_Sponsor_Type'] = lead_sponsor.get('class', '')
-    
-    # Arms/Interventions Module
-    arms_module = safe_get(protocol, 'armsInterventionsModule')
-    if arms_module:
-        arm_groups = arms_module.get('armGroups', [])
-        result['Num_Arms'] = len(arm_groups)
-        
-        interventions = arms_module.get('interventions', [])
-        result['Num_Interventions'] = len(interventions)
-        intervention_types = set()
-        for interv in interventions:
-            itype = interv.get('type')
-            if itype:
-                intervention_types.add(itype)
-        result['Intervention_Types'] = '; '.join(sorted(intervention_types))
-    
-    # Eligibility Module
-    eligibility_module = safe_get(protocol, 'eligibilityModule')
-    if eligibility_module:
-        result['Gender'] = eligibility_module.get('gender', '')
-        result['Accepts_Healthy_Volunteers'] = eligibility_module.get('acceptsHealthyVolunteers', '')
-    
-    # Outcomes Module
-    outcomes_module = safe_get(protocol, 'outcomesModule')
-    if outcomes_module:
-        primary_outcomes = outcomes_module.get('primaryOutcomes', [])
-        secondary_outcomes = outcomes_module.get('secondaryOutcomes', [])
-        result['Primary_Outcome_Count'] = len(primary_outcomes)
-        result['Secondary_Outcome_Count'] = len(secondary_outcomes)
+    result.update(SUMMARY_PROJECTION(trial_data))
     
     # Extract actual outcome measures (from results or protocol)
-    primary_outcomes, secondary_outcomes = extract_outcomes_from_trial(trial_data)
+    primary_outcomes, secondary_outcomes = record.outcomes
     result['Has_Outcome_Data'] = len(primary_outcomes) > 0 or len(secondary_outcomes) > 0
     result['Primary_Outcomes'] = '; '.join(primary_outcomes) if primary_outcomes else ""
     result['Secondary_Outcomes'] = '; '.join(secondary_outcomes) if secondary_outcomes else ""
     
     # Add standard outcome type columns
-    for outcome_key in STANDARD_OUTCOMES.keys():
-        measure_text = extract_measures_for_outcome_type(outcome_key, primary_outcomes, secondary_outcomes)
+    for outcome_key, measure_text in record.outcome_measures.items():
         result[f'Outcome_{outcome_key}'] = measure_text
     
     # Extract biomarkers and drugs
     result['Biomarkers'] = extract_biomarkers(trial_data)
     result['Drugs'] = extract_drugs(trial_data)
     
-    # Results section info
-    has_results = trial_data.get('hasResults', False)
-    result['Has_Results'] = 'Yes' if has_results else 'No'
-    
     return result
 
 
-def process_trial_files(data_dir: str) -> List[Dict]:
-    """Process all trial JSON files and extract comprehensive data."""
+def process_trial_files(data_dir: str, store_path: Optional[str] = None) -> Tuple[List[Dict], List[Tuple[str, str]]]:
+    """
+    Process all trials and extract comprehensive data.
+    Reads from the columnar trial store when it is up to date, else the raw JSON.
+    Returns (rows, [(trial_id, error), ...]).
+    """
     results = []
-    json_files = sorted(Path(data_dir).glob('*.json'))
+    errors = []
     
-    total = len(json_files)
-    for idx, json_file in enumerate(json_files):
-        trial_id = json_file.stem
-        
+    for idx, (trial_id, trial_data) in enumerate(iter_trials(data_dir, store_path, errors)):
         try:
-            with open(json_file, 'r') as f:
-                trial_data = json.load(f)
-            
             result = extract_trial_data(trial_data, trial_id)
             results.append(result)
             
             if (idx + 1) % 50 == 0:
-                print(f"  Processed {idx + 1}/{total} trials...")
+                print(f"  Processed {idx + 1} trials...")
         
         except Exception as e:
-            print(f"Error processing {json_file.name}: {e}")
+            print(f"Error processing {trial_id}: {e}")
+            errors.append((trial_id, str(e)))
             continue
     
-    return results
+    return results, errors
 
 
-def main():
-    data_dir = "/Users/user1/projects/trialome/data/ctg-studies"
-    output_csv = "/Users/user1/projects/trialome/scripts/clinical_trials_summary.csv"
-    
-    print(f"Processing trials from {data_dir}...")
-    results = process_trial_files(data_dir)
-    
-    print(f"\nAnalyzed {len(results)} trials.")
+# Per-process state for parallel extraction (set by _init_worker)
+_worker_data_dir = None
+_worker_store = None
+
+
+def _init_worker(data_dir: str, store_path: Optional[str]):
+    """Open the trial store once per worker process."""
+    global _worker_data_dir, _worker_store
+    _worker_data_dir = data_dir
+    _worker_store = open_store(data_dir, store_path)
+
+
+def _process_chunk(trial_ids: List[str]) -> Tuple[List[Dict], List[Tuple[str, str]]]:
+    """Extract one chunk of trials. Returns (rows, [(trial_id, error), ...])."""
+    rows = []
+    errors = []
+    for trial_id in trial_ids:
+        try:
+            trial_data = load_trial(trial_id, _worker_data_dir, _worker_store)
+            rows.append(extract_trial_data(trial_data, trial_id))
+        except Exception as e:
+            errors.append((trial_id, str(e)))
+    return rows, errors
+
+
+def _process_file_chunk(json_files: List[str]) -> Tuple[Dict[str, Dict], List[Tuple[str, str]]]:
+    """Extract one chunk of changed trial files. Returns ({trial_id: row}, [(trial_id, error), ...])."""
+    rows = {}
+    errors = []
+    for json_file in json_files:
+        trial_id = Path(json_file).name.split('.')[0]
+        try:
+            rows[trial_id] = extract_trial_data(load_trial_file(Path(json_file), STORE_COLUMNS), trial_id)
+        except Exception as e:
+            errors.append((trial_id, str(e)))
+    return rows, errors
+
+
+def extract_files_parallel(json_files: List[Path], workers: int) -> Tuple[Dict[str, Dict], List[Tuple[str, str]]]:
+    """
+    update_rows extract_files hook: extract the added/changed trial files across
+    a process pool, reading each file directly (the store may predate them).
+    """
+    rows: Dict[str, Dict] = {}
+    errors: List[Tuple[str, str]] = []
+    if not json_files:
+        return rows, errors
+    chunk_size = max(1, min(64, len(json_files) // (workers * 4) or 1))
+    chunks = [[str(f) for f in json_files[i:i + chunk_size]] for i in range(0, len(json_files), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for idx, (chunk_rows, chunk_errors) in enumerate(executor.map(_process_file_chunk, chunks)):
+            rows.update(chunk_rows)
+            errors.extend(chunk_errors)
+            print(f"  Processed chunk {idx + 1}/{len(chunks)}...")
+    return rows, errors
+
+
+def process_trial_files_parallel(data_dir: str, workers: Optional[int] = None, chunk_size: Optional[int] = None,
+                                 store_path: Optional[str] = None) -> Tuple[List[Dict], List[Tuple[str, str]]]:
+    """
+    Process all trials across a process pool.
+    Each worker loads and extracts whole chunks of trials, so only trial IDs and
+    finished rows cross process boundaries.
+    Returns (rows sorted by Trial_ID, [(trial_id, error), ...]).
+    """
+    workers = workers or os.cpu_count() or 1
+    trial_ids = list_trial_ids(data_dir, open_store(data_dir, store_path))
+    
+    if chunk_size is None:
+        # ~4 chunks per worker balances load without too much IPC overhead
+        chunk_size = max(1, min(64, len(trial_ids) // (workers * 4) or 1))
+    chunks = [trial_ids[i:i + chunk_size] for i in range(0, len(trial_ids), chunk_size)]
     
+    results = []
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(data_dir, store_path)) as executor:
+        for idx, (rows, chunk_errors) in enumerate(executor.map(_process_chunk, chunks)):
+            results.extend(rows)
+            errors.extend(chunk_errors)
+            print(f"  Processed chunk {idx + 1}/{len(chunks)}...")
+    
+    results.sort(key=lambda x: x.get('Trial_ID', ''))
+    return results, errors
+
+
+def write_summary_csv(results: List[Dict], output_csv: str):
+    """Write summary rows to CSV in Trial_ID order."""
     # Build fieldnames in logical order
     base_fields = [
         'Trial_ID',
@@ -485,8 +362,6 @@ def main():
         available_fields = set(results[0].keys())
         fieldnames = [f for f in fieldnames if f in available_fields]
     
-    print(f"\nWriting CSV to {output_csv}...")
-    
     with open(output_csv, 'w', newline='', encoding='utf-8') as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
@@ -500,6 +375,47 @@ def main():
     print(f"✓ CSV written successfully with {len(results)} trials")
     print(f"✓ CSV file: {output_csv}")
     print(f"✓ Columns: {len(fieldnames)}")
+
+
+def main():
+    data_dir = "/Users/user1/projects/trialome/data/ctg-studies"
+    output_csv = "/Users/user1/projects/trialome/scripts/clinical_trials_summary.csv"
+    manifest_path = Path(output_csv).with_suffix('.manifest.json')
+    
+    # --workers N spreads extraction over a process pool (0 = all cores)
+    workers = 1
+    if "--workers" in sys.argv:
+        workers = int(sys.argv[sys.argv.index("--workers") + 1]) or os.cpu_count()
+    if workers > 1:
+        print(f"Using {workers} worker processes")
+    
+    pending_ids = last_changed_ids(data_dir, "generate_trials_csv")
+    failed_ids = set()
+    print(f"Processing trials from {data_dir}...")
+    if "--full" not in sys.argv:
+        # Only re-extract trials whose JSON changed since the last run (in the pool with --workers)
+        # --changed limits the check to the trials rewritten by trial_download --sync since the last rebuild
+        only_ids = pending_ids if "--changed" in sys.argv else None
+        extract_files = (lambda paths: extract_files_parallel(paths, workers)) if workers > 1 else None
+        results, update_stats = update_rows(data_dir, manifest_path, extract_trial_data, EXTRACTOR_VERSION,
+                                            only_ids=only_ids, extract_files=extract_files)
+        print_update_stats(update_stats)
+        failed_ids = {trial_id for trial_id, _ in update_stats["errors"]}
+    elif workers > 1:
+        results, errors = process_trial_files_parallel(data_dir, workers=workers)
+        for trial_id, error in errors:
+            print(f"Error processing {trial_id}: {error}")
+        failed_ids = {trial_id for trial_id, _ in errors}
+    else:
+        results, errors = process_trial_files(data_dir)
+        failed_ids = {trial_id for trial_id, _ in errors}
+    
+    print(f"\nAnalyzed {len(results)} trials.")
+    
+    print(f"\nWriting CSV to {output_csv}...")
+    write_summary_csv(results, output_csv)
+    # The synced changes are in the CSV now; failed trials stay pending for the next --changed run
+    clear_changed_ids(data_dir, "generate_trials_csv", set(pending_ids) - failed_ids)
     
     # Print summary statistics
     print(f"\n=== SUMMARY STATISTICS ===")
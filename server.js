@@ -6,6 +6,7 @@ const express = require('express');
 const fs = require('fs');
 const path = require('path');
 const csv = require('csv-parse/sync');
+const zlib = require('zlib');
 
 const app = express();
 const PORT = process.env.PORT || 8000;
@@ -16,6 +17,22 @@ app.use(express.static('.'));
 // Cache for trials data
 let trialsCache = null;
 
+// Offline trial search index (built by trial_search.py)
+const SEARCH_INDEX_PATH = path.join(__dirname, 'data/trial_search_index.json.gz');
+const SEARCH_STOPWORDS = new Set([
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'of', 'to', 'for',
+    'with', 'by', 'from', 'at', 'on', 'if', 'is', 'as', 'per', 'be',
+    'are', 'was', 'were', 'who', 'have', 'has', 'not', 'no', 'must',
+    'any', 'all', 'other', 'than', 'that', 'this', 'these', 'will',
+]);
+let searchIndex = null;
+
+// Full trial records packed by trial_blobs.py
+const BLOB_STORE_PATH = path.join(__dirname, 'data/ctg-studies.blobs');
+const BLOB_MAGIC = 'TRIALBL1';
+const BLOB_INDEX_ENTRY_SIZE = 28;
+let blobStore = null;
+
 /**
  * API endpoint to list available DAG files
  */
@@ -85,6 +102,182 @@ app.get('/api/trials', (req, res) => {
     }
 });
 
+/**
+ * Load the gzipped BM25 index once and decode postings lazily per term
+ */
+function loadSearchIndex() {
+    if (!searchIndex) {
+        const raw = JSON.parse(zlib.gunzipSync(fs.readFileSync(SEARCH_INDEX_PATH)).toString('utf8'));
+        if (raw.version !== 1) {
+            throw new Error(`Unsupported search index version: ${raw.version}`);
+        }
+        searchIndex = { ...raw, decoded: new Map() };
+    }
+    return searchIndex;
+}
+
+/**
+ * Tokenize the same way as trial_search.tokenize
+ */
+function tokenizeQuery(text) {
+    return (text.toLowerCase().match(/[a-z0-9]+/g) || []).filter(t => !SEARCH_STOPWORDS.has(t));
+}
+
+function termPostings(index, term) {
+    if (!index.decoded.has(term)) {
+        const flat = index.postings[term] || [];
+        const decoded = [];
+        let docIdx = 0;
+        for (let i = 0; i < flat.length; i += 2) {
+            docIdx += flat[i];
+            decoded.push([docIdx, flat[i + 1]]);
+        }
+        index.decoded.set(term, decoded);
+    }
+    return index.decoded.get(term);
+}
+
+/**
+ * Ranked BM25 search with phase/status facets (mirrors TrialSearchIndex.search)
+ */
+function searchTrials(query, { limit = 20, phases = [], statuses = [], match = 'all' } = {}) {
+    const index = loadSearchIndex();
+    const terms = [...new Set(tokenizeQuery(query))];
+    const nDocs = index.docs.length;
+    const avgdl = index.avgdl || 1;
+    const scores = new Map();
+    const hits = new Map();
+
+    for (const term of terms) {
+        const plist = termPostings(index, term);
+        if (plist.length === 0) continue;
+        const idf = Math.log(1 + (nDocs - plist.length + 0.5) / (plist.length + 0.5));
+        for (const [docIdx, tf] of plist) {
+            const norm = index.k1 * (1 - index.b + index.b * index.doc_len[docIdx] / avgdl);
+            scores.set(docIdx, (scores.get(docIdx) || 0) + idf * tf * (index.k1 + 1) / (tf + norm));
+            hits.set(docIdx, (hits.get(docIdx) || 0) + 1);
+        }
+    }
+
+    let matched = [...scores.keys()];
+    if (match === 'all') {
+        matched = matched.filter(d => hits.get(d) === terms.length);
+    }
+
+    const facets = { phase: {}, status: {} };
+    for (const d of matched) {
+        const doc = index.docs[d];
+        for (const phase of (doc.phases.length ? doc.phases : ['NA'])) {
+            facets.phase[phase] = (facets.phase[phase] || 0) + 1;
+        }
+        facets.status[doc.status] = (facets.status[doc.status] || 0) + 1;
+    }
+
+    if (phases.length) {
+        matched = matched.filter(d => index.docs[d].phases.some(p => phases.includes(p)));
+    }
+    if (statuses.length) {
+        matched = matched.filter(d => statuses.includes(index.docs[d].status));
+    }
+
+    matched.sort((a, b) => (scores.get(b) - scores.get(a)) || index.docs[a].id.localeCompare(index.docs[b].id));
+
+    return {
+        total: matched.length,
+        results: matched.slice(0, limit).map(d => ({
+            nct_id: index.docs[d].id,
+            score: Math.round(scores.get(d) * 10000) / 10000,
+            phases: index.docs[d].phases,
+            status: index.docs[d].status
+        })),
+        facets
+    };
+}
+
+/**
+ * API endpoint to search the local trial corpus
+ * GET /api/search?q=...&phase=PHASE3&status=RECRUITING&limit=20&match=all
+ */
+app.get('/api/search', (req, res) => {
+    const asList = v => (v === undefined ? [] : [].concat(v));
+    
+    try {
+        res.json(searchTrials(req.query.q || '', {
+            limit: parseInt(req.query.limit, 10) || 20,
+            phases: asList(req.query.phase),
+            statuses: asList(req.query.status),
+            match: req.query.match === 'any' ? 'any' : 'all'
+        }));
+    } catch (error) {
+        console.error('Error searching trials:', error);
+        res.status(500).json({ error: 'Search index not available' });
+    }
+});
+
+/**
+ * Open the blob store once: parse the header and NCT ID index, keep the fd
+ * open and read individual records at their offsets on demand
+ */
+function openBlobStore() {
+    if (!blobStore) {
+        const fd = fs.openSync(BLOB_STORE_PATH, 'r');
+        const prefix = Buffer.alloc(12);
+        fs.readSync(fd, prefix, 0, 12, 0);
+        if (prefix.toString('ascii', 0, 8) !== BLOB_MAGIC) {
+            throw new Error('Not a trial blob store');
+        }
+        const headerLen = prefix.readUInt32LE(8);
+        const headerBuf = Buffer.alloc(headerLen);
+        fs.readSync(fd, headerBuf, 0, headerLen, 12);
+        const header = JSON.parse(headerBuf.toString('utf8'));
+        if (header.version !== 1) {
+            throw new Error(`Unsupported blob store version: ${header.version}`);
+        }
+
+        const indexStart = 12 + headerLen;
+        const indexBuf = Buffer.alloc(header.count * BLOB_INDEX_ENTRY_SIZE);
+        fs.readSync(fd, indexBuf, 0, indexBuf.length, indexStart);
+        const dataStart = indexStart + indexBuf.length;
+
+        const index = new Map();
+        for (let i = 0; i < header.count; i++) {
+            const entry = i * BLOB_INDEX_ENTRY_SIZE;
+            const nctId = indexBuf.toString('ascii', entry, entry + 16).replace(/\0+$/, '');
+            const offset = Number(indexBuf.readBigUInt64LE(entry + 16));
+            const length = indexBuf.readUInt32LE(entry + 24);
+            index.set(nctId, { offset: dataStart + offset, length });
+        }
+        blobStore = { fd, index, compressed: header.compression === 'zlib' };
+    }
+    return blobStore;
+}
+
+function readTrialBlob(nctId) {
+    const store = openBlobStore();
+    const location = store.index.get(nctId);
+    if (!location) return null;
+    const blob = Buffer.alloc(location.length);
+    fs.readSync(store.fd, blob, 0, location.length, location.offset);
+    return JSON.parse((store.compressed ? zlib.inflateSync(blob) : blob).toString('utf8'));
+}
+
+/**
+ * API endpoint for one full trial record from the blob store
+ * GET /api/trial/NCT01234567
+ */
+app.get('/api/trial/:nctId', (req, res) => {
+    try {
+        const trial = readTrialBlob(req.params.nctId);
+        if (!trial) {
+            return res.status(404).json({ error: 'Trial not found' });
+        }
+        res.json(trial);
+    } catch (error) {
+        console.error('Error reading trial blob:', error);
+        res.status(500).json({ error: 'Trial blob store not available' });
+    }
+});
+
 /**
  * Health check
  */
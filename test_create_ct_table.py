@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test Suite for create_ct_table's Extraction Bookkeeping
+
+Runs without the Gemini API (batch polling uses a stand-in client):
+- Changed IDs: a reused cache hit clears its trial's pending changed ID,
+  also when the trial already had a row from an earlier run
+- Batch polling: a job still running at the wait limit stays unprocessed
+  in the ledger, so 'resume' reattaches to it
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import create_ct_table
+from batch_ledger import BatchLedger
+from create_ct_table import clear_extracted_changes, run_batch_jobs, upsert_cached_rows
+from extraction_store import ExtractionStore
+from trial_download import last_changed_ids, load_sync_state, save_sync_state
+
+
+def cache_entry(nct_id: str) -> dict:
+    return {
+        "nct_id": nct_id,
+        "official_title": f"Trial {nct_id}",
+        "model": "gemini-2.5-flash",
+        "prompt_sha256": "0" * 64,
+        "extraction": {"experimental_drugs": ["Drug"], "biomarkers": ["EGFR"],
+                       "primary_outcomes_summary": "", "efficacy_status": "UNCERTAIN", "reasoning": ""},
+    }
+
+
+def test_cache_hits_clear_changed_ids():
+    """Cache hits on new and existing rows clear their pending IDs; untouched trials stay pending."""
+    print("\n[CHANGED] Cache hits clear pending changed IDs...")
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp) / "ctg-studies"
+        data_dir.mkdir()
+        state = load_sync_state(data_dir)
+        state["changed_ids"]["create_ct_table"] = ["NCT00000001", "NCT00000002", "NCT00000003"]
+        save_sync_state(data_dir, state)
+
+        extractions = ExtractionStore(Path(tmp) / "extractions.db")
+        # NCT00000001 was extracted by an earlier run; a sync then changed a field the
+        # pruned payload ignores, so this run finds its extraction in the cache
+        extractions.upsert({"nct_id": "NCT00000001", "official_title": "Trial NCT00000001"},
+                           "20250101T000000", "gemini-2.5-flash")
+        extractions.commit()
+
+        added = upsert_cached_rows([cache_entry("NCT00000001"), cache_entry("NCT00000002")],
+                                   extractions, "20250201T000000")
+        cleared = clear_extracted_changes(data_dir, extractions, "20250201T000000")
+        pending = last_changed_ids(data_dir, "create_ct_table")
+        run_id = extractions.get("NCT00000001")["run_id"]
+        extractions.close()
+
+    if added != 1:
+        print(f"✗ Expected 1 new row from the cache hits, got {added}")
+        return False
+    print("✓ One new row added, the existing row rewritten")
+    if run_id != "20250201T000000":
+        print(f"✗ Existing row still stamped with run {run_id}")
+        return False
+    if cleared != ["NCT00000001", "NCT00000002"] or pending != ["NCT00000003"]:
+        print(f"✗ Cleared {cleared}, still pending {pending}")
+        return False
+    print(f"✓ Cleared {cleared}; {pending} still pending")
+    return True
+
+
+def test_timed_out_job_stays_resumable():
+    """A job that is still running at max_wait_minutes is not marked processed."""
+    print("\n[TIMEOUT] Running job at the wait limit...")
+    running = SimpleNamespace(state=SimpleNamespace(name="JOB_STATE_RUNNING"), batch_stats=None)
+    fake_client = SimpleNamespace(batches=SimpleNamespace(get=lambda name: running))
+    real_client = create_ct_table.client
+    create_ct_table.client = fake_client
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            ledger = BatchLedger.create(Path(tmp) / "run.ledger.json", ["batch_1.jsonl"], {}, "out.csv")
+            ledger.record_job(1, "batches/job-1", time.time() - 3600)
+            extractions = ExtractionStore(Path(tmp) / "extractions.db")
+            success = run_batch_jobs(ledger, extractions, max_wait_minutes=0)
+            extractions.close()
+            reloaded = BatchLedger.load(ledger.path)
+    finally:
+        create_ct_table.client = real_client
+
+    if success != 0:
+        print(f"✗ Expected no trials from a running job, got {success}")
+        return False
+    if [b["batch"] for b in reloaded.unfinished()] != [1] or reloaded.batch(1)["job_name"] != "batches/job-1":
+        print(f"✗ Timed-out batch not left for resume: {reloaded.batches}")
+        return False
+    print("✓ Timed-out batch still unfinished in the ledger with its job name")
+    return True
+
+
+# ============================================================================
+# Main
+# ============================================================================
+
+def main():
+    print("=" * 70)
+    print("CREATE_CT_TABLE TEST SUITE")
+    print("=" * 70)
+
+    results = []
+    results.append(("Cache Hits Clear Changed IDs", test_cache_hits_clear_changed_ids()))
+    results.append(("Timed-out Job Stays Resumable", test_timed_out_job_stays_resumable()))
+
+    print("\n" + "=" * 70)
+    print("TEST SUMMARY")
+    print("=" * 70)
+
+    passed = sum(1 for _, result in results if result)
+    total = len(results)
+
+    for name, result in results:
+        status = "✓ PASS" if result else "✗ FAIL"
+        print(f"  {status}: {name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n✓ All tests passed!")
+        return True
+    else:
+        print(f"\n✗ {total - passed} test(s) failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
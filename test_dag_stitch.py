@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Test Suite for DAG Fragment Stitching
+
+Stitches hand-built tile fragments with dag_stitch.stitch_fragments (no
+Gemini access needed):
+- Boxes: the copy of a node in the shared strip merges; a repeated label
+  elsewhere on the page stays separate
+- No boxes, tile below: only nodes near the shared edge merge, so a long
+  label repeated in another branch keeps its own node
+- No boxes, tiles side by side: a merge needs an agreeing edge
+- The page title, tree ID, footnotes and consistent edges survive stitching
+"""
+
+import sys
+
+from dag_stitch import stitch_fragments
+
+
+def node(node_id, content, parents=(), children=(), box=None):
+    data = {"id": node_id, "content": content, "parent_ids": list(parents), "children_ids": list(children),
+            "tree_ids": [], "footnote_labels": []}
+    if box is not None:
+        data["box_2d"] = box
+    return data
+
+
+def dag(nodes, **fields):
+    return {"nodes": nodes, "tree_references": [], "footnotes": [], "extraction_confidence": 0.9,
+            "image_title": None, "tree_id": None, **fields}
+
+
+def contents(stitched):
+    return sorted(n["content"] for n in stitched["nodes"])
+
+
+# Both branches reach the same long label, once in each tile: the left branch
+# near the top of the upper tile, the right one below the shared strip.
+# Only "Adjuvant systemic therapy" sits in the strip.
+# Upper tile: page rows 0-600, lower tile: rows 500-1100.
+UPPER_TILE_BOX = (0, 0, 1000, 600)
+LOWER_TILE_BOX = (0, 500, 1000, 1100)
+REPEATED = "Surveillance (NSCL-17)"
+STRIP = "Adjuvant systemic therapy (NSCL-E)"
+
+
+def upper_fragment(boxes: bool):
+    box = (lambda b: b) if boxes else (lambda b: None)
+    return dag([
+        node("node_001", "Stage IA, margins negative", children=["node_003"], box=box([50, 50, 150, 400])),
+        node("node_002", "Stage IB", children=["node_004", "node_005"], box=box([50, 550, 150, 950])),
+        node("node_003", REPEATED, parents=["node_001"], box=box([300, 50, 400, 400])),
+        node("node_004", "Margins negative (R0)", parents=["node_002"], children=["node_006"],
+             box=box([300, 550, 400, 700])),
+        node("node_005", "Margins positive (R1, R2)", parents=["node_002"], box=box([300, 750, 400, 950])),
+        node("node_006", STRIP, parents=["node_004"], box=box([860, 550, 960, 950])),
+    ], image_title="NCCN Guidelines Version 3.2025 Non-Small Cell Lung Cancer")
+
+
+def lower_fragment(boxes: bool):
+    box = (lambda b: b) if boxes else (lambda b: None)
+    return dag([
+        node("node_001", STRIP, children=["node_002"], box=box([27, 550, 127, 950])),
+        node("node_002", REPEATED, parents=["node_001"], children=["node_003"], box=box([250, 550, 330, 950])),
+        node("node_003", "History and physical every 6 mo", parents=["node_002"], box=box([500, 550, 580, 950])),
+    ], tree_id="NSCL-4", footnotes=[{"label": "a", "content": "See Principles of Surgical Therapy"}])
+
+
+def check_branches(stitched) -> bool:
+    """8 nodes: the strip node merged with edges from both tiles, the repeated label kept twice."""
+    repeats = [n for n in stitched["nodes"] if n["content"] == REPEATED]
+    if len(stitched["nodes"]) != 8 or len(repeats) != 2:
+        print(f"✗ Expected 8 nodes with 2 '{REPEATED}', got {contents(stitched)}")
+        return False
+    print(f"✓ {len(stitched['nodes'])} nodes, '{REPEATED}' kept twice")
+    strip = [n for n in stitched["nodes"] if n["content"] == STRIP]
+    if len(strip) != 1 or len(strip[0]["parent_ids"]) != 1 or len(strip[0]["children_ids"]) != 1:
+        print(f"✗ Strip node not merged with one parent and one child: {strip}")
+        return False
+    print("✓ The strip node merged with its edges from both tiles")
+    return True
+
+
+def test_boxes_separate_repeated_labels():
+    """With boxes, the strip copies merge and the label repeated in each tile stays two nodes."""
+    print("\n[BOXES] Repeated label with boxes...")
+    return check_branches(stitch_fragments([((0, 0), upper_fragment(True), UPPER_TILE_BOX),
+                                            ((1, 0), lower_fragment(True), LOWER_TILE_BOX)]))
+
+
+def test_no_boxes_tile_below():
+    """Without boxes, a label far from the shared edge is not merged with its repeat in the tile below."""
+    print("\n[NO BOXES] Tile below...")
+    return check_branches(stitch_fragments([((0, 0), upper_fragment(False), None),
+                                            ((1, 0), lower_fragment(False), None)]))
+
+
+def test_no_boxes_side_by_side():
+    """Side-by-side tiles without boxes need an agreeing edge to merge."""
+    print("\n[NO BOXES] Tiles side by side...")
+    left = dag([
+        node("node_001", "Stage IIIA, margins negative", children=["node_002"]),
+        node("node_002", "Concurrent chemoradiation (NSCL-F)", parents=["node_001"]),
+        node("node_003", REPEATED),
+    ])
+    right = dag([
+        node("node_001", "Stage IIIA, margins negative", children=["node_002"]),
+        node("node_002", "Concurrent chemoradiation (NSCL-F)", parents=["node_001"]),
+        node("node_003", REPEATED),
+    ])
+    stitched = stitch_fragments([((0, 0), left, None), ((0, 1), right, None)])
+    expected = sorted(["Stage IIIA, margins negative", "Concurrent chemoradiation (NSCL-F)", REPEATED, REPEATED])
+    if contents(stitched) != expected:
+        print(f"✗ Expected {expected}, got {contents(stitched)}")
+        return False
+    print("✓ Nodes with an agreeing edge merged; the unconnected repeat did not")
+    return True
+
+
+def test_page_fields():
+    """Title, tree ID, footnotes and confidence carry over from the fragments."""
+    print("\n[FIELDS] Page-level fields...")
+    stitched = stitch_fragments([((0, 0), upper_fragment(True), UPPER_TILE_BOX),
+                                 ((1, 0), lower_fragment(True), LOWER_TILE_BOX)])
+    checks = {
+        "image_title": "NCCN Guidelines Version 3.2025 Non-Small Cell Lung Cancer",
+        "tree_id": "NSCL-4",
+        "footnotes": [{"label": "a", "content": "See Principles of Surgical Therapy"}],
+        "extraction_confidence": 0.9,
+    }
+    for field, expected in checks.items():
+        if stitched[field] != expected:
+            print(f"✗ {field}: expected {expected!r}, got {stitched[field]!r}")
+            return False
+    by_id = {n["id"]: n for n in stitched["nodes"]}
+    for n in stitched["nodes"]:
+        if any(n["id"] not in by_id[child]["parent_ids"] for child in n["children_ids"]):
+            print(f"✗ {n['id']} has a child that does not list it as a parent")
+            return False
+    print("✓ Title, tree ID, footnotes and confidence kept; edges consistent")
+    return True
+
+
+# ============================================================================
+# Main
+# ============================================================================
+
+def main():
+    print("=" * 70)
+    print("DAG STITCHING TEST SUITE")
+    print("=" * 70)
+
+    results = []
+    results.append(("Boxes Separate Repeated Labels", test_boxes_separate_repeated_labels()))
+    results.append(("No Boxes, Tile Below", test_no_boxes_tile_below()))
+    results.append(("No Boxes, Side by Side", test_no_boxes_side_by_side()))
+    results.append(("Page Fields", test_page_fields()))
+
+    print("\n" + "=" * 70)
+    print("TEST SUMMARY")
+    print("=" * 70)
+
+    passed = sum(1 for _, result in results if result)
+    total = len(results)
+
+    for name, result in results:
+        status = "✓ PASS" if result else "✗ FAIL"
+        print(f"  {status}: {name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n✓ All tests passed!")
+        return True
+    else:
+        print(f"\n✗ {total - passed} test(s) failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -22,6 +22,8 @@ try:
         extract_single_image,
         load_cache,
         get_cached_file_uri,
+        prepare_image,
+        PREPROCESS_IMAGES,
         get_extraction_index,
         save_extraction_index,
     )
@@ -197,8 +199,9 @@ def test_caching(image_path: Path):
         dag_output_1 = extract_single_image(image_path)
         cache_after = load_cache()
         
-        # Check if file was cached
-        cached_uri_1 = get_cached_file_uri(image_path)
+        # Check if file was cached (the upload is the preprocessed copy when preprocessing is on)
+        uploaded_path = prepare_image(image_path) if PREPROCESS_IMAGES else image_path
+        cached_uri_1 = get_cached_file_uri(uploaded_path)
         if not cached_uri_1:
             print(f"✗ File URI not cached after first extraction")
             return False
@@ -208,7 +211,7 @@ def test_caching(image_path: Path):
         # Second extraction should use cache
         print(f"  Run 2: Second extraction (should use cache)...")
         dag_output_2 = extract_single_image(image_path)
-        cached_uri_2 = get_cached_file_uri(image_path)
+        cached_uri_2 = get_cached_file_uri(uploaded_path)
         
         if cached_uri_1 != cached_uri_2:
             print(f"✗ Cached URI changed between runs")
@@ -1,14 +1,12 @@
-import json
-import os
 from create_ct_table import extract_trial_data, flatten_trial_for_csv
+from trial_store import load_trial_file, trial_file_path
 
-# Test with a single file
-test_file = "data/ctg-studies/NCT00499109.json"
+# Test with a single file (plain or zstd-compressed)
+test_file = trial_file_path("data/ctg-studies", "NCT00499109")
 
-if os.path.exists(test_file):
+if test_file.exists():
     print(f"Testing with {test_file}...")
-    with open(test_file, 'r') as f:
-        trial_data = json.load(f)
+    trial_data = load_trial_file(test_file)
     
     result = extract_trial_data(trial_data)
     
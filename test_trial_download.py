@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Test Suite for the Async ClinicalTrials.gov Downloader
+
+Runs trial_download against a local http.server stand-in for the CT.gov v2
+API (no network access needed):
+- Transport: gzip and chunked responses, 503 retries, slots released while
+  a request backs off after a dropped connection
+- Crawl: listing pagination, checkpoint contents, resume after an
+  interrupted listing and after failed trials
+- Sync: changed IDs accumulate across syncs until each rebuild clears them
+"""
+
+import asyncio
+import gzip
+import json
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    from trial_download import (
+        AsyncHTTPClient,
+        HTTPError,
+        TokenBucket,
+        CHANGE_CONSUMERS,
+        checkpoint_path_for,
+        clear_changed_ids,
+        download_corpus,
+        last_changed_ids,
+        load_checkpoint,
+        sync_corpus,
+    )
+    print("✓ All imports successful")
+except ImportError as e:
+    print(f"✗ Import failed: {e}")
+    sys.exit(1)
+
+
+QUERY = {"query.cond": "test condition"}
+TRIAL_IDS = [f"NCT{i:08d}" for i in range(1, 8)]
+PAGE_SIZE = 3
+
+
+def study_json(nct_id: str, revision: int = 0) -> bytes:
+    title = f"Trial {nct_id}" + (f" (revision {revision})" if revision else "")
+    return json.dumps({
+        "protocolSection": {
+            "identificationModule": {"nctId": nct_id, "briefTitle": title},
+            "statusModule": {"lastUpdatePostDateStruct": {"date": "2025-01-15"}},
+        }
+    }).encode()
+
+
+# ============================================================================
+# Stand-in CT.gov Server
+# ============================================================================
+
+class FakeCTGov:
+    """
+    Serves /studies (listing, PAGE_SIZE IDs per page) and /studies/{id}.
+    Odd-numbered trials are sent gzip-encoded, even-numbered ones chunked.
+    `unavailable` maps a path to the number of 503s to send before serving it,
+    `dropped` to the number of times to close the connection without a
+    response; `missing` trial IDs get a 404. `revisions` changes a trial's
+    served content.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.unavailable = {}
+        self.dropped = {}
+        self.missing = set()
+        self.revisions = {}
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake.handle(self)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/v2"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, path: str) -> int:
+        with self.lock:
+            return sum(1 for p, _ in self.requests if p == path)
+
+    def handle(self, handler: BaseHTTPRequestHandler):
+        parts = urlsplit(handler.path)
+        path = parts.path[len("/api/v2"):]
+        params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        with self.lock:
+            self.requests.append((path, params))
+            failures_left = self.unavailable.get(path, 0)
+            if failures_left:
+                self.unavailable[path] = failures_left - 1
+            drops_left = self.dropped.get(path, 0)
+            if drops_left:
+                self.dropped[path] = drops_left - 1
+
+        if drops_left:
+            handler.close_connection = True
+        elif failures_left:
+            self.send(handler, 503, b"busy", extra_headers={"Retry-After": "1"})
+        elif path == "/studies":
+            start = int(params.get("pageToken", "0"))
+            page = {"studies": [{"protocolSection": {"identificationModule": {"nctId": nct_id}}}
+                                for nct_id in TRIAL_IDS[start:start + PAGE_SIZE]]}
+            if start + PAGE_SIZE < len(TRIAL_IDS):
+                page["nextPageToken"] = str(start + PAGE_SIZE)
+            self.send(handler, 200, json.dumps(page).encode())
+        elif path.startswith("/studies/"):
+            nct_id = path.rsplit("/", 1)[1]
+            body = study_json(nct_id, self.revisions.get(nct_id, 0))
+            if nct_id not in TRIAL_IDS or nct_id in self.missing:
+                self.send(handler, 404, b"not found")
+            elif int(nct_id[3:]) % 2:
+                self.send(handler, 200, body, gzipped=True)
+            else:
+                self.send(handler, 200, body, chunked=True)
+        elif path == "/slow":
+            time.sleep(0.2)
+            self.send(handler, 200, b"slow")
+        else:
+            self.send(handler, 200, path.encode())
+
+    def send(self, handler: BaseHTTPRequestHandler, status: int, body: bytes,
+             gzipped: bool = False, chunked: bool = False, extra_headers=None):
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        for name, value in (extra_headers or {}).items():
+            handler.send_header(name, value)
+        if gzipped:
+            body = gzip.compress(body)
+            handler.send_header("Content-Encoding", "gzip")
+        if chunked:
+            handler.send_header("Transfer-Encoding", "chunked")
+            handler.end_headers()
+            for i in range(0, len(body), 40):
+                piece = body[i:i + 40]
+                handler.wfile.write(f"{len(piece):x}\r\n".encode() + piece + b"\r\n")
+            handler.wfile.write(b"0\r\n\r\n")
+        else:
+            handler.send_header("Content-Length", str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+
+
+def make_client(base_url: str, max_connections: int = 4) -> AsyncHTTPClient:
+    return AsyncHTTPClient(base_url, max_connections, TokenBucket(rate=1000, capacity=1000))
+
+
+# ============================================================================
+# Transport
+# ============================================================================
+
+def test_encodings():
+    """gzip and chunked bodies decode to the served JSON."""
+    print("\n[HTTP] gzip and chunked responses...")
+
+    async def run(base_url):
+        client = make_client(base_url)
+        try:
+            return [await client.get(f"/studies/{nct_id}") for nct_id in ("NCT00000001", "NCT00000002")]
+        finally:
+            client.close()
+
+    with FakeCTGov() as server:
+        gzipped, chunked = asyncio.run(run(server.base_url))
+
+    if gzipped != study_json("NCT00000001"):
+        print(f"✗ gzip body not decoded: {gzipped[:60]!r}")
+        return False
+    print("✓ gzip body decoded")
+    if chunked != study_json("NCT00000002"):
+        print(f"✗ chunked body not reassembled: {chunked[:60]!r}")
+        return False
+    print("✓ chunked body reassembled")
+    return True
+
+
+def test_retry_after_503():
+    """503s are retried until the server recovers; other errors are raised."""
+    print("\n[HTTP] 503 retries...")
+
+    async def run(base_url):
+        client = make_client(base_url)
+        try:
+            body = await client.get("/studies/NCT00000003")
+            try:
+                await client.get("/studies/NCT99999999")
+                not_found = None
+            except HTTPError as e:
+                not_found = e.status
+            return body, not_found
+        finally:
+            client.close()
+
+    with FakeCTGov() as server:
+        server.unavailable["/studies/NCT00000003"] = 2
+        body, not_found = asyncio.run(run(server.base_url))
+        attempts = server.count("/studies/NCT00000003")
+
+    if body != study_json("NCT00000003") or attempts != 3:
+        print(f"✗ Expected success on the 3rd attempt, got {attempts} attempts")
+        return False
+    print("✓ Served after two 503s (3 attempts)")
+    if not_found != 404:
+        print(f"✗ 404 should raise HTTPError immediately, got {not_found}")
+        return False
+    print("✓ 404 raised without retrying")
+    return True
+
+
+def test_slot_released_during_backoff():
+    """A request backing off after a dropped connection must not hold the only connection slot."""
+    print("\n[HTTP] Slot released during backoff...")
+
+    async def run(base_url):
+        client = make_client(base_url, max_connections=1)
+        finished = []
+
+        async def fetch(path):
+            await client.get(path)
+            finished.append(path)
+
+        try:
+            first = asyncio.create_task(fetch("/flaky"))
+            await asyncio.sleep(0.1)  # /flaky's connection was dropped; it is backing off for 1s
+            await asyncio.wait_for(fetch("/slow"), 0.8)
+            await first
+        finally:
+            client.close()
+        return finished
+
+    with FakeCTGov() as server:
+        server.dropped["/flaky"] = 1
+        try:
+            finished = asyncio.run(run(server.base_url))
+        except asyncio.TimeoutError:
+            print("✗ Second request waited for the first request's backoff")
+            return False
+
+    if finished != ["/slow", "/flaky"]:
+        print(f"✗ Unexpected completion order: {finished}")
+        return False
+    print("✓ Other request completed while the dropped request was backing off")
+    return True
+
+
+# ============================================================================
+# Crawl, Checkpoint, Resume & Sync
+# ============================================================================
+
+def test_full_download():
+    """Listing pages through every ID; all trials are written and checkpointed."""
+    print("\n[CRAWL] Full download...")
+    with tempfile.TemporaryDirectory() as tmp, FakeCTGov() as server:
+        data_dir = Path(tmp) / "ctg-studies"
+        server.unavailable["/studies"] = 1  # First listing page is retried
+        stats = asyncio.run(download_corpus(QUERY, data_dir=data_dir, base_url=server.base_url,
+                                            concurrency=3, rate=1000, burst=1000))
+        checkpoint = load_checkpoint(checkpoint_path_for(data_dir), QUERY)
+        written = sorted(p.stem for p in data_dir.glob("*.json"))
+        contents_ok = all((data_dir / f"{i}.json").read_bytes() == study_json(i) for i in TRIAL_IDS)
+
+    if stats != {"listed": len(TRIAL_IDS), "fetched": len(TRIAL_IDS), "failed": 0}:
+        print(f"✗ Unexpected stats: {stats}")
+        return False
+    print(f"✓ Stats: {stats}")
+    if written != TRIAL_IDS or not contents_ok:
+        print(f"✗ Trial files missing or wrong: {written}")
+        return False
+    print(f"✓ {len(written)} trial files written as served")
+    if not checkpoint["listing_complete"] or checkpoint["ids"] != TRIAL_IDS or checkpoint["failed"]:
+        print(f"✗ Checkpoint incomplete: {checkpoint}")
+        return False
+    print("✓ Checkpoint records the complete listing and no failures")
+    return True
+
+
+def test_resume_listing():
+    """An interrupted listing resumes from the saved page token."""
+    print("\n[CRAWL] Resume interrupted listing...")
+    with tempfile.TemporaryDirectory() as tmp, FakeCTGov() as server:
+        data_dir = Path(tmp) / "ctg-studies"
+        data_dir.mkdir()
+        # Checkpoint as left by a crawl stopped after the first listing page
+        checkpoint = load_checkpoint(checkpoint_path_for(data_dir), QUERY)
+        checkpoint.update({"next_page_token": str(PAGE_SIZE), "ids": TRIAL_IDS[:PAGE_SIZE]})
+        checkpoint_path_for(data_dir).write_text(json.dumps(checkpoint))
+
+        stats = asyncio.run(download_corpus(QUERY, data_dir=data_dir, base_url=server.base_url,
+                                            concurrency=2, rate=1000, burst=1000))
+        page_tokens = [params.get("pageToken") for path, params in server.requests if path == "/studies"]
+
+    if None in page_tokens:
+        print(f"✗ Listing restarted from the first page: {page_tokens}")
+        return False
+    print(f"✓ Listing resumed at page tokens {page_tokens}")
+    if stats["listed"] != len(TRIAL_IDS) or stats["fetched"] != len(TRIAL_IDS):
+        print(f"✗ Unexpected stats: {stats}")
+        return False
+    print(f"✓ All {stats['listed']} trials listed and fetched")
+    return True
+
+
+def test_resume_failed_trials():
+    """Failed trials are checkpointed and only they are fetched on the next run."""
+    print("\n[CRAWL] Resume after failed trials...")
+    with tempfile.TemporaryDirectory() as tmp, FakeCTGov() as server:
+        data_dir = Path(tmp) / "ctg-studies"
+        server.missing = {"NCT00000004", "NCT00000005"}
+        first = asyncio.run(download_corpus(QUERY, data_dir=data_dir, base_url=server.base_url,
+                                            concurrency=3, rate=1000, burst=1000))
+        failed = sorted(load_checkpoint(checkpoint_path_for(data_dir), QUERY)["failed"])
+
+        server.missing = set()
+        fetched_before = {i: server.count(f"/studies/{i}") for i in TRIAL_IDS}
+        second = asyncio.run(download_corpus(QUERY, data_dir=data_dir, base_url=server.base_url,
+                                             concurrency=3, rate=1000, burst=1000))
+        refetched = sorted(i for i in TRIAL_IDS if server.count(f"/studies/{i}") > fetched_before[i])
+        remaining = load_checkpoint(checkpoint_path_for(data_dir), QUERY)["failed"]
+        written = sorted(p.stem for p in data_dir.glob("*.json"))
+
+    if first["failed"] != 2 or failed != ["NCT00000004", "NCT00000005"]:
+        print(f"✗ Failures not checkpointed: {first}, {failed}")
+        return False
+    print(f"✓ First run: {first['fetched']} fetched, failures checkpointed: {failed}")
+    if refetched != failed or second["fetched"] != 2:
+        print(f"✗ Second run should fetch only the failed trials, fetched {refetched}")
+        return False
+    print(f"✓ Second run fetched only {refetched}")
+    if remaining or written != TRIAL_IDS:
+        print(f"✗ Corpus incomplete after resume: failed={remaining}, files={written}")
+        return False
+    print("✓ Corpus complete and checkpoint clear")
+    return True
+
+
+def test_sync_accumulates_changed_ids():
+    """Changed IDs merge across syncs and stay pending per rebuild until it clears them."""
+    print("\n[SYNC] Changed IDs across syncs...")
+    with tempfile.TemporaryDirectory() as tmp, FakeCTGov() as server:
+        data_dir = Path(tmp) / "ctg-studies"
+        options = dict(data_dir=data_dir, base_url=server.base_url, concurrency=3, rate=1000, burst=1000)
+        asyncio.run(download_corpus(QUERY, **options))
+
+        server.revisions["NCT00000002"] = 1
+        first = asyncio.run(sync_corpus(QUERY, since="2025-01-01", **options))
+        server.revisions["NCT00000006"] = 1
+        second = asyncio.run(sync_corpus(QUERY, since="2025-01-01", **options))
+        pending = {consumer: last_changed_ids(data_dir, consumer) for consumer in CHANGE_CONSUMERS}
+
+        clear_changed_ids(data_dir, "generate_trials_csv", ["NCT00000002", "NCT00000006"])
+        after_clear = {consumer: last_changed_ids(data_dir, consumer) for consumer in CHANGE_CONSUMERS}
+
+    if first["changed"] != ["NCT00000002"] or second["changed"] != ["NCT00000006"]:
+        print(f"✗ Unexpected changes per sync: {first['changed']}, {second['changed']}")
+        return False
+    print(f"✓ Syncs changed {first['changed']} then {second['changed']}")
+    if any(ids != ["NCT00000002", "NCT00000006"] for ids in pending.values()):
+        print(f"✗ Second sync overwrote the pending IDs: {pending}")
+        return False
+    print("✓ Both syncs' IDs pending for every rebuild")
+    if after_clear["generate_trials_csv"] or after_clear["analyze_outcomes"] != ["NCT00000002", "NCT00000006"]:
+        print(f"✗ Clearing one rebuild affected another: {after_clear}")
+        return False
+    print("✓ Clearing one rebuild leaves the others pending")
+    return True
+
+
+# ============================================================================
+# Main
+# ============================================================================
+
+def main():
+    print("=" * 70)
+    print("TRIAL DOWNLOADER TEST SUITE")
+    print("=" * 70)
+
+    results = []
+    results.append(("gzip/chunked Responses", test_encodings()))
+    results.append(("503 Retries", test_retry_after_503()))
+    results.append(("Slot Released During Backoff", test_slot_released_during_backoff()))
+    results.append(("Full Download", test_full_download()))
+    results.append(("Resume Listing", test_resume_listing()))
+    results.append(("Resume Failed Trials", test_resume_failed_trials()))
+    results.append(("Sync Changed IDs", test_sync_accumulates_changed_ids()))
+
+    print("\n" + "=" * 70)
+    print("TEST SUMMARY")
+    print("=" * 70)
+
+    passed = sum(1 for _, result in results if result)
+    total = len(results)
+
+    for name, result in results:
+        status = "✓ PASS" if result else "✗ FAIL"
+        print(f"  {status}: {name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n✓ All tests passed!")
+        return True
+    else:
+        print(f"\n✗ {total - passed} test(s) failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Memory-Mapped Trial Blob Store
+
+Packs every raw study JSON from data/ctg-studies into one file with a fixed
+width NCT ID → (offset, length) index, so consumers that need the full
+record for a single trial (the trial detail modal, the LLM pruning step)
+read just that blob through mmap instead of opening a file per trial.
+
+Unlike the columnar trial store (trial_store.py), blobs hold the complete
+record, byte-for-byte as downloaded.
+
+Layout (all integers little-endian):
+- 8 bytes magic "TRIALBL1"
+- uint32 header length, then the JSON header
+  {"version", "compression": "zlib" | "none", "count", "source_files"}
+- count index entries of 28 bytes, sorted by NCT ID:
+  16-byte ASCII NCT ID (NUL padded), uint64 offset, uint32 length
+  (offsets are relative to the start of the blob section)
+- the blob section: each record, zlib-compressed unless compression is "none"
+
+zlib keeps the file readable from server.js without extra dependencies.
+
+Usage:
+    python trial_blobs.py build [data_dir] [blob_path] [--no-compress]
+    python trial_blobs.py get <NCT_ID> [blob_path]
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from trial_store import (DEFAULT_DATA_DIR, is_trial_file, list_trial_files, load_trial_file,
+                         read_trial_bytes, trial_file_id, trial_file_path)
+
+
+DEFAULT_BLOB_PATH = Path(__file__).parent / "data" / "ctg-studies.blobs"
+
+BLOB_MAGIC = b"TRIALBL1"
+BLOB_VERSION = 1
+INDEX_ENTRY = struct.Struct("<16sQI")
+ZLIB_LEVEL = 6
+
+
+def blob_path_for(data_dir: Path) -> Path:
+    """Default blob file location: <data_dir>.blobs beside the data dir."""
+    data_dir = Path(data_dir)
+    return data_dir.parent / f"{data_dir.name}.blobs"
+
+
+# ============================================================================
+# Builder
+# ============================================================================
+
+def build_blob_store(data_dir: Path = DEFAULT_DATA_DIR, blob_path: Path = DEFAULT_BLOB_PATH,
+                     compress: bool = True) -> Dict[str, Any]:
+    """
+    Pack all trial JSON files in data_dir into one blob file.
+    Returns a summary dict with count, raw and packed byte totals.
+    """
+    json_files = list_trial_files(data_dir)
+    entries: List[Tuple[bytes, int, int]] = []
+    raw_bytes = 0
+
+    blob_path = Path(blob_path)
+    blob_path.parent.mkdir(parents=True, exist_ok=True)
+    data_tmp = blob_path.with_suffix(blob_path.suffix + ".data.tmp")
+    offset = 0
+    with open(data_tmp, "wb") as data_f:
+        for json_file in json_files:
+            raw = read_trial_bytes(json_file)
+            raw_bytes += len(raw)
+            blob = zlib.compress(raw, ZLIB_LEVEL) if compress else raw
+            data_f.write(blob)
+            entries.append((trial_file_id(json_file).encode("ascii"), offset, len(blob)))
+            offset += len(blob)
+
+    header = {
+        "version": BLOB_VERSION,
+        "compression": "zlib" if compress else "none",
+        "count": len(entries),
+        "source_files": len(json_files),
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    tmp_path = blob_path.with_suffix(blob_path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(BLOB_MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        for trial_id, blob_offset, length in sorted(entries):
+            f.write(INDEX_ENTRY.pack(trial_id, blob_offset, length))
+        with open(data_tmp, "rb") as data_f:
+            while chunk := data_f.read(1 << 20):
+                f.write(chunk)
+    os.remove(data_tmp)
+    os.replace(tmp_path, blob_path)
+
+    return {
+        "count": len(entries),
+        "raw_bytes": raw_bytes,
+        "bytes": blob_path.stat().st_size,
+    }
+
+
+# ============================================================================
+# Reader
+# ============================================================================
+
+class TrialBlobStore:
+    """Read-only, memory-mapped view over a blob file with O(1) lookups by NCT ID."""
+
+    def __init__(self, blob_path: Path = DEFAULT_BLOB_PATH):
+        self.path = Path(blob_path)
+        self._file = open(self.path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mm[:8] != BLOB_MAGIC:
+            raise ValueError(f"{self.path} is not a trial blob store")
+        (header_len,) = struct.unpack_from("<I", self._mm, 8)
+        self.header = json.loads(self._mm[12:12 + header_len])
+        if self.header.get("version") != BLOB_VERSION:
+            raise ValueError(f"Unsupported blob store version: {self.header.get('version')}")
+        self.compressed = self.header["compression"] == "zlib"
+
+        index_start = 12 + header_len
+        data_start = index_start + self.header["count"] * INDEX_ENTRY.size
+        self._index: Dict[str, Tuple[int, int]] = {}
+        for trial_id, offset, length in INDEX_ENTRY.iter_unpack(self._mm[index_start:data_start]):
+            self._index[trial_id.rstrip(b"\0").decode("ascii")] = (data_start + offset, length)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, trial_id: str) -> bool:
+        return trial_id in self._index
+
+    @property
+    def trial_ids(self) -> List[str]:
+        return sorted(self._index)
+
+    def get_bytes(self, trial_id: str) -> Optional[bytes]:
+        """Raw study JSON bytes for one trial, or None if not in the store."""
+        location = self._index.get(trial_id)
+        if location is None:
+            return None
+        start, length = location
+        blob = self._mm[start:start + length]
+        return zlib.decompress(blob) if self.compressed else blob
+
+    def get(self, trial_id: str) -> Optional[Dict[str, Any]]:
+        """Full parsed study JSON for one trial, or None if not in the store."""
+        raw = self.get_bytes(trial_id)
+        return json.loads(raw) if raw is not None else None
+
+    def iter_trials(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (trial_id, full trial dict) in NCT order."""
+        for trial_id in self.trial_ids:
+            yield trial_id, self.get(trial_id)
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+def read_blob_header(blob_path: Path) -> Optional[Dict[str, Any]]:
+    """Read just the blob header, or None if the file is not a blob store."""
+    with open(blob_path, "rb") as f:
+        if f.read(8) != BLOB_MAGIC:
+            return None
+        (header_len,) = struct.unpack("<I", f.read(4))
+        return json.loads(f.read(header_len))
+
+
+def blob_store_is_fresh(data_dir: Path = DEFAULT_DATA_DIR, blob_path: Path = DEFAULT_BLOB_PATH) -> bool:
+    """True if the blob file exists and is newer than every JSON file in data_dir."""
+    blob_path = Path(blob_path)
+    if not blob_path.exists():
+        return False
+
+    blob_mtime = blob_path.stat().st_mtime
+    trial_ids = set()  # A trial with both .json and .json.zst counts once, as in list_trial_files
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            if not is_trial_file(entry.name):
+                continue
+            trial_ids.add(trial_file_id(entry.name))
+            if entry.stat().st_mtime > blob_mtime:
+                return False
+
+    header = read_blob_header(blob_path)
+    if header is None or header.get("version") != BLOB_VERSION:
+        return False
+    return header.get("source_files") == len(trial_ids)
+
+
+def open_blob_store(data_dir: Path = DEFAULT_DATA_DIR, blob_path: Optional[Path] = None) -> Optional[TrialBlobStore]:
+    """Open the blob store for data_dir if one exists and is up to date, else None."""
+    if blob_path is None:
+        blob_path = blob_path_for(data_dir)
+    if not blob_store_is_fresh(data_dir, blob_path):
+        return None
+    return TrialBlobStore(blob_path)
+
+
+def load_full_trial(trial_id: str, data_dir: Path = DEFAULT_DATA_DIR,
+                    blobs: Optional[TrialBlobStore] = None) -> Dict[str, Any]:
+    """Load one complete trial record, from the blob store if it has it, else the raw JSON."""
+    if blobs is not None:
+        trial_data = blobs.get(trial_id)
+        if trial_data is not None:
+            return trial_data
+    return load_trial_file(trial_file_path(data_dir, trial_id))
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python trial_blobs.py <command> [options]")
+        print("\nCommands:")
+        print("  build [data_dir] [blob_path] [--no-compress]  Pack study JSON into a blob file")
+        print("  get <NCT_ID> [blob_path]                      Print one trial's JSON")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    args = [a for a in sys.argv[2:] if not a.startswith("--")]
+
+    if command == "build":
+        data_dir = Path(args[0]) if len(args) > 0 else DEFAULT_DATA_DIR
+        blob_path = Path(args[1]) if len(args) > 1 else blob_path_for(data_dir)
+        print(f"Packing trials from {data_dir}...")
+        summary = build_blob_store(data_dir, blob_path, compress="--no-compress" not in sys.argv)
+        print(f"✓ {summary['count']} trials, {summary['raw_bytes'] / 1e6:.1f} MB raw")
+        print(f"✓ Blob store written to {blob_path} ({summary['bytes'] / 1e6:.1f} MB)")
+
+    elif command == "get":
+        if not args:
+            print("Usage: python trial_blobs.py get <NCT_ID> [blob_path]")
+            sys.exit(1)
+        blobs = TrialBlobStore(Path(args[1]) if len(args) > 1 else DEFAULT_BLOB_PATH)
+        raw = blobs.get_bytes(args[0])
+        if raw is None:
+            print(f"{args[0]} not found")
+            sys.exit(1)
+        sys.stdout.write(raw.decode("utf-8") + "\n")
+
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+"""
+Async ClinicalTrials.gov Bulk Downloader
+
+Populates data/ctg-studies from the CT.gov v2 API:
+
+1. Listing pass: pages through /studies (NCT IDs only) following
+   nextPageToken
+2. Fetch pass: downloads /studies/{nctId} for every listed trial with a
+   bounded number of concurrent requests over pooled keep-alive connections
+
+All requests share one token bucket so bursts stay under the API rate limit.
+Progress is checkpointed next to the data dir (<data_dir>.download.json):
+the listing page token and listed IDs are saved after every page, and a
+trial counts as done once its file exists (files are written atomically),
+so an interrupted crawl resumes where it stopped.
+
+Sync mode (--sync) is the change feed: it only lists trials whose
+LastUpdatePostDate is on or after the last sync watermark, rewrites the
+files whose content actually changed, and adds those NCT IDs to
+<data_dir>.sync.json for the downstream rebuilds (`--changed` in
+scripts/generate_trials_csv.py, scripts/analyze_outcomes.py and
+create_ct_table.py). Each rebuild has its own pending set: IDs accumulate
+across syncs and a rebuild clears only the ones it processed, after it
+succeeds.
+
+Stdlib only (asyncio streams); base_url can point at a local stand-in server.
+
+Usage:
+    python trial_download.py [--cond TEXT] [--term TEXT] [--status STATUS]
+                             [--data-dir DIR] [--concurrency N] [--rate R]
+                             [--base-url URL] [--refetch]
+    python trial_download.py --sync [--since YYYY-MM-DD] [--rebuild] [same options]
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import ssl
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+from trial_store import DEFAULT_DATA_DIR, ZSTD_SUFFIX, iter_trials, open_store, read_trial_bytes, trial_file_path
+
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+CTGOV_BASE_URL = "https://clinicaltrials.gov/api/v2"
+
+DEFAULT_CONDITION = "non-small cell lung cancer"
+LIST_PAGE_SIZE = 1000          # API maximum for /studies
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RATE = 5.0             # requests per second (CT.gov asks for ~50/min sustained per IP)
+DEFAULT_BURST = 10
+
+MAX_RETRIES = 5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+REQUEST_TIMEOUT = 60
+
+CHECKPOINT_VERSION = 1
+SYNC_STATE_VERSION = 2
+# Downstream rebuilds that consume the changed IDs (keys of the sync state's changed_ids)
+CHANGE_CONSUMERS = ("generate_trials_csv", "analyze_outcomes", "create_ct_table")
+LAST_UPDATE_COLUMN = "protocolSection.statusModule.lastUpdatePostDateStruct"
+USER_AGENT = "trialome-downloader/1.0"
+
+
+def checkpoint_path_for(data_dir: Path) -> Path:
+    """Default checkpoint location: <data_dir>.download.json beside the data dir."""
+    data_dir = Path(data_dir)
+    return data_dir.parent / f"{data_dir.name}.download.json"
+
+
+def sync_state_path_for(data_dir: Path) -> Path:
+    """Sync watermark and pending changed IDs: <data_dir>.sync.json beside the data dir."""
+    data_dir = Path(data_dir)
+    return data_dir.parent / f"{data_dir.name}.sync.json"
+
+
+# ============================================================================
+# Rate Limiting
+# ============================================================================
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, up to `capacity` banked."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# ============================================================================
+# HTTP Client
+# ============================================================================
+
+class HTTPError(Exception):
+    def __init__(self, status: int, body: bytes, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}: {body[:200]!r}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncHTTPClient:
+    """
+    Minimal HTTP/1.1 GET client over asyncio streams.
+    Keeps up to `max_connections` keep-alive connections to one host and
+    reuses them across requests; every request first takes a bucket token.
+    """
+
+    def __init__(self, base_url: str, max_connections: int, bucket: TokenBucket):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.use_ssl = parts.scheme == "https"
+        self.port = parts.port or (443 if self.use_ssl else 80)
+        self.base_path = parts.path.rstrip("/")
+        self.bucket = bucket
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle: List[_Connection] = []
+        self._ssl = ssl.create_default_context() if self.use_ssl else None
+
+    async def _connect(self) -> _Connection:
+        if self._idle:
+            return self._idle.pop()
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self._ssl)
+        return _Connection(reader, writer)
+
+    async def _read_body(self, reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip(), 16)
+                if size == 0:
+                    # Skip trailers up to the blank line
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            return b"".join(chunks)
+        if "content-length" in headers:
+            return await reader.readexactly(int(headers["content-length"]))
+        return await reader.read()
+
+    async def _request(self, conn: _Connection, target: str) -> Tuple[int, Dict[str, str], bytes]:
+        request = (
+            f"GET {target} HTTP/1.1\r\n"
+            f"Host: {self.host}\r\n"
+            f"User-Agent: {USER_AGENT}\r\n"
+            f"Accept: application/json\r\n"
+            f"Accept-Encoding: gzip\r\n"
+            f"Connection: keep-alive\r\n\r\n"
+        )
+        conn.writer.write(request.encode("ascii"))
+        await conn.writer.drain()
+
+        status_line = await conn.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await conn.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        body = await self._read_body(conn.reader, headers)
+        if headers.get("content-encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        return status, headers, body
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> bytes:
+        """GET base_path + path, retrying transient failures with backoff."""
+        target = self.base_path + path
+        if params:
+            target += "?" + urlencode(params)
+
+        for attempt in range(MAX_RETRIES + 1):
+            await self.bucket.acquire()
+            # Backoff sleeps happen after the slot is released, so other requests keep the connections busy
+            async with self._slots:
+                conn = None
+                try:
+                    conn = await self._connect()
+                    status, headers, body = await asyncio.wait_for(
+                        self._request(conn, target), REQUEST_TIMEOUT
+                    )
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError, IndexError):
+                    # Stale keep-alive connections surface here too; retry on a fresh one
+                    if conn is not None:
+                        conn.close()
+                    if attempt == MAX_RETRIES:
+                        raise
+                    status = None
+                else:
+                    if headers.get("connection", "").lower() == "close":
+                        conn.close()
+                    else:
+                        self._idle.append(conn)
+
+            if status is None:
+                await asyncio.sleep(min(2 ** attempt, 30))
+                continue
+            if status == 200:
+                return body
+            retry_after = headers.get("retry-after")
+            error = HTTPError(status, body, float(retry_after) if retry_after and retry_after.isdigit() else None)
+            if status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                raise error
+            await asyncio.sleep(error.retry_after or min(2 ** attempt, 30))
+
+        raise RuntimeError("unreachable")
+
+    def close(self):
+        for conn in self._idle:
+            conn.close()
+        self._idle.clear()
+
+
+# ============================================================================
+# Checkpoint
+# ============================================================================
+
+def load_checkpoint(checkpoint_path: Path, query: Dict[str, str]) -> Dict[str, Any]:
+    """Load the crawl checkpoint; start fresh if missing or for a different query."""
+    if checkpoint_path.exists():
+        try:
+            with open(checkpoint_path, "r") as f:
+                checkpoint = json.load(f)
+            if checkpoint.get("version") == CHECKPOINT_VERSION and checkpoint.get("query") == query:
+                return checkpoint
+        except (json.JSONDecodeError, OSError):
+            pass
+    return {
+        "version": CHECKPOINT_VERSION,
+        "query": query,
+        "next_page_token": None,
+        "listing_complete": False,
+        "ids": [],
+        "failed": {},
+    }
+
+
+def save_checkpoint(checkpoint: Dict[str, Any], checkpoint_path: Path):
+    """Write the checkpoint atomically so an interrupt never leaves it half-written."""
+    tmp_path = checkpoint_path.with_suffix(checkpoint_path.suffix + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def write_trial_file(data_dir: Path, nct_id: str, body: bytes) -> bool:
+    """
+    Write one study's JSON exactly as served, atomically.
+    Leaves the file (and its mtime) alone if the content is unchanged.
+    A changed trial in a compressed corpus is written as plain JSON and its
+    stale .json.zst removed (re-run `trial_store.py compress` to repack).
+    Returns True if the file was created or rewritten.
+    """
+    existing = trial_file_path(data_dir, nct_id)
+    if existing.exists() and read_trial_bytes(existing) == body:
+        return False
+    path = data_dir / f"{nct_id}.json"
+    tmp_path = data_dir / f".{nct_id}.json.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+    if existing.name.endswith(ZSTD_SUFFIX):
+        existing.unlink()
+    return True
+
+
+# ============================================================================
+# Crawl
+# ============================================================================
+
+async def list_trial_ids(client: AsyncHTTPClient, checkpoint: Dict[str, Any],
+                         checkpoint_path: Path):
+    """Page through /studies collecting NCT IDs, checkpointing after every page."""
+    seen = set(checkpoint["ids"])
+    while not checkpoint["listing_complete"]:
+        params = dict(checkpoint["query"])
+        params.update({"fields": "NCTId", "pageSize": LIST_PAGE_SIZE, "format": "json"})
+        if checkpoint["next_page_token"]:
+            params["pageToken"] = checkpoint["next_page_token"]
+
+        page = json.loads(await client.get("/studies", params))
+        for study in page.get("studies", []):
+            nct_id = study["protocolSection"]["identificationModule"]["nctId"]
+            if nct_id not in seen:
+                seen.add(nct_id)
+                checkpoint["ids"].append(nct_id)
+
+        checkpoint["next_page_token"] = page.get("nextPageToken")
+        checkpoint["listing_complete"] = not checkpoint["next_page_token"]
+        save_checkpoint(checkpoint, checkpoint_path)
+        print(f"  Listed {len(checkpoint['ids'])} trials...")
+
+
+async def fetch_trials(client: AsyncHTTPClient, nct_ids: List[str], data_dir: Path,
+                       checkpoint: Dict[str, Any], checkpoint_path: Path,
+                       concurrency: int) -> Dict[str, Any]:
+    """
+    Download each study with `concurrency` workers.
+    Returns {"fetched": n, "failed": n, "changed": [IDs whose file was written]}.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for nct_id in nct_ids:
+        queue.put_nowait(nct_id)
+    counts = {"fetched": 0, "failed": 0, "changed": []}
+
+    async def worker():
+        while True:
+            try:
+                nct_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                body = await client.get(f"/studies/{nct_id}", {"format": "json"})
+                json.loads(body)  # Reject truncated/garbled payloads before writing
+                if write_trial_file(data_dir, nct_id, body):
+                    counts["changed"].append(nct_id)
+                checkpoint["failed"].pop(nct_id, None)
+                counts["fetched"] += 1
+                if counts["fetched"] % 100 == 0:
+                    print(f"  Fetched {counts['fetched']}/{len(nct_ids)} trials...")
+            except Exception as e:
+                checkpoint["failed"][nct_id] = str(e)
+                counts["failed"] += 1
+                print(f"Error fetching {nct_id}: {e}")
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    save_checkpoint(checkpoint, checkpoint_path)
+    counts["changed"].sort()
+    return counts
+
+
+async def download_corpus(query: Dict[str, str], data_dir: Path = DEFAULT_DATA_DIR,
+                          checkpoint_path: Optional[Path] = None,
+                          base_url: str = CTGOV_BASE_URL,
+                          concurrency: int = DEFAULT_CONCURRENCY,
+                          rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+                          refetch: bool = False) -> Dict[str, int]:
+    """
+    List and download every trial matching `query` (CT.gov /studies params,
+    e.g. {"query.cond": "..."}) into data_dir. Safe to re-run after an
+    interrupt: listing resumes from the saved page token and trials already
+    on disk are skipped unless refetch=True.
+    """
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint_path = Path(checkpoint_path) if checkpoint_path else checkpoint_path_for(data_dir)
+    checkpoint = load_checkpoint(checkpoint_path, query)
+
+    client = AsyncHTTPClient(base_url, concurrency, TokenBucket(rate, burst))
+    try:
+        await list_trial_ids(client, checkpoint, checkpoint_path)
+        if refetch:
+            pending = list(checkpoint["ids"])
+        else:
+            pending = [i for i in checkpoint["ids"] if not trial_file_path(data_dir, i).exists()]
+        print(f"  {len(checkpoint['ids'])} listed, {len(pending)} to fetch")
+        counts = await fetch_trials(client, pending, data_dir, checkpoint,
+                                    checkpoint_path, concurrency)
+    finally:
+        client.close()
+
+    return {"listed": len(checkpoint["ids"]), "fetched": counts["fetched"], "failed": counts["failed"]}
+
+
+# ============================================================================
+# Change-Feed Sync
+# ============================================================================
+
+def load_sync_state(data_dir: Path = DEFAULT_DATA_DIR) -> Dict[str, Any]:
+    """Load the sync state, or an empty one if the corpus was never synced."""
+    state_path = sync_state_path_for(data_dir)
+    if state_path.exists():
+        try:
+            with open(state_path, "r") as f:
+                state = json.load(f)
+            if state.get("version") == 1:
+                # v1 kept one list for every rebuild; each rebuild still owes it
+                state["changed_ids"] = {consumer: list(state["changed_ids"]) for consumer in CHANGE_CONSUMERS}
+                state["version"] = SYNC_STATE_VERSION
+            if state.get("version") == SYNC_STATE_VERSION:
+                return state
+        except json.JSONDecodeError:
+            pass
+    return {"version": SYNC_STATE_VERSION, "watermark": None, "last_sync": None,
+            "changed_ids": {consumer: [] for consumer in CHANGE_CONSUMERS}}
+
+
+def save_sync_state(data_dir: Path, state: Dict[str, Any]):
+    save_checkpoint(state, sync_state_path_for(data_dir))
+
+
+def last_changed_ids(data_dir: Path, consumer: str) -> List[str]:
+    """NCT IDs rewritten by syncs since consumer's last successful rebuild."""
+    return load_sync_state(data_dir)["changed_ids"].get(consumer, [])
+
+
+def clear_changed_ids(data_dir: Path, consumer: str, nct_ids: Iterable[str]):
+    """
+    Mark nct_ids as rebuilt by consumer. Call only after the rebuild
+    succeeded; IDs added by a sync since it started stay pending.
+    """
+    state = load_sync_state(data_dir)
+    done = set(nct_ids)
+    state["changed_ids"][consumer] = [i for i in state["changed_ids"].get(consumer, []) if i not in done]
+    save_sync_state(data_dir, state)
+
+
+def local_watermark(data_dir: Path = DEFAULT_DATA_DIR) -> Optional[str]:
+    """Newest LastUpdatePostDate in the local corpus (from the trial store if fresh)."""
+    store = open_store(data_dir)
+    if store is not None:
+        structs = store.column(LAST_UPDATE_COLUMN)
+    else:
+        structs = [
+            trial_data.get("protocolSection", {}).get("statusModule", {}).get("lastUpdatePostDateStruct")
+            for _, trial_data in iter_trials(data_dir)
+        ]
+    dates = [s["date"] for s in structs if s and s.get("date")]
+    return max(dates) if dates else None
+
+
+async def sync_corpus(query: Dict[str, str], data_dir: Path = DEFAULT_DATA_DIR,
+                      since: Optional[str] = None,
+                      base_url: str = CTGOV_BASE_URL,
+                      concurrency: int = DEFAULT_CONCURRENCY,
+                      rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST) -> Dict[str, Any]:
+    """
+    Fetch only trials updated on or after the watermark (since, else the
+    saved watermark, else the newest update date in the local corpus) and
+    rewrite those whose content changed.
+
+    The range is inclusive of the watermark day, since CT.gov update dates
+    have day granularity; same-day re-fetches are dropped by the content
+    comparison in write_trial_file. The watermark only advances when every
+    listed trial was fetched, so failures are retried on the next sync.
+    """
+    data_dir = Path(data_dir)
+    state = load_sync_state(data_dir)
+    watermark = since or state["watermark"] or local_watermark(data_dir)
+    if not watermark:
+        raise ValueError(f"No sync watermark for {data_dir}; run a full download first")
+
+    sync_started = datetime.now(timezone.utc).date().isoformat()
+    sync_query = dict(query)
+    sync_query["filter.advanced"] = f"AREA[LastUpdatePostDate]RANGE[{watermark},MAX]"
+    checkpoint_path = data_dir.parent / f"{data_dir.name}.sync-download.json"
+    checkpoint = load_checkpoint(checkpoint_path, sync_query)
+
+    client = AsyncHTTPClient(base_url, concurrency, TokenBucket(rate, burst))
+    try:
+        await list_trial_ids(client, checkpoint, checkpoint_path)
+        print(f"  {len(checkpoint['ids'])} trials updated since {watermark}")
+        counts = await fetch_trials(client, checkpoint["ids"], data_dir, checkpoint,
+                                    checkpoint_path, concurrency)
+    finally:
+        client.close()
+
+    if not counts["failed"]:
+        state["watermark"] = sync_started
+        checkpoint_path.unlink(missing_ok=True)
+    state["last_sync"] = datetime.now().isoformat()
+    # Merge with IDs earlier syncs changed that a rebuild hasn't processed yet
+    for consumer in CHANGE_CONSUMERS:
+        pending = set(state["changed_ids"].get(consumer, [])) | set(counts["changed"])
+        state["changed_ids"][consumer] = sorted(pending)
+    save_sync_state(data_dir, state)
+
+    return {
+        "since": watermark,
+        "listed": len(checkpoint["ids"]),
+        "fetched": counts["fetched"],
+        "failed": counts["failed"],
+        "changed": counts["changed"],
+        "watermark": state["watermark"],
+    }
+
+
+def rebuild_changed(data_dir: Path = DEFAULT_DATA_DIR):
+    """Re-run the incremental CSV builds that have changed IDs pending (each clears its own on success)."""
+    scripts_dir = Path(__file__).parent / "scripts"
+    for consumer in ("generate_trials_csv", "analyze_outcomes"):
+        if not last_changed_ids(data_dir, consumer):
+            continue
+        print(f"\nRebuilding {consumer}.py for changed trials...")
+        subprocess.run([sys.executable, str(scripts_dir / f"{consumer}.py"), "--changed"], check=True)
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def _flag_value(argv: List[str], flag: str, default: Optional[str] = None) -> Optional[str]:
+    return argv[argv.index(flag) + 1] if flag in argv[:-1] else default
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    query = {"query.cond": _flag_value(argv, "--cond", DEFAULT_CONDITION)}
+    if _flag_value(argv, "--term"):
+        query["query.term"] = _flag_value(argv, "--term")
+    if _flag_value(argv, "--status"):
+        query["filter.overallStatus"] = _flag_value(argv, "--status")
+
+    data_dir = Path(_flag_value(argv, "--data-dir", str(DEFAULT_DATA_DIR)))
+    start = time.time()
+
+    if "--sync" in argv:
+        print(f"Syncing {data_dir} for {query}...")
+        stats = asyncio.run(sync_corpus(
+            query,
+            data_dir=data_dir,
+            since=_flag_value(argv, "--since"),
+            base_url=_flag_value(argv, "--base-url", CTGOV_BASE_URL),
+            concurrency=int(_flag_value(argv, "--concurrency", DEFAULT_CONCURRENCY)),
+            rate=float(_flag_value(argv, "--rate", DEFAULT_RATE)),
+        ))
+        print(f"\n✓ {len(stats['changed'])} changed, {stats['fetched']} fetched, "
+              f"{stats['failed']} failed since {stats['since']} ({time.time() - start:.1f}s)")
+        print(f"✓ Watermark: {stats['watermark']}")
+        if "--rebuild" in argv:
+            rebuild_changed(data_dir)
+        sys.exit(0)
+
+    print(f"Downloading trials for {query} into {data_dir}...")
+    stats = asyncio.run(download_corpus(
+        query,
+        data_dir=data_dir,
+        base_url=_flag_value(argv, "--base-url", CTGOV_BASE_URL),
+        concurrency=int(_flag_value(argv, "--concurrency", DEFAULT_CONCURRENCY)),
+        rate=float(_flag_value(argv, "--rate", DEFAULT_RATE)),
+        refetch="--refetch" in argv,
+    ))
+    print(f"\n✓ {stats['fetched']} fetched, {stats['failed']} failed, "
+          f"{stats['listed']} listed ({time.time() - start:.1f}s)")
+    if stats["failed"]:
+        print(f"Re-run to retry failed trials (see {checkpoint_path_for(data_dir)})")
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Shared Trial Extraction Engine
+
+Parses each trial once and hands it to every registered output sink
+(summary CSV, outcomes CSV, pruned LLM payloads, ...). Also holds the
+outcome helpers shared by scripts/generate_trials_csv.py and
+scripts/analyze_outcomes.py so the two reports can't drift apart.
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from keyword_matcher import KeywordMatcher
+
+
+# Keywords that indicate safety/adverse event measures - exclude these from efficacy columns.
+# Matching is word-bounded (see keyword_matcher), so abbreviations need no padding;
+# longer keywords also match their plural, "*" also matches as a word suffix.
+SAFETY_KEYWORDS = {
+    'trae', 'sae', 'saes', 'adverse event', 'ae', 'aes',
+    'discontinuation', '*toxicity', '*toxicities', 'adverse reaction', 'immune-mediated'
+}
+
+# Standard oncology outcome metrics to look for
+STANDARD_OUTCOMES = {
+    'OS': ['overall survival', 'os'],
+    'PFS': ['progression-free survival', 'progression free survival', 'pfs'],
+    'DFS': ['disease-free survival', 'disease free survival', 'dfs'],
+    'RR': ['response rate', 'rr'],
+    'ORR': ['objective response rate', 'orr'],
+    'TTP': ['time to progression', 'ttp'],
+    'TTF': ['time to treatment failure', 'ttf'],
+    'EFS': ['event-free survival', 'efs'],
+    'LRFS': ['locoregional recurrence-free survival', 'lrfs'],
+    'DMFS': ['distant metastasis-free survival', 'dmfs'],
+    'CR': ['complete response', 'cr'],
+    'PR': ['partial response', 'pr'],
+    'DoR': ['duration of response', 'dor', 'cdor'],
+    'CBR': ['clinical benefit rate', 'cbr'],
+    'TOX': ['*toxicity', '*toxicities', 'safety', 'adverse events', 'ae', 'aes'],
+    'QOL': ['quality of life', 'qol', 'hrqol', 'euroqol'],
+}
+
+# Matched but never reported: TTF-1 is thyroid transcription factor 1, not time to treatment failure
+OUTCOME_EXCLUDE = ['ttf-1']
+
+# Compiled once at import; each returns all matched labels from a single scan
+SAFETY_MATCHER = KeywordMatcher({'SAFETY': SAFETY_KEYWORDS})
+OUTCOME_MATCHER = KeywordMatcher(STANDARD_OUTCOMES, exclude=OUTCOME_EXCLUDE)
+
+
+# ============================================================================
+# Shared Outcome Helpers
+# ============================================================================
+
+def normalize_text(text: str) -> str:
+    """Normalize text for comparison."""
+    if not text:
+        return ""
+    return text.lower().strip()
+
+
+def is_safety_measure(text: str) -> bool:
+    """Check if a measure is a safety/adverse event measure."""
+    return SAFETY_MATCHER.matches(text)
+
+
+def format_outcome_measure(outcome: Dict) -> str:
+    """
+    Format a single outcome measure with available data.
+    Returns empty string if no measurement data exists or value is NA.
+    Only includes title, param type, unit, and measured value.
+    """
+    title = outcome.get('title', '')
+    param_type = outcome.get('paramType', '')
+    unit = outcome.get('unitOfMeasure', '')
+
+    # Try to get the first measurement value if available
+    value_str = ""
+
+    if 'classes' in outcome and outcome['classes']:
+        if 'categories' in outcome['classes'][0] and outcome['classes'][0]['categories']:
+            cat = outcome['classes'][0]['categories'][0]
+            if 'measurements' in cat and cat['measurements']:
+                m = cat['measurements'][0]
+                value = m.get('value', '')
+                lower = m.get('lowerLimit', '')
+                upper = m.get('upperLimit', '')
+
+                # Skip NA values
+                if value and value.strip().upper() != 'NA':
+                    if lower and upper and lower.strip().upper() != 'NA' and upper.strip().upper() != 'NA':
+                        value_str = f"{value} [{lower}-{upper}]"
+                    else:
+                        value_str = f"{value}"
+
+    # Only return formatted measure if we have actual measurement data
+    if not value_str:
+        return ""
+
+    parts = [title]
+    if param_type:
+        parts.append(f"({param_type})")
+    if unit:
+        parts.append(unit)
+    parts.append(f"= {value_str}")
+
+    return " ".join(parts)
+
+
+def extract_outcomes_from_trial(trial_data: Dict) -> Tuple[List[str], List[str]]:
+    """
+    Extract primary and secondary outcome measures from trial data.
+    Prefers actual results data from outcomeMeasuresModule, falls back to protocol.
+    Returns (primary_outcomes, secondary_outcomes) as lists of measure texts.
+    """
+    primary = []
+    secondary = []
+
+    # Try resultsSection with outcomeMeasuresModule first (actual results data)
+    if 'resultsSection' in trial_data:
+        if 'outcomeMeasuresModule' in trial_data['resultsSection']:
+            om = trial_data['resultsSection']['outcomeMeasuresModule']
+            if 'outcomeMeasures' in om:
+                for outcome in om['outcomeMeasures']:
+                    measure_text = format_outcome_measure(outcome)
+                    outcome_type = outcome.get('type', '').upper()
+                    if outcome_type == 'PRIMARY':
+                        primary.append(measure_text)
+                    elif outcome_type == 'SECONDARY':
+                        secondary.append(measure_text)
+
+    # Fall back to protocolSection outcomes if results data not found
+    if not primary and not secondary:
+        if 'protocolSection' in trial_data:
+            if 'outcomesModule' in trial_data['protocolSection']:
+                outcomes = trial_data['protocolSection']['outcomesModule']
+                if 'primaryOutcomes' in outcomes:
+                    primary = [o.get('measure', '') for o in outcomes['primaryOutcomes']]
+                if 'secondaryOutcomes' in outcomes:
+                    secondary = [o.get('measure', '') for o in outcomes['secondaryOutcomes']]
+
+    return primary, secondary
+
+
+def classify_measures(primary_outcomes: List[str], secondary_outcomes: List[str]) -> Dict[str, str]:
+    """
+    Match every measure against all STANDARD_OUTCOMES in one scan per measure.
+    Excludes safety measures from efficacy outcome columns and non-safety
+    measures from the TOX column.
+    Returns {outcome_key: concatenated matching measures}.
+    """
+    matching = {key: [] for key in STANDARD_OUTCOMES}
+
+    for measure in primary_outcomes + secondary_outcomes:
+        if not measure:
+            continue
+
+        is_safety = is_safety_measure(measure)
+        for outcome_key in OUTCOME_MATCHER.labels(measure):
+            if (outcome_key == 'TOX') == is_safety:
+                matching[outcome_key].append(measure)
+
+    return {key: '; '.join(measures) for key, measures in matching.items()}
+
+
+def extract_measures_for_outcome_type(outcome_key: str, primary_outcomes: List[str], secondary_outcomes: List[str]) -> str:
+    """
+    Extract actual measure text that matches a specific outcome type.
+    Returns concatenated measures as string.
+    """
+    return classify_measures(primary_outcomes, secondary_outcomes)[outcome_key]
+
+
+# ============================================================================
+# Parsed Trial
+# ============================================================================
+
+class TrialRecord:
+    """
+    One parsed trial shared by every sink.
+    Derived values (outcome lists, per-type measures) are computed on first
+    use and then reused, so each trial is only analysed once per run.
+    """
+
+    def __init__(self, trial_id: str, data: Dict[str, Any]):
+        self.trial_id = trial_id
+        self.data = data
+        self._outcomes = None
+        self._outcome_measures = None
+
+    @property
+    def outcomes(self) -> Tuple[List[str], List[str]]:
+        """(primary, secondary) outcome measure texts."""
+        if self._outcomes is None:
+            self._outcomes = extract_outcomes_from_trial(self.data)
+        return self._outcomes
+
+    @property
+    def outcome_measures(self) -> Dict[str, str]:
+        """Matching measure text for each STANDARD_OUTCOMES key."""
+        if self._outcome_measures is None:
+            primary, secondary = self.outcomes
+            self._outcome_measures = classify_measures(primary, secondary)
+        return self._outcome_measures
+
+
+# ============================================================================
+# Output Sinks
+# ============================================================================
+
+class TrialSink:
+    """Base class for engine outputs. Subclasses implement add() and close()."""
+
+    name = "sink"
+
+    def add(self, record: TrialRecord):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RowSink(TrialSink):
+    """
+    Collects one row per trial via row_fn(record) and writes them all with
+    write_fn(rows, output_path) when the run finishes.
+    """
+
+    def __init__(self, name: str, output_path: Path,
+                 row_fn: Callable[[TrialRecord], Dict],
+                 write_fn: Callable[[List[Dict], Path], None]):
+        self.name = name
+        self.output_path = Path(output_path)
+        self.row_fn = row_fn
+        self.write_fn = write_fn
+        self.rows = []
+
+    def add(self, record: TrialRecord):
+        self.rows.append(self.row_fn(record))
+
+    def close(self):
+        self.write_fn(self.rows, self.output_path)
+
+
+class JsonlSink(TrialSink):
+    """Streams one {"nct_id": ..., "payload": ...} line per trial."""
+
+    def __init__(self, name: str, output_path: Path, payload_fn: Callable[[Dict], Any]):
+        self.name = name
+        self.output_path = Path(output_path)
+        self.payload_fn = payload_fn
+        self.count = 0
+        self._file = open(self.output_path, 'w', encoding='utf-8')
+
+    def add(self, record: TrialRecord):
+        line = {"nct_id": record.trial_id, "payload": self.payload_fn(record.data)}
+        self._file.write(json.dumps(line, ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+def run_engine(trials: Iterable[Tuple[str, Dict[str, Any]]], sinks: List[TrialSink],
+               progress_every: int = 50) -> List[Tuple[str, str, str]]:
+    """
+    Feed every trial to every sink, parsing each trial exactly once.
+    A failure in one sink doesn't stop the others.
+    Returns [(sink name, trial_id, error), ...].
+    """
+    errors = []
+    count = 0
+
+    for trial_id, trial_data in trials:
+        record = TrialRecord(trial_id, trial_data)
+        for sink in sinks:
+            try:
+                sink.add(record)
+            except Exception as e:
+                errors.append((sink.name, trial_id, str(e)))
+
+        count += 1
+        if progress_every and count % progress_every == 0:
+            print(f"  Processed {count} trials...")
+
+    for sink in sinks:
+        sink.close()
+
+    return errors
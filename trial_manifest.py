@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Incremental Trial Row Manifest
+
+Keeps a per-file content hash and the cached extracted row for every trial,
+so CSV generators only re-extract trials whose JSON was added or changed
+and drop trials whose file was removed.
+
+Manifest format (JSON):
+{
+  "version": 1,
+  "extractor_version": "<bumped by the script when its row logic changes>",
+  "trials": {
+    "NCT00000000": {"sha256": "...", "size": 123, "mtime_ns": 456, "row": {...}}
+  }
+}
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from trial_store import STORE_COLUMNS, list_trial_files, load_trial_file, trial_file_id
+
+
+MANIFEST_VERSION = 1
+
+
+def get_file_hash(file_path: Path) -> str:
+    """SHA-256 of the file contents (also used for the DAG extractor's image caches)."""
+    sha256_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for byte_block in iter(lambda: f.read(65536), b""):
+            sha256_hash.update(byte_block)
+    return sha256_hash.hexdigest()
+
+
+def load_manifest(manifest_path: Path) -> Dict[str, Any]:
+    """Load a row manifest, or an empty one if missing or unreadable."""
+    manifest_path = Path(manifest_path)
+    if manifest_path.exists():
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                return manifest
+        except json.JSONDecodeError:
+            pass
+    return {"version": MANIFEST_VERSION, "extractor_version": None, "trials": {}}
+
+
+def save_manifest(manifest_path: Path, manifest: Dict[str, Any]):
+    """Atomically write the manifest."""
+    manifest_path = Path(manifest_path)
+    manifest["last_updated"] = datetime.now().isoformat()
+    tmp_path = manifest_path.with_suffix(manifest_path.suffix + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def extract_files_serial(json_files: List[Path], extract_row: Callable[[Dict[str, Any], str], Dict[str, Any]]
+                         ) -> Tuple[Dict[str, Dict[str, Any]], List[Tuple[str, str]]]:
+    """Extract rows from trial files (STORE_COLUMNS paths only). Returns ({trial_id: row}, errors)."""
+    rows, errors = {}, []
+    for json_file in json_files:
+        trial_id = trial_file_id(json_file)
+        try:
+            rows[trial_id] = extract_row(load_trial_file(json_file, STORE_COLUMNS), trial_id)
+        except Exception as e:
+            errors.append((trial_id, str(e)))
+    return rows, errors
+
+
+def update_rows(data_dir: Path, manifest_path: Path,
+                extract_row: Callable[[Dict[str, Any], str], Dict[str, Any]],
+                extractor_version: str,
+                only_ids: Optional[Iterable[str]] = None,
+                extract_files: Optional[Callable[[List[Path]], Tuple[Dict[str, Dict[str, Any]], List[Tuple[str, str]]]]] = None
+                ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Bring the cached rows in manifest_path up to date with data_dir.
+
+    - Unchanged files (same size and mtime, or same content hash) reuse their cached row
+    - Added or changed files are re-extracted with extract_row(trial_data, trial_id),
+      where trial_data holds only the STORE_COLUMNS paths (streamed, like the store)
+    - Removed files are dropped
+    - A different extractor_version invalidates every cached row
+    - only_ids (e.g. the changed IDs from trial_download --sync) limits the
+      checks to those trials: other cached trials are reused without a stat
+      or hash, trials missing from the manifest are still extracted
+    - extract_files, if given, extracts all added/changed files in one call
+      (e.g. across a process pool) and returns ({trial_id: row}, [(trial_id, error), ...]);
+      by default they are extracted one by one with extract_row
+
+    Returns (rows in Trial_ID order, stats dict with added/changed/removed/
+    unchanged trial ID lists and per-trial errors).
+    """
+    manifest = load_manifest(manifest_path)
+    if manifest.get("extractor_version") != extractor_version:
+        manifest["trials"] = {}
+        manifest["extractor_version"] = extractor_version
+
+    cached = manifest["trials"]
+    stats = {"added": [], "changed": [], "removed": [], "unchanged": [], "errors": []}
+    seen = set()
+    only = set(only_ids) if only_ids is not None else None
+    pending = []  # (trial_id, json_file, stat, sha256, cached entry) to extract
+
+    for json_file in list_trial_files(data_dir):
+        trial_id = trial_file_id(json_file)
+        seen.add(trial_id)
+        entry = cached.get(trial_id)
+
+        if only is not None and entry and trial_id not in only:
+            stats["unchanged"].append(trial_id)
+            continue
+
+        st = json_file.stat()
+
+        if entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            stats["unchanged"].append(trial_id)
+            continue
+
+        file_hash = get_file_hash(json_file)
+        if entry and entry.get("sha256") == file_hash:
+            # Touched but not modified; refresh the stat fields only
+            entry["size"] = st.st_size
+            entry["mtime_ns"] = st.st_mtime_ns
+            stats["unchanged"].append(trial_id)
+            continue
+
+        pending.append((trial_id, json_file, st, file_hash, entry))
+
+    if extract_files is None:
+        extract_files = lambda paths: extract_files_serial(paths, extract_row)
+    rows, errors = extract_files([json_file for _, json_file, _, _, _ in pending])
+    stats["errors"].extend(errors)
+    for trial_id, json_file, st, file_hash, entry in pending:
+        if trial_id not in rows:
+            cached.pop(trial_id, None)
+            continue
+        stats["changed" if entry else "added"].append(trial_id)
+        cached[trial_id] = {
+            "sha256": file_hash,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "row": rows[trial_id],
+        }
+
+    for trial_id in [tid for tid in cached if tid not in seen]:
+        del cached[trial_id]
+        stats["removed"].append(trial_id)
+
+    save_manifest(manifest_path, manifest)
+
+    rows = [cached[trial_id]["row"] for trial_id in sorted(cached)]
+    return rows, stats
+
+
+def print_update_stats(stats: Dict[str, Any]):
+    """Print a one-line summary of an incremental update plus any errors."""
+    print(f"  Added: {len(stats['added'])} | Changed: {len(stats['changed'])} | "
+          f"Removed: {len(stats['removed'])} | Unchanged: {len(stats['unchanged'])}")
+    for trial_id, error in stats["errors"]:
+        print(f"Error processing {trial_id}: {error}")
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Declarative Field Projections
+
+Outputs describe the JSON paths they need as a spec, and compile_projection
+turns it into one generated Python function that walks the trial dict once,
+visiting each shared prefix (protocolSection, statusModule, ...) a single
+time instead of re-navigating it per field with safe_get chains and
+'x' in d checks.
+
+Spec format: {output_key: field}, where field is
+- "dotted.path"                          value at path, else ''
+- Field("dotted.path", transform, default)
+- a nested spec dict                     builds a nested output dict
+
+Path segments are dict keys; a "*" segment maps the rest of the path over a
+list (e.g. "protocolSection.outcomesModule.primaryOutcomes.*.measure").
+Transforms only run on values that are present; missing paths get the
+default (list/dict defaults are copied per call). Every compiled projection exposes .paths, the full set of JSON
+paths it reads, which can be passed to trial_store.load_trial_file to stream
+only those paths from a raw trial file.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+
+class Field:
+    """One projected value: the JSON path, an optional transform and a default."""
+
+    __slots__ = ("path", "transform", "default")
+
+    def __init__(self, path: str, transform: Optional[Callable[[Any], Any]] = None, default: Any = ""):
+        self.path = path
+        self.transform = transform
+        self.default = default
+
+
+Spec = Dict[str, Union[str, Field, "Spec"]]
+
+_MISSING = object()
+
+
+def _flatten_spec(spec: Spec, prefix: Tuple[str, ...] = ()) -> List[Tuple[Tuple[str, ...], Field]]:
+    """[(output key path, Field), ...] in spec order."""
+    leaves = []
+    for key, value in spec.items():
+        if isinstance(value, dict):
+            leaves.extend(_flatten_spec(value, prefix + (key,)))
+        else:
+            leaves.append((prefix + (key,), value if isinstance(value, Field) else Field(value)))
+    return leaves
+
+
+def _collect(value: Any, rest: List[str]) -> List[Any]:
+    """Values under a '*' segment: rest of the path applied to every list item."""
+    if not isinstance(value, list):
+        return _MISSING
+    found = []
+    for item in value:
+        for i, key in enumerate(rest):
+            if key == "*":
+                item = _collect(item, rest[i + 1:])
+                break
+            if not isinstance(item, dict) or key not in item:
+                item = _MISSING
+                break
+            item = item[key]
+        if item is not _MISSING:
+            if rest and "*" in rest:
+                found.extend(item)
+            else:
+                found.append(item)
+    return found
+
+
+def compile_projection(spec: Spec, name: str = "projection") -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Compile a spec into a function trial_data -> projected dict.
+    The generated code nests one dict lookup per path segment, shared by all
+    fields under the same prefix.
+    """
+    leaves = _flatten_spec(spec)
+    consts: List[Any] = []
+
+    def const(value: Any) -> str:
+        consts.append(value)
+        return f"_c[{len(consts) - 1}]"
+
+    # Trie over the dict-key prefix of each path ("*" and beyond is handled by _collect)
+    trie: Dict[str, Any] = {"children": {}, "fields": []}
+    for out_path, field in leaves:
+        segments = field.path.split(".")
+        star = segments.index("*") if "*" in segments else len(segments)
+        node = trie
+        for key in segments[:star]:
+            node = node["children"].setdefault(key, {"children": {}, "fields": []})
+        node["fields"].append((out_path, field, segments[star + 1:] if star < len(segments) else None))
+
+    # Output containers, prefilled with defaults in spec order
+    lines = [f"def {name}(d):"]
+    containers = {(): "out"}
+
+    def container(out_path: Tuple[str, ...]) -> str:
+        return containers[out_path[:-1]]
+
+    def build_literal(sub_spec: Spec, prefix: Tuple[str, ...], var: str, indent: str):
+        items = []
+        for key, value in sub_spec.items():
+            if isinstance(value, dict):
+                child_var = f"o{len(containers)}"
+                containers[prefix + (key,)] = child_var
+                build_literal(value, prefix + (key,), child_var, indent)
+                items.append(f"{key!r}: {child_var}")
+            else:
+                field = value if isinstance(value, Field) else Field(value)
+                default = const(field.default)
+                if isinstance(field.default, (list, dict)):
+                    default += ".copy()"  # Fresh mutable default per call
+                items.append(f"{key!r}: {default}")
+        lines.append(f"{indent}{var} = {{{', '.join(items)}}}")
+
+    build_literal(spec, (), "out", "    ")
+
+    counter = [0]
+
+    def emit(node: Dict[str, Any], var: str, indent: str):
+        for key, child in node["children"].items():
+            counter[0] += 1
+            child_var = f"v{counter[0]}"
+            lines.append(f"{indent}{child_var} = {var}.get({key!r}, _MISSING)")
+            if child["fields"]:
+                lines.append(f"{indent}if {child_var} is not _MISSING:")
+                for out_path, field, star_rest in child["fields"]:
+                    value = child_var
+                    if star_rest is not None:
+                        value = f"_collect({child_var}, {const(star_rest)})"
+                        lines.append(f"{indent}    _s = {value}")
+                        lines.append(f"{indent}    if _s is not _MISSING:")
+                        target = f"{indent}        "
+                        value = "_s"
+                    else:
+                        target = f"{indent}    "
+                    if field.transform is not None:
+                        value = f"{const(field.transform)}({value})"
+                    lines.append(f"{target}{container(out_path)}[{out_path[-1]!r}] = {value}")
+            if child["children"]:
+                lines.append(f"{indent}if {child_var}.__class__ is dict:")
+                emit(child, child_var, indent + "    ")
+
+    lines.append("    if d.__class__ is dict:")
+    emit(trie, "d", "        ")
+    lines.append("    return out")
+
+    namespace = {"_MISSING": _MISSING, "_collect": _collect, "_c": consts}
+    exec(compile("\n".join(lines), f"<{name}>", "exec"), namespace)
+    func = namespace[name]
+    func.paths = sorted({field.path for _, field in leaves})
+    return func
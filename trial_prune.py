@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Trial Pruning for LLM Extraction
+
+Reduces raw ClinicalTrials.gov study JSON to the parts the extraction prompt
+needs (identification, arms, eligibility, key outcomes), and estimates how
+many tokens a request will cost without calling the model's tokenizer.
+
+Two pruning modes (PRUNE_MODES, serialized by pruned_payload):
+- v1: prune_trial_json, full criteria text and outcome objects, indent=2
+- v2: prune_trial_json_v2, only criteria lines with biomarker, stage or
+  line-of-therapy signal, outcomes collapsed to their statistical analyses
+  (param, value, CI, p-value), empty fields dropped, compact JSON
+
+Usage:
+    python trial_prune.py report [data_dir]    Bytes/tokens per mode over the corpus
+"""
+
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from keyword_matcher import KeywordMatcher
+from trial_projection import Field, compile_projection
+
+
+# Letters, short digit runs and single punctuation marks; long words count as ~4 chars per token
+TOKEN_PIECE = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+CHARS_PER_WORD_TOKEN = 4
+
+
+def _relevant_outcomes(all_outcomes: list) -> list:
+    """Primary outcomes plus any survival/progression/response measures."""
+    relevant_outcomes = []
+    for out in all_outcomes:
+        t_upper = out.get('title', '').upper()
+        if (out.get('type') == 'PRIMARY' or 
+            'SURVIVAL' in t_upper or 
+            'PROGRESSION' in t_upper or 
+            'RESPONSE' in t_upper):
+            relevant_outcomes.append(out)
+    return relevant_outcomes
+
+
+PRUNE_PROJECTION = compile_projection({
+    # 1. Identification (Context)
+    'id_info': {
+        'nctId': Field('protocolSection.identificationModule.nctId', default=None),
+        'briefTitle': Field('protocolSection.identificationModule.briefTitle', default=None),
+        'officialTitle': Field('protocolSection.identificationModule.officialTitle', default=None),
+    },
+    # 2. Arms (Drug Names)
+    'arms': Field('protocolSection.armsInterventionsModule.armGroups', default=None),
+    'interventions': Field('protocolSection.armsInterventionsModule.interventions', default=None),
+    # 3. Eligibility (Biomarkers lie here)
+    'eligibility': {
+        'criteria': Field('protocolSection.eligibilityModule.eligibilityCriteria', default=None),
+        'gender': Field('protocolSection.eligibilityModule.sex', default=None),
+        'minAge': Field('protocolSection.eligibilityModule.minimumAge', default=None),
+    },
+    # 4. Results (Outcomes)
+    'outcomes': Field('resultsSection.outcomeMeasuresModule.outcomeMeasures', _relevant_outcomes, []),
+}, 'prune_projection')
+
+
+def prune_trial_json(trial_data: dict) -> dict:
+    """
+    Strips ~70% of the JSON (admin data, safety tables, detailed flows) 
+    to reduce AI token costs and noise.
+    """
+    return PRUNE_PROJECTION(trial_data)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local heuristic token count for a prompt: one token per punctuation mark and
+    per 1-3 digits, and one per ~4 letters of each word. Counting every JSON
+    punctuation mark separately errs high, which is the safe side for packing.
+    """
+    tokens = 0
+    for piece in TOKEN_PIECE.findall(text):
+        tokens += (len(piece) + CHARS_PER_WORD_TOKEN - 1) // CHARS_PER_WORD_TOKEN if piece[0].isalpha() else 1
+    return tokens
+
+
+# ============================================================================
+# Pruning v2 (token-minimizing)
+# ============================================================================
+
+# Eligibility lines worth sending: what the prompt extracts (biomarkers) and what
+# places the trial in the decision tree (stage, line of therapy)
+CRITERIA_SIGNALS = KeywordMatcher({
+    'BIOMARKER': [
+        'egfr', 'alk', 'kras', 'ros1', 'braf', 'her2', 'erbb2', 'ntrk', 'nrg1',
+        # "met"/"ret" are also English words; lowercase forms only count with gene context
+        # (the bare symbols are matched case-sensitively by GENE_SYMBOLS)
+        'c-met', 'met exon', 'met amplification', 'met amplified', 'met-amplified', 'met overexpression',
+        'ret fusion', 'ret rearrangement', 'ret-rearranged', 'ret rearranged',
+        'pd-l1', 'pdl1', 'tps', 'tmb', 'msi', 'stk11', 'keap1', 'biomarker',
+        'mutation', 'mutations', 'mutant', 'mutated', 'rearrangement', 'rearranged', 'fusion',
+        'amplification', 'exon', 'wild-type', 'wild type', 'expression',
+    ],
+    'STAGE': [
+        'stage', 'tnm', 'ajcc', 'metastatic', 'metastases', 'metastasis', 'advanced',
+        'locally advanced', 'resectable', 'unresectable', 'recurrent', 'oligometastatic',
+    ],
+    'LINE': [
+        'first-line', 'first line', 'second-line', 'second line', 'third-line', 'line of therapy',
+        'prior therapy', 'prior therapies', 'prior treatment', 'prior systemic', 'prior line', 'prior lines',
+        'previously treated', 'previously untreated', 'treatment-naive', 'treatment naive',
+        'naive', 'progressed', 'progression', 'refractory', 'relapsed', 'platinum', 'chemotherapy',
+        'immunotherapy', 'checkpoint', 'tki', 'tkis', 'adjuvant', 'neoadjuvant', 'maintenance',
+    ],
+})
+GENE_SYMBOLS = re.compile(r"(?<![A-Za-z0-9])(?:MET|RET)(?![A-Za-z0-9])")
+CRITERIA_HEADER = re.compile(r"^(?:key )?(?:inclusion|exclusion)(?: criteria)?\b.*:$", re.IGNORECASE)
+BULLET = re.compile(r"^(?:[*\-•]|\d+[.)])\s*")
+
+# Per outcome without statistical analyses, keep at most this many measured values
+MAX_OUTCOME_VALUES = 12
+
+
+def signal_criteria(criteria: str) -> str:
+    """Inclusion/exclusion headers plus the criteria lines that carry a signal keyword."""
+    kept = []
+    for line in criteria.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if CRITERIA_HEADER.match(line):
+            # Drop a header left with no lines under it
+            if kept and CRITERIA_HEADER.match(kept[-1]):
+                kept.pop()
+            kept.append(line)
+        elif CRITERIA_SIGNALS.matches(line) or GENE_SYMBOLS.search(line):
+            kept.append(BULLET.sub("", line))
+    if kept and CRITERIA_HEADER.match(kept[-1]):
+        kept.pop()
+    return "\n".join(kept)
+
+
+def _ci(record: Dict[str, Any], lower: str, upper: str) -> Optional[str]:
+    low, high = record.get(lower), record.get(upper)
+    if low in (None, "NA") and high in (None, "NA"):
+        return None
+    return f"{low or 'NA'} to {high or 'NA'}"
+
+
+def compact_outcome(outcome: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    One outcome measure reduced to its statistical analyses (param, value, CI,
+    p-value, method), or to its measured values when it reports no analyses.
+    """
+    group_titles = {g.get('id'): g.get('title') for g in outcome.get('groups', [])}
+    compact = {
+        'type': outcome.get('type'),
+        'title': outcome.get('title'),
+        'unit': outcome.get('unitOfMeasure'),
+        'param': outcome.get('paramType'),
+    }
+    analyses = []
+    for analysis in outcome.get('analyses', []):
+        analyses.append({
+            'groups': [group_titles.get(g, g) for g in analysis.get('groupIds', [])],
+            'param': analysis.get('paramType'),
+            'value': analysis.get('paramValue'),
+            'ci': _ci(analysis, 'ciLowerLimit', 'ciUpperLimit'),
+            'p': analysis.get('pValue'),
+            'method': analysis.get('statisticalMethod'),
+        })
+    if analyses:
+        compact['analyses'] = analyses
+        return compact
+
+    values = []
+    for cls in outcome.get('classes', []):
+        for category in cls.get('categories', []):
+            label = " / ".join(t for t in (cls.get('title'), category.get('title')) if t)
+            for m in category.get('measurements', []):
+                values.append({
+                    'group': group_titles.get(m.get('groupId'), m.get('groupId')),
+                    'label': label or None,
+                    'value': m.get('value'),
+                    'ci': _ci(m, 'lowerLimit', 'upperLimit'),
+                })
+    compact['values'] = values[:MAX_OUTCOME_VALUES]
+    return compact
+
+
+def _drop_empty(value: Any) -> Any:
+    """Recursively drop None, '' and empty containers."""
+    if isinstance(value, dict):
+        value = {k: _drop_empty(v) for k, v in value.items()}
+        return {k: v for k, v in value.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        value = [_drop_empty(v) for v in value]
+        return [v for v in value if v not in (None, "", [], {})]
+    return value
+
+
+PRUNE_V2_PROJECTION = compile_projection({
+    'id_info': {
+        'nctId': Field('protocolSection.identificationModule.nctId', default=None),
+        'officialTitle': Field('protocolSection.identificationModule.officialTitle', default=None),
+    },
+    'arms': Field('protocolSection.armsInterventionsModule.armGroups',
+                  lambda arms: [{'label': a.get('label'), 'type': a.get('type'),
+                                 'interventions': a.get('interventionNames')} for a in arms], None),
+    'interventions': Field('protocolSection.armsInterventionsModule.interventions',
+                           lambda items: [{'type': i.get('type'), 'name': i.get('name'),
+                                           'otherNames': i.get('otherNames')} for i in items], None),
+    'criteria': Field('protocolSection.eligibilityModule.eligibilityCriteria', signal_criteria, None),
+    'outcomes': Field('resultsSection.outcomeMeasuresModule.outcomeMeasures',
+                      lambda outcomes: [compact_outcome(o) for o in _relevant_outcomes(outcomes)], []),
+}, 'prune_v2_projection')
+
+
+def prune_trial_json_v2(trial_data: dict) -> dict:
+    """
+    Token-minimizing pruning: signal-bearing criteria lines only, outcomes
+    collapsed to their analyses, no empty fields.
+    """
+    pruned = _drop_empty(PRUNE_V2_PROJECTION(trial_data))
+    pruned.setdefault('id_info', {})
+    return pruned
+
+
+# mode -> (prune function, serializer)
+PRUNE_MODES: Dict[str, Tuple[Callable[[dict], dict], Callable[[dict], str]]] = {
+    'v1': (prune_trial_json, lambda pruned: json.dumps(pruned, indent=2)),
+    'v2': (prune_trial_json_v2, lambda pruned: json.dumps(pruned, ensure_ascii=False, separators=(',', ':'))),
+}
+
+
+# mode -> JSON paths its projection reads (load_trial_file streams only these)
+PRUNE_PATHS: Dict[str, List[str]] = {
+    'v1': PRUNE_PROJECTION.paths,
+    'v2': PRUNE_V2_PROJECTION.paths,
+}
+
+
+def pruned_payload(trial_data: dict, mode: str = 'v1') -> Tuple[dict, str]:
+    """Prune a trial with the given mode. Returns (pruned dict, serialized payload text)."""
+    prune, serialize = PRUNE_MODES[mode]
+    pruned = prune(trial_data)
+    return pruned, serialize(pruned)
+
+
+# ============================================================================
+# Savings Report
+# ============================================================================
+
+def savings_report(trials) -> Dict[str, Dict[str, int]]:
+    """Total payload bytes and estimated tokens per mode, plus the largest single payload."""
+    report = {mode: {'trials': 0, 'bytes': 0, 'tokens': 0, 'max_tokens': 0} for mode in PRUNE_MODES}
+    for _, trial_data in trials:
+        for mode in PRUNE_MODES:
+            _, text = pruned_payload(trial_data, mode)
+            tokens = estimate_tokens(text)
+            totals = report[mode]
+            totals['trials'] += 1
+            totals['bytes'] += len(text.encode('utf-8'))
+            totals['tokens'] += tokens
+            totals['max_tokens'] = max(totals['max_tokens'], tokens)
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "report":
+        print("Usage: python trial_prune.py report [data_dir]")
+        sys.exit(1)
+
+    from trial_store import DEFAULT_DATA_DIR, iter_trials
+
+    data_dir = Path(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_DATA_DIR
+    print(f"Pruning every trial in {data_dir} with each mode...")
+    report = savings_report(iter_trials(data_dir))
+    base = report['v1']
+    print(f"\n{'mode':<6}{'trials':>8}{'bytes':>14}{'est. tokens':>14}{'per trial':>11}{'max':>9}{'vs v1':>8}")
+    for mode, totals in report.items():
+        per_trial = totals['tokens'] // max(totals['trials'], 1)
+        change = totals['tokens'] / base['tokens'] - 1 if base['tokens'] else 0
+        print(f"{mode:<6}{totals['trials']:>8}{totals['bytes']:>14,}{totals['tokens']:>14,}"
+              f"{per_trial:>11,}{totals['max_tokens']:>9,}{change:>8.0%}")
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Offline Trial Search Index
+
+BM25 inverted index over the local ClinicalTrials.gov corpus (title,
+conditions, keywords, interventions, eligibility text) so node lookups
+don't depend on the rate-limited remote API.
+
+On-disk format: gzipped JSON, loadable from both Python and server.js:
+{
+  "version": 1,
+  "k1": 1.2, "b": 0.75,
+  "docs": [{"id": "NCT...", "phases": ["PHASE3"], "status": "COMPLETED"}],
+  "doc_len": [..], "avgdl": ..,
+  "postings": {"term": [doc_gap, tf, doc_gap, tf, ...]}   # doc ids delta-encoded
+}
+
+Usage:
+    python trial_search.py build [data_dir] [index_path]
+    python trial_search.py query "<text>" [--phase PHASE3] [--status RECRUITING]
+"""
+
+import gzip
+import json
+import math
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from trial_store import DEFAULT_DATA_DIR, iter_trials
+
+
+DEFAULT_INDEX_PATH = Path(__file__).parent / "data" / "trial_search_index.json.gz"
+
+INDEX_VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Title and condition terms count extra towards a trial's term frequency
+FIELD_WEIGHTS = {
+    "title": 3,
+    "conditions": 2,
+    "keywords": 2,
+    "interventions": 2,
+    "eligibility": 1,
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = {
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'of', 'to', 'for',
+    'with', 'by', 'from', 'at', 'on', 'if', 'is', 'as', 'per', 'be',
+    'are', 'was', 'were', 'who', 'have', 'has', 'not', 'no', 'must',
+    'any', 'all', 'other', 'than', 'that', 'this', 'these', 'will',
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, split on non-alphanumerics and drop stopwords."""
+    if not text:
+        return []
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def trial_fields(trial_data: Dict[str, Any]) -> Dict[str, str]:
+    """Pull the searchable text fields out of a trial."""
+    proto = trial_data.get('protocolSection', {})
+    ident = proto.get('identificationModule', {})
+    conditions = proto.get('conditionsModule', {})
+    arms = proto.get('armsInterventionsModule', {})
+    elig = proto.get('eligibilityModule', {})
+
+    interventions = []
+    for interv in arms.get('interventions', []) or []:
+        interventions.append(interv.get('name', ''))
+        interventions.extend(interv.get('otherNames', []) or [])
+
+    return {
+        "title": " ".join(filter(None, [ident.get('briefTitle'), ident.get('officialTitle')])),
+        "conditions": " ".join(conditions.get('conditions', []) or []),
+        "keywords": " ".join(conditions.get('keywords', []) or []),
+        "interventions": " ".join(interventions),
+        "eligibility": elig.get('eligibilityCriteria', '') or '',
+    }
+
+
+def trial_facets(trial_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Phase and status facets for a trial."""
+    proto = trial_data.get('protocolSection', {})
+    return {
+        "phases": proto.get('designModule', {}).get('phases', []) or [],
+        "status": proto.get('statusModule', {}).get('overallStatus', ''),
+    }
+
+
+# ============================================================================
+# Index Builder
+# ============================================================================
+
+def build_index(trials: Iterable[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+    """Build the serialisable index structure from (trial_id, trial_data) pairs."""
+    docs = []
+    doc_len = []
+    postings: Dict[str, List[int]] = {}
+    last_doc: Dict[str, int] = {}
+
+    for doc_idx, (trial_id, trial_data) in enumerate(trials):
+        docs.append({"id": trial_id, **trial_facets(trial_data)})
+
+        tf = Counter()
+        for field, text in trial_fields(trial_data).items():
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(text):
+                tf[token] += weight
+        doc_len.append(sum(tf.values()))
+
+        for term, freq in tf.items():
+            plist = postings.setdefault(term, [])
+            plist.append(doc_idx - last_doc.get(term, 0))
+            plist.append(freq)
+            last_doc[term] = doc_idx
+
+    return {
+        "version": INDEX_VERSION,
+        "k1": BM25_K1,
+        "b": BM25_B,
+        "docs": docs,
+        "doc_len": doc_len,
+        "avgdl": (sum(doc_len) / len(doc_len)) if doc_len else 0.0,
+        "postings": postings,
+    }
+
+
+def save_index(index: Dict[str, Any], index_path: Path = DEFAULT_INDEX_PATH):
+    """Write the index as gzipped compact JSON."""
+    index_path = Path(index_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(index_path, "wt", encoding="utf-8") as f:
+        json.dump(index, f, separators=(",", ":"))
+
+
+# ============================================================================
+# Query API
+# ============================================================================
+
+class TrialSearchIndex:
+    """Loaded BM25 index with ranked, faceted queries."""
+
+    def __init__(self, index: Dict[str, Any]):
+        if index.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported search index version: {index.get('version')}")
+        self.docs = index["docs"]
+        self.doc_len = index["doc_len"]
+        self.avgdl = index["avgdl"] or 1.0
+        self.k1 = index["k1"]
+        self.b = index["b"]
+        self._postings = index["postings"]
+        self._decoded: Dict[str, List[Tuple[int, int]]] = {}
+
+    @classmethod
+    def load(cls, index_path: Path = DEFAULT_INDEX_PATH) -> "TrialSearchIndex":
+        with gzip.open(index_path, "rt", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _term_postings(self, term: str) -> List[Tuple[int, int]]:
+        """Decode a delta-encoded postings list into [(doc_idx, tf), ...]."""
+        if term not in self._decoded:
+            flat = self._postings.get(term, [])
+            decoded = []
+            doc_idx = 0
+            for i in range(0, len(flat), 2):
+                doc_idx += flat[i]
+                decoded.append((doc_idx, flat[i + 1]))
+            self._decoded[term] = decoded
+        return self._decoded[term]
+
+    def search(self, query: str, limit: int = 20, phases: Optional[List[str]] = None,
+               statuses: Optional[List[str]] = None, match: str = "all") -> Dict[str, Any]:
+        """
+        Rank trials for a free-text query.
+
+        match="all" requires every query term (like the CT.gov query.term
+        search); match="any" ranks trials containing at least one term.
+        phases/statuses filter the results; facets are computed over all
+        matching trials before those filters, so callers get the full
+        phase/status breakdown from one query.
+
+        Returns {"total", "results": [{"nct_id", "score", "phases", "status"}],
+        "facets": {"phase": {...}, "status": {...}}}.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        n_docs = len(self.docs)
+        scores: Dict[int, float] = {}
+        hits: Counter = Counter()
+
+        for term in terms:
+            plist = self._term_postings(term)
+            if not plist:
+                continue
+            df = len(plist)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_idx, tf in plist:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_idx] / self.avgdl)
+                scores[doc_idx] = scores.get(doc_idx, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                hits[doc_idx] += 1
+
+        if match == "all":
+            matched = [d for d in scores if hits[d] == len(terms)]
+        else:
+            matched = list(scores)
+
+        phase_facets: Counter = Counter()
+        status_facets: Counter = Counter()
+        for doc_idx in matched:
+            doc = self.docs[doc_idx]
+            for phase in doc["phases"] or ["NA"]:
+                phase_facets[phase] += 1
+            status_facets[doc["status"]] += 1
+
+        if phases:
+            phase_set = set(phases)
+            matched = [d for d in matched if phase_set.intersection(self.docs[d]["phases"])]
+        if statuses:
+            status_set = set(statuses)
+            matched = [d for d in matched if self.docs[d]["status"] in status_set]
+
+        matched.sort(key=lambda d: (-scores[d], self.docs[d]["id"]))
+        results = [
+            {
+                "nct_id": self.docs[d]["id"],
+                "score": round(scores[d], 4),
+                "phases": self.docs[d]["phases"],
+                "status": self.docs[d]["status"],
+            }
+            for d in matched[:limit]
+        ]
+
+        return {
+            "total": len(matched),
+            "results": results,
+            "facets": {"phase": dict(phase_facets), "status": dict(status_facets)},
+        }
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def _flag_values(argv: List[str], flag: str) -> List[str]:
+    return [argv[i + 1] for i, arg in enumerate(argv[:-1]) if arg == flag]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python trial_search.py <command> [options]")
+        print("\nCommands:")
+        print("  build [data_dir] [index_path]   Build the BM25 index from the local corpus")
+        print("  query <text> [options]          Query the index")
+        print("\nOptions for query:")
+        print("  --phase PHASE                   Filter by phase (repeatable)")
+        print("  --status STATUS                 Filter by overall status (repeatable)")
+        print("  --any                           Match any term instead of all terms")
+        sys.exit(1)
+
+    command = sys.argv[1]
+
+    if command == "build":
+        data_dir = Path(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_DATA_DIR
+        index_path = Path(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_INDEX_PATH
+        print(f"Indexing trials from {data_dir}...")
+        index = build_index(iter_trials(data_dir))
+        save_index(index, index_path)
+        print(f"✓ Indexed {len(index['docs'])} trials, {len(index['postings'])} terms")
+        print(f"✓ Index written to {index_path} ({index_path.stat().st_size / 1e6:.1f} MB)")
+
+    elif command == "query":
+        if len(sys.argv) < 3:
+            print("Usage: python trial_search.py query <text> [options]")
+            sys.exit(1)
+        search_index = TrialSearchIndex.load()
+        response = search_index.search(
+            sys.argv[2],
+            phases=_flag_values(sys.argv, "--phase") or None,
+            statuses=_flag_values(sys.argv, "--status") or None,
+            match="any" if "--any" in sys.argv else "all",
+        )
+        print(f"Total: {response['total']}")
+        print(f"Phases: {response['facets']['phase']}")
+        print(f"Statuses: {response['facets']['status']}")
+        for result in response["results"]:
+            print(f"  {result['nct_id']}  {result['score']:7.3f}  {'/'.join(result['phases']) or 'NA':15s}  {result['status']}")
+
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
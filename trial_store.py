@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+"""
+Columnar Trial Store
+
+Builds a compact columnar store from the ClinicalTrials.gov study JSON in
+data/ctg-studies so the analysis scripts don't have to json.load the whole
+corpus on every run.
+
+Layout:
+- One column per JSON path the scripts actually read (STORE_COLUMNS)
+- Each cell is an index into a shared string table of JSON-encoded values,
+  so repeated values (statuses, phases, sponsors) are stored once
+- Large result modules we never touch (adverse events, baseline
+  characteristics, participant flow) are not stored at all
+
+The raw corpus may also be kept zstd-compressed (NCT*.json.zst plus a
+dictionary trained on the corpus, trials.zdict); load_trial_file reads
+either form, so every reader decompresses transparently. Given a list of
+paths, load_trial_file streams the file through trial_stream and only
+materializes those paths, so peak memory stays flat however large a
+trial's resultsSection is; the store builder and the raw-file fallbacks
+load just STORE_COLUMNS this way.
+
+Usage:
+    python trial_store.py build [data_dir] [store_path]
+    python trial_store.py info [store_path]
+    python trial_store.py compress [data_dir] [--level N]
+    python trial_store.py decompress [data_dir]
+"""
+
+import io
+import json
+import os
+import struct
+import sys
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from trial_stream import load_paths
+
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+DEFAULT_DATA_DIR = Path(__file__).parent / "data" / "ctg-studies"
+DEFAULT_STORE_PATH = Path(__file__).parent / "data" / "ctg-studies.trialstore"
+
+STORE_MAGIC = b"TRIALST1"
+STORE_VERSION = 1
+
+# JSON paths projected into the store. These cover every field read by
+# scripts/generate_trials_csv.py, scripts/analyze_outcomes.py and
+# create_ct_table.prune_trial_json.
+STORE_COLUMNS = [
+    "protocolSection.identificationModule.nctId",
+    "protocolSection.identificationModule.briefTitle",
+    "protocolSection.identificationModule.officialTitle",
+    "protocolSection.identificationModule.organization",
+    "protocolSection.statusModule.overallStatus",
+    "protocolSection.statusModule.startDateStruct",
+    "protocolSection.statusModule.primaryCompletionDateStruct",
+    "protocolSection.statusModule.completionDateStruct",
+    "protocolSection.statusModule.lastUpdatePostDateStruct",
+    "protocolSection.sponsorCollaboratorsModule.leadSponsor",
+    "protocolSection.conditionsModule.conditions",
+    "protocolSection.conditionsModule.keywords",
+    "protocolSection.designModule.studyType",
+    "protocolSection.designModule.phases",
+    "protocolSection.designModule.enrollment",
+    "protocolSection.designModule.masking",
+    "protocolSection.designModule.allocation",
+    "protocolSection.armsInterventionsModule.armGroups",
+    "protocolSection.armsInterventionsModule.interventions",
+    "protocolSection.eligibilityModule.eligibilityCriteria",
+    "protocolSection.eligibilityModule.gender",
+    "protocolSection.eligibilityModule.sex",
+    "protocolSection.eligibilityModule.minimumAge",
+    "protocolSection.eligibilityModule.acceptsHealthyVolunteers",
+    "protocolSection.outcomesModule.primaryOutcomes",
+    "protocolSection.outcomesModule.secondaryOutcomes",
+    "resultsSection.outcomeMeasuresModule.outcomeMeasures",
+    "hasResults",
+]
+
+# String table index 0 is reserved for "path not present in this trial"
+MISSING = 0
+
+# Compressed corpus: NCT*.json.zst files sharing one trained dictionary
+JSON_SUFFIX = ".json"
+ZSTD_SUFFIX = ".json.zst"
+ZSTD_DICT_NAME = "trials.zdict"
+ZSTD_DICT_SIZE = 112640       # zstd's default dictionary size (110 KB)
+ZSTD_LEVEL = 19
+
+
+# ============================================================================
+# Raw JSON Loading
+# ============================================================================
+
+def is_trial_file(name: str) -> bool:
+    """True for plain (.json) or compressed (.json.zst) trial files."""
+    return not name.startswith(".") and (name.endswith(JSON_SUFFIX) or name.endswith(ZSTD_SUFFIX))
+
+
+def trial_file_id(path: Path) -> str:
+    """NCT ID for a trial file, whether plain or compressed."""
+    return Path(path).name.split(".", 1)[0]
+
+
+def list_trial_files(data_dir: Path) -> List[Path]:
+    """
+    List trial files (plain or compressed) in NCT order.
+    If a trial has both forms, the plain .json wins (it is the newer download).
+    """
+    data_dir = Path(data_dir)
+    files: Dict[str, Path] = {}
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            if is_trial_file(entry.name):
+                trial_id = trial_file_id(entry.name)
+                if trial_id not in files or entry.name.endswith(JSON_SUFFIX):
+                    files[trial_id] = data_dir / entry.name
+    return [files[trial_id] for trial_id in sorted(files)]
+
+
+def trial_file_path(data_dir: Path, trial_id: str) -> Path:
+    """Path of a trial's file: plain JSON if present, else the compressed file."""
+    path = Path(data_dir) / f"{trial_id}{JSON_SUFFIX}"
+    if not path.exists():
+        compressed = Path(data_dir) / f"{trial_id}{ZSTD_SUFFIX}"
+        if compressed.exists():
+            return compressed
+    return path
+
+
+@lru_cache(maxsize=None)
+def _zstd_decompressor(data_dir: str) -> "zstandard.ZstdDecompressor":
+    if zstandard is None:
+        raise RuntimeError("Reading .json.zst trial files requires the zstandard package")
+    dict_path = Path(data_dir) / ZSTD_DICT_NAME
+    if dict_path.exists():
+        return zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(dict_path.read_bytes()))
+    return zstandard.ZstdDecompressor()
+
+
+def read_trial_bytes(path: Path) -> bytes:
+    """Raw study JSON bytes, decompressing .json.zst files with the corpus dictionary."""
+    path = Path(path)
+    data = path.read_bytes()
+    if path.name.endswith(ZSTD_SUFFIX):
+        return _zstd_decompressor(str(path.parent.resolve())).decompress(data)
+    return data
+
+
+def open_trial_text(path: Path) -> TextIO:
+    """Open a study JSON file (plain or zstd-compressed) as a streaming text reader."""
+    path = Path(path)
+    if path.name.endswith(ZSTD_SUFFIX):
+        decompressor = _zstd_decompressor(str(path.parent.resolve()))
+        return io.TextIOWrapper(decompressor.stream_reader(open(path, "rb"), closefd=True), encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def load_trial_file(path: Path, paths: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Load a single raw study JSON file (plain or zstd-compressed).
+    With paths, stream it and keep only those dotted paths (see trial_stream).
+    """
+    if paths is None:
+        return json.loads(read_trial_bytes(path))
+    with open_trial_text(path) as f:
+        return load_paths(f, paths)
+
+
+def get_path(data: Dict[str, Any], dotted_path: str) -> Tuple[bool, Any]:
+    """Look up a dotted path. Returns (found, value)."""
+    node = data
+    for key in dotted_path.split("."):
+        if not isinstance(node, dict) or key not in node:
+            return False, None
+        node = node[key]
+    return True, node
+
+
+def set_path(data: Dict[str, Any], dotted_path: str, value: Any):
+    """Set a dotted path, creating intermediate dicts."""
+    keys = dotted_path.split(".")
+    node = data
+    for key in keys[:-1]:
+        node = node.setdefault(key, {})
+    node[keys[-1]] = value
+
+
+# ============================================================================
+# Store Builder
+# ============================================================================
+
+def build_store(data_dir: Path = DEFAULT_DATA_DIR, store_path: Path = DEFAULT_STORE_PATH) -> Dict[str, Any]:
+    """
+    Build the columnar store from all trial JSON files in data_dir.
+
+    Returns a summary dict with row, string and byte counts.
+    """
+    json_files = list_trial_files(data_dir)
+
+    strings: List[bytes] = [b""]
+    string_ids: Dict[bytes, int] = {}
+
+    def intern(value: Any) -> int:
+        encoded = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        idx = string_ids.get(encoded)
+        if idx is None:
+            idx = len(strings)
+            strings.append(encoded)
+            string_ids[encoded] = idx
+        return idx
+
+    trial_ids: List[str] = []
+    columns = {name: array("I") for name in STORE_COLUMNS}
+    errors = []
+
+    for json_file in json_files:
+        try:
+            trial_data = load_trial_file(json_file, STORE_COLUMNS)
+        except Exception as e:
+            errors.append((json_file.name, str(e)))
+            continue
+
+        trial_ids.append(trial_file_id(json_file))
+        for name in STORE_COLUMNS:
+            found, value = get_path(trial_data, name)
+            columns[name].append(intern(value) if found else MISSING)
+
+    trial_id_column = array("I", (intern(tid) for tid in trial_ids))
+
+    offsets = array("Q", [0])
+    for s in strings:
+        offsets.append(offsets[-1] + len(s))
+
+    header = {
+        "version": STORE_VERSION,
+        "byteorder": sys.byteorder,
+        "columns": STORE_COLUMNS,
+        "rows": len(trial_ids),
+        "strings": len(strings),
+        "source_files": len(json_files),
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    store_path = Path(store_path)
+    store_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = store_path.with_suffix(store_path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(STORE_MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        offsets.tofile(f)
+        trial_id_column.tofile(f)
+        for name in STORE_COLUMNS:
+            columns[name].tofile(f)
+        for s in strings:
+            f.write(s)
+    os.replace(tmp_path, store_path)
+
+    return {
+        "rows": len(trial_ids),
+        "strings": len(strings),
+        "bytes": store_path.stat().st_size,
+        "errors": errors,
+    }
+
+
+# ============================================================================
+# Store Reader
+# ============================================================================
+
+class TrialStore:
+    """Read-only view over a columnar trial store file."""
+
+    def __init__(self, store_path: Path = DEFAULT_STORE_PATH):
+        self.path = Path(store_path)
+        with open(self.path, "rb") as f:
+            buf = f.read()
+
+        if buf[:8] != STORE_MAGIC:
+            raise ValueError(f"Not a trial store: {self.path}")
+        (header_len,) = struct.unpack_from("<I", buf, 8)
+        pos = 12
+        self.header = json.loads(buf[pos:pos + header_len])
+        pos += header_len
+
+        if self.header.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported trial store version: {self.header.get('version')}")
+
+        swap = self.header["byteorder"] != sys.byteorder
+        n_rows = self.header["rows"]
+        n_strings = self.header["strings"]
+
+        def read_array(typecode: str, count: int) -> array:
+            nonlocal pos
+            arr = array(typecode)
+            nbytes = arr.itemsize * count
+            arr.frombytes(buf[pos:pos + nbytes])
+            if swap:
+                arr.byteswap()
+            pos += nbytes
+            return arr
+
+        self._offsets = read_array("Q", n_strings + 1)
+        trial_id_column = read_array("I", n_rows)
+        self._columns = {name: read_array("I", n_rows) for name in self.header["columns"]}
+        self._blob = memoryview(buf)[pos:]
+        self._decoded: Dict[int, Any] = {}
+
+        self.trial_ids = [self._value(idx) for idx in trial_id_column]
+        self._rows = {tid: row for row, tid in enumerate(self.trial_ids)}
+
+    def __len__(self) -> int:
+        return len(self.trial_ids)
+
+    def __contains__(self, trial_id: str) -> bool:
+        return trial_id in self._rows
+
+    def _value(self, idx: int) -> Any:
+        """Decode one string table entry (cached, since values repeat)."""
+        if idx in self._decoded:
+            return self._decoded[idx]
+        start, end = self._offsets[idx], self._offsets[idx + 1]
+        value = json.loads(bytes(self._blob[start:end]).decode("utf-8"))
+        # Only cache scalars; containers are returned fresh so callers can mutate them
+        if not isinstance(value, (dict, list)):
+            self._decoded[idx] = value
+        return value
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.header["columns"])
+
+    def column(self, name: str) -> List[Any]:
+        """Return one column as a list of values (None where the path is absent)."""
+        return [None if idx == MISSING else self._value(idx) for idx in self._columns[name]]
+
+    def _row(self, row: int) -> Dict[str, Any]:
+        trial_data: Dict[str, Any] = {}
+        for name, col in self._columns.items():
+            idx = col[row]
+            if idx != MISSING:
+                set_path(trial_data, name, self._value(idx))
+        return trial_data
+
+    def get(self, trial_id: str) -> Optional[Dict[str, Any]]:
+        """Return the projected trial dict (same nesting as the raw JSON) or None."""
+        row = self._rows.get(trial_id)
+        if row is None:
+            return None
+        return self._row(row)
+
+    def iter_trials(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (trial_id, projected trial dict) in NCT order."""
+        for row, trial_id in enumerate(self.trial_ids):
+            yield trial_id, self._row(row)
+
+
+def read_store_header(store_path: Path) -> Optional[Dict[str, Any]]:
+    """Read just the store header, or None if the file is not a trial store."""
+    with open(store_path, "rb") as f:
+        if f.read(8) != STORE_MAGIC:
+            return None
+        (header_len,) = struct.unpack("<I", f.read(4))
+        return json.loads(f.read(header_len))
+
+
+def store_is_fresh(data_dir: Path = DEFAULT_DATA_DIR, store_path: Path = DEFAULT_STORE_PATH) -> bool:
+    """True if the store exists and is newer than every JSON file in data_dir."""
+    store_path = Path(store_path)
+    if not store_path.exists():
+        return False
+
+    store_mtime = store_path.stat().st_mtime
+    trial_ids = set()  # A trial with both .json and .json.zst counts once, as in list_trial_files
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            if not is_trial_file(entry.name):
+                continue
+            trial_ids.add(trial_file_id(entry.name))
+            if entry.stat().st_mtime > store_mtime:
+                return False
+
+    header = read_store_header(store_path)
+    if header is None or header.get("version") != STORE_VERSION:
+        return False
+    return header.get("source_files") == len(trial_ids)
+
+
+def open_store(data_dir: Path = DEFAULT_DATA_DIR, store_path: Optional[Path] = None) -> Optional[TrialStore]:
+    """Open the store for data_dir if one exists and is up to date, else None."""
+    if store_path is None:
+        store_path = Path(data_dir).parent / f"{Path(data_dir).name}.trialstore"
+    if not store_is_fresh(data_dir, store_path):
+        return None
+    return TrialStore(store_path)
+
+
+def list_trial_ids(data_dir: Path = DEFAULT_DATA_DIR, store: Optional[TrialStore] = None) -> List[str]:
+    """List trial IDs in NCT order, from the store if given, else the JSON filenames."""
+    if store is not None:
+        return list(store.trial_ids)
+    return [trial_file_id(json_file) for json_file in list_trial_files(data_dir)]
+
+
+def load_trial(trial_id: str, data_dir: Path = DEFAULT_DATA_DIR, store: Optional[TrialStore] = None) -> Dict[str, Any]:
+    """
+    Load one trial's STORE_COLUMNS by ID, from the store if it has it, else
+    streamed from the raw JSON.
+    """
+    if store is not None:
+        trial_data = store.get(trial_id)
+        if trial_data is not None:
+            return trial_data
+    return load_trial_file(trial_file_path(data_dir, trial_id), STORE_COLUMNS)
+
+
+def iter_trials(data_dir: Path = DEFAULT_DATA_DIR, store_path: Optional[Path] = None,
+                errors: Optional[List[Tuple[str, str]]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Yield (trial_id, trial_data) for every trial in data_dir.
+
+    Reads from the columnar store when it is up to date, otherwise falls back
+    to streaming STORE_COLUMNS out of the raw JSON files, so both paths yield
+    the same projection. Unreadable files are reported and skipped (and
+    appended to errors as (trial_id, error) when a list is given).
+    """
+    store = open_store(data_dir, store_path)
+    if store is not None:
+        yield from store.iter_trials()
+        return
+
+    for json_file in list_trial_files(data_dir):
+        try:
+            trial_data = load_trial_file(json_file, STORE_COLUMNS)
+        except Exception as e:
+            print(f"Error loading {json_file.name}: {e}")
+            if errors is not None:
+                errors.append((trial_file_id(json_file), str(e)))
+            continue
+        yield trial_file_id(json_file), trial_data
+
+
+# ============================================================================
+# Compressed Corpus
+# ============================================================================
+
+def compress_corpus(data_dir: Path = DEFAULT_DATA_DIR, level: int = ZSTD_LEVEL,
+                    dict_size: int = ZSTD_DICT_SIZE) -> Dict[str, Any]:
+    """
+    Train a zstd dictionary on the corpus and replace every plain .json file
+    with a .json.zst compressed against it. Files that are already
+    compressed are decompressed first so the new dictionary covers them too.
+    Returns raw and compressed byte totals.
+    """
+    if zstandard is None:
+        raise RuntimeError("Compressing the corpus requires the zstandard package")
+    data_dir = Path(data_dir)
+    files = list_trial_files(data_dir)
+    samples = [read_trial_bytes(path) for path in files]
+
+    dictionary = zstandard.train_dictionary(dict_size, samples)
+    dict_path = data_dir / ZSTD_DICT_NAME
+    dict_tmp = dict_path.with_suffix(".tmp")
+    dict_tmp.write_bytes(dictionary.as_bytes())
+
+    compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+    raw_bytes = compressed_bytes = 0
+    written = []
+    for path, raw in zip(files, samples):
+        out_path = data_dir / f"{trial_file_id(path)}{ZSTD_SUFFIX}"
+        tmp_path = data_dir / f".{out_path.name}.tmp"
+        blob = compressor.compress(raw)
+        tmp_path.write_bytes(blob)
+        written.append((path, tmp_path, out_path))
+        raw_bytes += len(raw)
+        compressed_bytes += len(blob)
+
+    # Swap everything in only once all files compressed against the new dictionary
+    os.replace(dict_tmp, dict_path)
+    for path, tmp_path, out_path in written:
+        os.replace(tmp_path, out_path)
+        if path != out_path:
+            path.unlink()
+    _zstd_decompressor.cache_clear()
+
+    return {
+        "files": len(files),
+        "raw_bytes": raw_bytes,
+        "compressed_bytes": compressed_bytes,
+        "dict_bytes": dict_path.stat().st_size,
+    }
+
+
+def decompress_corpus(data_dir: Path = DEFAULT_DATA_DIR) -> int:
+    """Restore every .json.zst file to plain .json. Returns the number restored."""
+    data_dir = Path(data_dir)
+    restored = 0
+    for path in list_trial_files(data_dir):
+        if not path.name.endswith(ZSTD_SUFFIX):
+            continue
+        out_path = data_dir / f"{trial_file_id(path)}{JSON_SUFFIX}"
+        tmp_path = data_dir / f".{out_path.name}.tmp"
+        tmp_path.write_bytes(read_trial_bytes(path))
+        os.replace(tmp_path, out_path)
+        path.unlink()
+        restored += 1
+    (data_dir / ZSTD_DICT_NAME).unlink(missing_ok=True)
+    _zstd_decompressor.cache_clear()
+    return restored
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python trial_store.py <command> [options]")
+        print("\nCommands:")
+        print("  build [data_dir] [store_path]  Build the columnar store from study JSON")
+        print("  info [store_path]              Show store summary")
+        print("  compress [data_dir] [--level N] zstd-compress the corpus with a trained dictionary")
+        print("  decompress [data_dir]          Restore the corpus to plain JSON")
+        sys.exit(1)
+
+    command = sys.argv[1]
+
+    if command == "build":
+        data_dir = Path(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_DATA_DIR
+        store_path = Path(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_STORE_PATH
+        print(f"Building trial store from {data_dir}...")
+        summary = build_store(data_dir, store_path)
+        for name, error in summary["errors"]:
+            print(f"  ✗ {name}: {error}")
+        print(f"✓ {summary['rows']} trials, {summary['strings']} unique values")
+        print(f"✓ Store written to {store_path} ({summary['bytes'] / 1e6:.1f} MB)")
+
+    elif command == "info":
+        store_path = Path(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_STORE_PATH
+        store = TrialStore(store_path)
+        print(f"Store: {store_path}")
+        print(f"Trials: {len(store)}")
+        print(f"Unique values: {store.header['strings']}")
+        print(f"Columns: {len(store.columns)}")
+        for name in store.columns:
+            print(f"  - {name}")
+
+    elif command in ("compress", "decompress"):
+        args = [a for a in sys.argv[2:] if not a.startswith("--") and not a.isdigit()]
+        data_dir = Path(args[0]) if args else DEFAULT_DATA_DIR
+        if command == "compress":
+            level = int(sys.argv[sys.argv.index("--level") + 1]) if "--level" in sys.argv else ZSTD_LEVEL
+            print(f"Compressing trials in {data_dir} (level {level})...")
+            summary = compress_corpus(data_dir, level=level)
+            ratio = summary["raw_bytes"] / max(summary["compressed_bytes"] + summary["dict_bytes"], 1)
+            print(f"✓ {summary['files']} trials: {summary['raw_bytes'] / 1e6:.1f} MB -> "
+                  f"{summary['compressed_bytes'] / 1e6:.1f} MB + {summary['dict_bytes'] / 1e3:.0f} KB dictionary "
+                  f"({ratio:.1f}x)")
+        else:
+            print(f"Decompressing trials in {data_dir}...")
+            print(f"✓ Restored {decompress_corpus(data_dir)} trials to plain JSON")
+
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Streaming Trial JSON Projection
+
+Event-driven parse of one study JSON that only materializes the requested
+dotted paths and skips everything else (e.g. the resultsSection adverse
+event and baseline tables) while streaming, so peak memory is bounded by
+the chunk size plus the requested subtrees, not by the size of the trial.
+
+The scanner reads the text in fixed-size chunks. Any value that lies wholly
+inside the buffered chunk is handed to the C json decoder (and dropped
+straight away when it is not wanted); only containers that straddle a chunk
+boundary are walked member by member, so the Python-level work is a few
+steps per chunk rather than per token.
+
+    load_paths(text_stream, ["protocolSection.statusModule", "hasResults"])
+    -> {"protocolSection": {"statusModule": {...}}, "hasResults": true}
+
+Paths behave like trial_store.get_path: a path through a non-object value
+is simply absent from the result.
+"""
+
+import json
+import re
+from typing import Any, Dict, Iterable, TextIO
+
+CHUNK_SIZE = 1 << 16
+
+_WS = re.compile(r"[ \t\n\r]*")
+# Body of a string after the opening quote, up to and including the closing quote
+_STRING_TAIL = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_SCALAR = re.compile(r"[^,\]}\s]*")
+_DECODER = json.JSONDecoder()
+
+
+def path_tree(paths: Iterable[str]) -> Dict[str, Any]:
+    """
+    Fold dotted paths into a nested dict; True marks "take the whole value".
+    A '*' segment (trial_projection list mapping) takes the whole list.
+    """
+    tree: Dict[str, Any] = {}
+    for path in paths:
+        segments = path.split(".")
+        if "*" in segments:
+            segments = segments[:segments.index("*")]
+        node = tree
+        for key in segments[:-1]:
+            child = node.get(key)
+            if child is True:
+                break
+            node = node.setdefault(key, {})
+        else:
+            node[segments[-1]] = True
+    return tree
+
+
+class _Scanner:
+    """Chunked cursor over a text stream."""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.capture_start = None  # Buffer offset kept across fills while capturing a value
+
+    def fill(self) -> bool:
+        """Append the next chunk, dropping consumed text. Returns False at EOF."""
+        if self.eof:
+            return False
+        chunk = self.stream.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        cut = self.pos if self.capture_start is None else self.capture_start
+        if cut:
+            self.buf = self.buf[cut:]
+            self.pos -= cut
+            if self.capture_start is not None:
+                self.capture_start = 0
+        self.buf += chunk
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character without consuming it."""
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON")
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r}, got {self.buf[self.pos]!r}")
+        self.pos += 1
+
+    def _match_end(self, pattern: "re.Pattern") -> int:
+        """End of pattern's match at pos, reading on while it runs into the buffer end."""
+        while True:
+            end = pattern.match(self.buf, self.pos).end()
+            if end < len(self.buf) or not self.fill():
+                return end
+
+    def skip_string(self):
+        """Skip a string; pos is just past the opening quote."""
+        while True:
+            match = _STRING_TAIL.match(self.buf, self.pos)
+            if match:
+                self.pos = match.end()
+                return
+            if not self.fill():
+                raise ValueError("Unterminated JSON string")
+
+    def skip_value(self):
+        char = self.peek()
+        if char in "[{":
+            self.decode_or_walk(char, keep=False)
+            return
+        self.pos += 1
+        if char == '"':
+            self.skip_string()
+        else:
+            self.pos = self._match_end(_SCALAR)
+
+    def decode_or_walk(self, opener: str, keep: bool) -> Any:
+        """
+        Consume the container at pos. If it is complete in the buffer, decode
+        it in one C call; otherwise step through its members so the buffer
+        can move on. Returns the decoded value when keep is set.
+        """
+        try:
+            value, self.pos = _DECODER.raw_decode(self.buf, self.pos)
+            return value
+        except json.JSONDecodeError:
+            if self.eof:
+                raise
+        if keep:
+            # Straddles a chunk boundary: keep its text and decode once complete
+            self.capture_start = self.pos
+        self.pos += 1
+        closer = "}" if opener == "{" else "]"
+        if self.peek() == closer:
+            self.pos += 1
+        else:
+            while True:
+                if opener == "{":
+                    self.expect('"')
+                    self.skip_string()
+                    self.expect(":")
+                self.skip_value()
+                char = self.peek()
+                self.pos += 1
+                if char == closer:
+                    break
+                if char != ",":
+                    raise ValueError(f"Expected ',' or {closer!r}, got {char!r}")
+        if keep:
+            text = self.buf[self.capture_start:self.pos]
+            self.capture_start = None
+            return json.loads(text)
+        return None
+
+    def read_value(self) -> Any:
+        """Materialize the value at pos (also used for object keys)."""
+        char = self.peek()
+        if char in "[{":
+            return self.decode_or_walk(char, keep=True)
+        self.capture_start = self.pos
+        self.skip_value()
+        text = self.buf[self.capture_start:self.pos]
+        self.capture_start = None
+        return json.loads(text)
+
+
+def _walk_object(scanner: _Scanner, tree: Dict[str, Any]) -> Dict[str, Any]:
+    """Consume one object (pos at '{'), keeping only the keys in tree."""
+    result: Dict[str, Any] = {}
+    scanner.expect("{")
+    if scanner.peek() == "}":
+        scanner.pos += 1
+        return result
+    while True:
+        if scanner.peek() != '"':
+            raise ValueError(f"Expected object key, got {scanner.buf[scanner.pos]!r}")
+        key = scanner.read_value()
+        scanner.expect(":")
+        wanted = tree.get(key)
+        if wanted is True:
+            result[key] = scanner.read_value()
+        elif wanted and scanner.peek() == "{":
+            result[key] = _walk_object(scanner, wanted)
+        else:
+            scanner.skip_value()
+        char = scanner.peek()
+        scanner.pos += 1
+        if char == "}":
+            return result
+        if char != ",":
+            raise ValueError(f"Expected ',' or '}}' at offset {scanner.pos - 1}, got {char!r}")
+
+
+def load_paths(stream: TextIO, paths: Iterable[str]) -> Dict[str, Any]:
+    """Parse a JSON object from stream, materializing only the given dotted paths."""
+    scanner = _Scanner(stream)
+    return _walk_object(scanner, path_tree(paths))
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Files API Upload Cache
+
+SQLite record of images uploaded to the Gemini Files API
+(gemini_dag_extractor.py), keyed by the SHA-256 of the file contents rather
+than its path, so a cached upload carries over between checkouts and
+machines. Uploads expire on the server after about 48 hours; expired rows
+are never returned and are evicted whenever the cache is opened.
+
+A second table remembers each image's (size, mtime) and content hash, so a
+lookup only re-hashes an image that has changed on disk. Paths there are
+stored relative to the cache's directory when possible.
+
+Every thread gets its own connection and the database runs in WAL mode with
+a busy timeout, so extract-all workers (and separate processes) can read
+and write the cache at the same time.
+
+Schema:
+    uploads(content_hash PRIMARY KEY, file_uri, mime_type, uploaded_at, expires_at)
+    file_hashes(path PRIMARY KEY, size, mtime_ns, content_hash)
+
+Usage:
+    python upload_cache.py info [db_path]
+    python upload_cache.py evict [db_path]
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from trial_manifest import get_file_hash
+
+
+DEFAULT_DB_PATH = Path(__file__).parent / "dag_upload_cache.db"
+# Path-keyed JSON cache used before this one; unexpired entries are imported once
+LEGACY_JSON_PATH = Path(__file__).parent / "dag_extraction_cache.json"
+
+# Files API uploads are deleted after 48 hours; entries are treated as expired
+# this long before that, so a URI never lapses in the middle of a request
+FILE_URI_TTL = timedelta(hours=48)
+FILE_URI_EXPIRY_MARGIN = timedelta(hours=1)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    content_hash TEXT PRIMARY KEY,
+    file_uri TEXT NOT NULL,
+    mime_type TEXT,
+    uploaded_at TEXT NOT NULL,
+    expires_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT NOT NULL
+);
+"""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class UploadCache:
+    """Content-addressed Files API URIs with expiry; safe to share between threads."""
+
+    def __init__(self, db_path: Path = DEFAULT_DB_PATH):
+        self.path = Path(db_path)
+        self._local = threading.local()
+        is_new = not self.path.exists()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        if is_new and LEGACY_JSON_PATH.exists():
+            self.import_legacy_json(LEGACY_JSON_PATH)
+        self.evicted = self.evict_expired()
+
+    def _conn(self) -> sqlite3.Connection:
+        """This thread's connection (sqlite3 connections are not shared across threads)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _path_key(self, file_path: Path) -> str:
+        """Path relative to the cache directory when it lies under it, else absolute."""
+        file_path = Path(file_path).resolve()
+        try:
+            return file_path.relative_to(self.path.parent.resolve()).as_posix()
+        except ValueError:
+            return file_path.as_posix()
+
+    def content_hash(self, file_path: Path) -> str:
+        """SHA-256 of the file, reusing the stored hash while size and mtime are unchanged."""
+        stat = os.stat(file_path)
+        key = self._path_key(file_path)
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT size, mtime_ns, content_hash FROM file_hashes WHERE path = ?", (key,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        digest = get_file_hash(file_path)
+        conn.execute(
+            "INSERT INTO file_hashes (path, size, mtime_ns, content_hash) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+            "content_hash = excluded.content_hash",
+            (key, stat.st_size, stat.st_mtime_ns, digest),
+        )
+        return digest
+
+    def get(self, file_path: Path) -> Optional[str]:
+        """Cached URI for the file's current contents, unless it has (nearly) expired."""
+        digest = self.content_hash(file_path)
+        cutoff = (_now() + FILE_URI_EXPIRY_MARGIN).isoformat()
+        row = self._conn().execute(
+            "SELECT file_uri FROM uploads WHERE content_hash = ? AND expires_at > ?", (digest, cutoff)).fetchone()
+        return row[0] if row else None
+
+    def put(self, file_path: Path, file_uri: str, mime_type: Optional[str] = None,
+            expires_at: Optional[datetime] = None):
+        """Record an upload of the file's current contents (the newest upload wins)."""
+        uploaded_at = _now()
+        self._put(self.content_hash(file_path), file_uri, mime_type, uploaded_at,
+                  expires_at or uploaded_at + FILE_URI_TTL)
+
+    def _put(self, digest: str, file_uri: str, mime_type: Optional[str], uploaded_at: datetime,
+             expires_at: datetime):
+        self._conn().execute(
+            "INSERT INTO uploads (content_hash, file_uri, mime_type, uploaded_at, expires_at) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT(content_hash) DO UPDATE SET file_uri = excluded.file_uri, "
+            "mime_type = excluded.mime_type, uploaded_at = excluded.uploaded_at, expires_at = excluded.expires_at",
+            (digest, file_uri, mime_type, uploaded_at.isoformat(), expires_at.astimezone(timezone.utc).isoformat()),
+        )
+
+    def forget(self, file_path: Path):
+        """Drop the upload for the file's current contents (e.g. the API rejected its URI)."""
+        self._conn().execute("DELETE FROM uploads WHERE content_hash = ?", (self.content_hash(file_path),))
+
+    def evict_expired(self) -> int:
+        """Delete uploads past their expiry. Returns the number removed."""
+        return self._conn().execute("DELETE FROM uploads WHERE expires_at <= ?", (_now().isoformat(),)).rowcount
+
+    def uploads(self) -> Dict[str, Dict[str, Any]]:
+        """All upload rows by content hash."""
+        rows = self._conn().execute(
+            "SELECT content_hash, file_uri, mime_type, uploaded_at, expires_at FROM uploads ORDER BY uploaded_at")
+        return {
+            digest: {"file_uri": uri, "mime_type": mime_type, "uploaded_at": uploaded_at, "expires_at": expires_at}
+            for digest, uri, mime_type, uploaded_at, expires_at in rows
+        }
+
+    def import_legacy_json(self, json_path: Path) -> int:
+        """Import entries from the old path-keyed dag_extraction_cache.json. Returns entries read."""
+        with open(json_path, "r") as f:
+            files = json.load(f).get("files", {})
+        for entry in files.values():
+            uploaded_at = datetime.fromisoformat(entry["uploaded_at"])
+            if uploaded_at.tzinfo is None:
+                uploaded_at = uploaded_at.astimezone()  # Naive local time
+            expires_at = datetime.fromisoformat(entry["expires_at"]) if entry.get("expires_at") else None
+            self._put(entry["file_hash"], entry["file_uri"], None, uploaded_at,
+                      expires_at or uploaded_at + FILE_URI_TTL)
+        return len(files)
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python upload_cache.py <command> [db_path]")
+        print("\nCommands:")
+        print("  info     Live uploads and hashed images")
+        print("  evict    Delete expired uploads")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    cache = UploadCache(Path(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_DB_PATH)
+
+    if command == "info":
+        uploads = cache.uploads()
+        hashed = cache._conn().execute("SELECT COUNT(*) FROM file_hashes").fetchone()[0]
+        print(f"{cache.path}: {len(uploads)} live uploads, {hashed} hashed images")
+        for digest, entry in uploads.items():
+            print(f"  {digest[:12]}  {entry['file_uri']}  expires {entry['expires_at']}")
+
+    elif command == "evict":
+        # Opening the cache evicts
+        print(f"✓ Evicted {cache.evicted} expired uploads ({len(cache.uploads())} live)")
+
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)